@@ -0,0 +1,222 @@
+"""
+Archivo del historial de estudiantes inactivos
+==============================================
+
+Al desactivar la matrícula de un estudiante, sus filas de actividad, respuestas
+de quiz, calificaciones de tareas y notificaciones recibidas se mueven por
+bloques (INSERT ... SELECT + DELETE, un commit por bloque) a las tablas
+*_archive de models.py; al reactivarla vuelven a las tablas originales con
+sus mismos ids.
+
+El cambio de matrícula solo marca `historial_pendiente` (en el mismo commit);
+el movimiento lo hace `procesar_pendientes` en segundo plano. Cada bloque es
+atómico y la dirección sale del estado actual de la matrícula, así que una
+corrida interrumpida se retoma en la siguiente (otro cambio de matrícula o
+POST /auth/admin/procesar-archivo) y la marca solo se quita al terminar.
+
+Las consultas normales solo leen las tablas calientes. Los endpoints de
+calificaciones leen el archivo únicamente si se pide con incluir_archivo=true.
+"""
+
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import DateTime, Table, and_, delete, exists, insert, literal, select, tuple_, union_all, update
+from sqlalchemy.orm import Session
+
+import models
+from settings import settings
+
+
+@dataclass(frozen=True)
+class TablaArchivable:
+    origen: Table
+    archivo: Table
+    clave: str                      # Columna que identifica al estudiante
+    por_identificador: bool = False  # La clave es estudiante.identificador (no el username)
+    unica: Tuple[str, ...] = ()     # Clave única del origen: al restaurar gana la fila viva
+
+
+TABLAS = [
+    TablaArchivable(models.ActividadEstudiante.__table__, models.actividad_estudiante_archive, "username"),
+    TablaArchivable(models.EstudianteQuizRespuesta.__table__, models.estudiante_quiz_respuesta_archive, "estudiante_username"),
+    TablaArchivable(
+        models.TareaCalificacion.__table__, models.tarea_calificacion_archive, "estudiante_username",
+        unica=("estudiante_username", "unidad_id", "filename"),
+    ),
+    TablaArchivable(models.Notificacion.__table__, models.notificaciones_archive, "usuario_id", por_identificador=True),
+]
+
+_procesando = threading.Lock()
+
+
+def _valor(t: TablaArchivable, estudiante: models.Registro):
+    return estudiante.identificador if t.por_identificador else estudiante.username
+
+
+def _lote(lote: Optional[int]) -> int:
+    return max(1, lote or settings.BULK_CHUNK_SIZE)
+
+
+def archivar_estudiante(db: Session, estudiante: models.Registro, lote: Optional[int] = None) -> Dict[str, int]:
+    """
+    Mueve el historial del estudiante a las tablas *_archive
+
+    Args:
+        db: Sesión de base de datos (commit por bloque)
+        estudiante: Registro del estudiante
+        lote: Filas por bloque (default BULK_CHUNK_SIZE)
+
+    Returns:
+        Dict tabla -> filas archivadas
+    """
+    lote = _lote(lote)
+    movidas = {}
+    for t in TABLAS:
+        columnas = [c.name for c in t.origen.columns]
+        valor = _valor(t, estudiante)
+        total = 0
+        while True:
+            ids = db.execute(
+                select(t.origen.c.id).where(t.origen.c[t.clave] == valor).order_by(t.origen.c.id).limit(lote)
+            ).scalars().all()
+            if not ids:
+                break
+            if t.unica:
+                # Una versión archivada anterior de la misma fila queda reemplazada por esta
+                db.execute(delete(t.archivo).where(
+                    t.archivo.c[t.clave] == valor,
+                    tuple_(*[t.archivo.c[c] for c in t.unica]).in_(
+                        select(*[t.origen.c[c] for c in t.unica]).where(t.origen.c.id.in_(ids))
+                    ),
+                ))
+            db.execute(insert(t.archivo).from_select(
+                columnas + ["archivado_at"],
+                select(*[t.origen.c[c] for c in columnas], literal(datetime.utcnow(), DateTime))
+                .where(t.origen.c.id.in_(ids)),
+            ))
+            db.execute(delete(t.origen).where(t.origen.c.id.in_(ids)))
+            db.commit()
+            total += len(ids)
+        movidas[t.origen.name] = total
+    return movidas
+
+
+def restaurar_estudiante(db: Session, estudiante: models.Registro, lote: Optional[int] = None) -> Dict[str, int]:
+    """
+    Devuelve el historial archivado del estudiante a las tablas originales
+    conservando sus ids. Si mientras estuvo inactivo se creó una fila con la misma
+    clave única, se conserva la viva y se descarta la archivada.
+
+    Returns:
+        Dict tabla -> filas restauradas
+    """
+    lote = _lote(lote)
+    restauradas = {}
+    for t in TABLAS:
+        columnas = [c.name for c in t.origen.columns]
+        valor = _valor(t, estudiante)
+        total = 0
+        while True:
+            ids = db.execute(
+                select(t.archivo.c.archive_id).where(t.archivo.c[t.clave] == valor)
+                .order_by(t.archivo.c.archive_id).limit(lote)
+            ).scalars().all()
+            if not ids:
+                break
+            filas = select(*[t.archivo.c[c] for c in columnas]).where(t.archivo.c.archive_id.in_(ids))
+            if t.unica:
+                filas = filas.where(~exists().where(and_(*[t.origen.c[c] == t.archivo.c[c] for c in t.unica])))
+            # Un motor que reutiliza ids (p. ej. SQLite sin AUTOINCREMENT) pudo asignar el id a otra fila
+            ocupados = db.execute(select(t.origen.c.id).where(
+                t.origen.c.id.in_(select(t.archivo.c.id).where(t.archivo.c.archive_id.in_(ids)))
+            )).scalars().all()
+            total += db.execute(insert(t.origen).from_select(
+                columnas, filas.where(t.archivo.c.id.not_in(ocupados))
+            )).rowcount or 0
+            if ocupados:
+                print(f"[WARN] {t.origen.name}: {len(ocupados)} filas restauradas con id nuevo (id ya ocupado)")
+                sin_id = [c for c in columnas if c != "id"]
+                total += db.execute(insert(t.origen).from_select(
+                    sin_id, filas.with_only_columns(*[t.archivo.c[c] for c in sin_id]).where(t.archivo.c.id.in_(ocupados))
+                )).rowcount or 0
+            db.execute(delete(t.archivo).where(t.archivo.c.archive_id.in_(ids)))
+            db.commit()
+        restauradas[t.origen.name] = total
+    return restauradas
+
+
+def mover_historial(db: Session, estudiante: models.Registro, lote: Optional[int] = None) -> Dict[str, int]:
+    """Lleva el historial del estudiante a donde corresponde según su matrícula actual"""
+    if estudiante.matricula_activa:
+        return restaurar_estudiante(db, estudiante, lote)
+    if settings.ARCHIVAR_INACTIVOS:
+        return archivar_estudiante(db, estudiante, lote)
+    return {}
+
+
+def procesar_pendientes(db: Optional[Session] = None, lote: Optional[int] = None) -> Dict[str, Dict[str, int]]:
+    """
+    Mueve el historial de los estudiantes marcados con historial_pendiente.
+    Es idempotente y retoma lo pendiente si una corrida anterior se interrumpió.
+
+    Args:
+        db: Sesión a usar (por defecto abre una propia, para BackgroundTasks)
+        lote: Filas por bloque (default BULK_CHUNK_SIZE)
+
+    Returns:
+        Dict username -> filas movidas por tabla (vacío si ya había una corrida en curso)
+    """
+    if not _procesando.acquire(blocking=False):
+        return {}  # La corrida en curso vuelve a buscar pendientes antes de terminar
+    propia = db is None
+    if propia:
+        from Clever_MySQL_conn import SessionLocal
+        db = SessionLocal()
+    movidas: Dict[str, Dict[str, int]] = {}
+    try:
+        while True:
+            pendientes = db.query(models.Registro).filter(models.Registro.historial_pendiente.is_(True)).all()
+            if not pendientes:
+                break
+            for estudiante in pendientes:
+                estado = estudiante.matricula_activa
+                movidas[estudiante.username] = mover_historial(db, estudiante, lote)
+                # Si la matrícula cambió mientras tanto la marca sigue y se procesa en la próxima vuelta
+                db.execute(update(models.Registro.__table__).where(
+                    models.Registro.identificador == estudiante.identificador,
+                    models.Registro.matricula_activa == estado,
+                ).values(historial_pendiente=False))
+                db.commit()
+                db.expire(estudiante)
+        if any(any(m.values()) for m in movidas.values()):
+            print(f"DEBUG archivo de historial: {movidas}")
+        return movidas
+    except Exception as e:
+        db.rollback()
+        print(f"[WARN] Movimiento de historial interrumpido (se retoma en la próxima corrida): {e}")
+        return movidas
+    finally:
+        if propia:
+            db.close()
+        _procesando.release()
+
+
+def select_tareas_calificacion(username: str, incluir_archivo: bool = False):
+    """
+    Select de calificaciones de tareas del estudiante (columnas de tarea_calificacion
+    más `archivada`); con incluir_archivo=True suma las filas de tarea_calificacion_archive
+    """
+    viva = models.TareaCalificacion.__table__
+    columnas = [c.name for c in viva.columns]
+    q = select(*[viva.c[c] for c in columnas], literal(False).label("archivada")).where(
+        viva.c.estudiante_username == username
+    )
+    if not incluir_archivo:
+        return q
+    arch = models.tarea_calificacion_archive
+    return union_all(q, select(*[arch.c[c] for c in columnas], literal(True).label("archivada")).where(
+        arch.c.estudiante_username == username
+    ))
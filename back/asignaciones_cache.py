@@ -0,0 +1,118 @@
+"""
+Caché de asignaciones profesor → estudiantes
+============================================
+
+Los endpoints de profesor verifican en cada request que el estudiante del
+path esté asignado al profesor. Esta caché guarda, por profesor, el mapa
+username → identificador de sus estudiantes (una consulta al cargarlo) y las
+verificaciones pasan a ser búsquedas en memoria.
+
+- Backend en memoria (por worker) o Redis compartido si REDIS_URL está configurado.
+- crud.asignar/desasignar_estudiante_profesor y el cambio de rol la invalidan.
+- ASIGNACIONES_CACHE_TTL acota lo que un worker puede quedar desactualizado
+  respecto de las invalidaciones hechas en otro (solo backend en memoria).
+"""
+
+import json
+import threading
+import time
+from typing import Dict, Optional
+
+from sqlalchemy.orm import Session
+
+import models
+import redis_conn
+from settings import settings
+
+_PREFIJO_REDIS = "bls:asignaciones:"
+
+
+class _Memoria:
+    def __init__(self):
+        self._datos: Dict[int, tuple] = {}
+        self._lock = threading.Lock()
+
+    def obtener(self, profesor_id: int) -> Optional[Dict[str, int]]:
+        with self._lock:
+            item = self._datos.get(profesor_id)
+            if item is None or time.monotonic() >= item[1]:
+                return None
+            return item[0]
+
+    def guardar(self, profesor_id: int, estudiantes: Dict[str, int]) -> None:
+        with self._lock:
+            self._datos[profesor_id] = (estudiantes, time.monotonic() + settings.ASIGNACIONES_CACHE_TTL)
+
+    def invalidar(self, profesor_id: Optional[int]) -> None:
+        with self._lock:
+            if profesor_id is None:
+                self._datos.clear()
+            else:
+                self._datos.pop(profesor_id, None)
+
+
+class _Redis:
+    def __init__(self, cliente):
+        self.cliente = cliente
+
+    def obtener(self, profesor_id: int) -> Optional[Dict[str, int]]:
+        crudo = self.cliente.get(f"{_PREFIJO_REDIS}{profesor_id}")
+        return json.loads(crudo) if crudo is not None else None
+
+    def guardar(self, profesor_id: int, estudiantes: Dict[str, int]) -> None:
+        self.cliente.set(f"{_PREFIJO_REDIS}{profesor_id}", json.dumps(estudiantes), ex=max(1, settings.ASIGNACIONES_CACHE_TTL))
+
+    def invalidar(self, profesor_id: Optional[int]) -> None:
+        if profesor_id is None:
+            claves = list(self.cliente.scan_iter(f"{_PREFIJO_REDIS}*"))
+            if claves:
+                self.cliente.delete(*claves)
+        else:
+            self.cliente.delete(f"{_PREFIJO_REDIS}{profesor_id}")
+
+
+_memoria = _Memoria()
+
+
+def _backend():
+    cliente = redis_conn.get_redis()
+    return _Redis(cliente) if cliente is not None else _memoria
+
+
+def _consultar(db: Session, profesor_id: int) -> Dict[str, int]:
+    filas = db.query(models.Registro.username, models.Registro.identificador).join(
+        models.profesor_estudiante, models.profesor_estudiante.c.estudiante_id == models.Registro.identificador
+    ).filter(
+        models.profesor_estudiante.c.profesor_id == profesor_id,
+        models.Registro.tipo_usuario == "estudiante",
+    ).all()
+    return {username: identificador for username, identificador in filas}
+
+
+def estudiantes_de(db: Session, profesor_id: int) -> Dict[str, int]:
+    """Mapa username → identificador de los estudiantes asignados al profesor"""
+    backend = _backend()
+    try:
+        estudiantes = backend.obtener(profesor_id)
+    except Exception as e:
+        # Si Redis no responde se usa la memoria local (y la BD si no está ahí)
+        print(f"[WARN] Caché de asignaciones en Redis no disponible, se usa memoria local: {e}")
+        backend = _memoria
+        estudiantes = _memoria.obtener(profesor_id)
+    if estudiantes is None:
+        estudiantes = _consultar(db, profesor_id)
+        try:
+            backend.guardar(profesor_id, estudiantes)
+        except Exception as e:
+            print(f"[WARN] No se pudieron guardar las asignaciones en Redis: {e}")
+    return estudiantes
+
+
+def invalidar(profesor_id: Optional[int] = None) -> None:
+    """Descarta las asignaciones cacheadas de un profesor (o de todos con None)"""
+    try:
+        _backend().invalidar(profesor_id)
+    except Exception as e:
+        # Si Redis no responde, también se limpia la memoria local y la TTL cubre el resto
+        print(f"[WARN] No se pudo invalidar la caché de asignaciones: {e}")
+        _memoria.invalidar(profesor_id)
@@ -2,11 +2,10 @@ from __future__ import annotations
 
 # FastAPI and related imports
 from sqlalchemy.orm import Session  # necesario para la anotación del helper superior
-def _notify_profesores_asignados(db: Session, estudiante_username: str, mensaje: str, unidad_id: int, tipo: str = "info") -> int:
-    """Crea notificaciones para todos los profesores asignados a un estudiante.
+def _notify_profesores_asignados(db: Session, est: models.Registro, mensaje: str, unidad_id: int, tipo: str = "info") -> int:
+    """Crea notificaciones para todos los profesores asignados a un estudiante (ya cargado).
     No lanza excepciones para no interferir con el flujo principal."""
     try:
-        est = db.query(models.Registro).filter(models.Registro.username == estudiante_username).first()
         if not est:
             return 0
         asign = db.query(models.profesor_estudiante.c.profesor_id).filter(
@@ -32,12 +31,15 @@ def _notify_profesores_asignados(db: Session, estudiante_username: str, mensaje:
         print(f"[WARN] _notify_profesores_asignados error: {e}")
         return 0
 
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Request, status, Body, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Request, Response, status, Body, UploadFile, File
 from fastapi.responses import RedirectResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
-from sqlalchemy import text, func, and_
+from sqlalchemy import text, func, and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta, datetime
+from functools import lru_cache
+from typing import TypedDict
 import uuid
 from pydantic import EmailStr, BaseModel
 from fastapi import Body
@@ -49,11 +51,18 @@ import mimetypes
 BASE_DIR = Path(__file__).resolve().parent.parent
 # Local imports
 import crud
+import archivo
+import borrado_logico
+import passwords
+import asignaciones_cache
+import revocaciones
 import models
 import schemas
 from schemas import ClaseCreate, ClaseResponse
 from schemas import QuizCreate, QuizResponse, QuizAsignacionCreate, QuizAsignacionResponse, QuizRespuestaCreate, QuizRespuestaResponse, QuizDetalleEstudiante
-from Clever_MySQL_conn import get_db, Base, engine
+from Clever_MySQL_conn import get_db, get_async_db, get_read_db, Base, engine, async_engine
+from pool_stats import sync_pool_stats, async_pool_stats
+from pagination import Pagina, pagina_params, paginar, aplicar_cabeceras
 from settings import settings
 
 # Optional: Import your email service if needed
@@ -61,6 +70,8 @@ from settings import settings
 
 # JWT (python-jose)
 from jose import jwt
+import jwt_cache
+from jwt_cache import CacheClaims
 
 # JWT configuration (centralizado en settings.py)
 SECRET_KEY = settings.SECRET_KEY
@@ -68,6 +79,27 @@ ALGORITHM = "HS256"
 settings.ALGORITHM
 EXPIRATION_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
 
+# Claims verificados por token (una verificación de firma por token y worker)
+jwt_claims_cache = CacheClaims(settings.JWT_CACHE_SIZE)
+
+
+def decodificar_token(token: str) -> dict:
+    """jwt.decode con caché: mismas excepciones de python-jose (token inválido o expirado)"""
+    return jwt_cache.decodificar(jwt_claims_cache, token, SECRET_KEY, [ALGORITHM])
+
+
+def crear_access_token(usuario: models.Registro) -> str:
+    """Access token de vida corta con los datos que necesitan las dependencias de
+    autorización (id y estado de matrícula), para no consultar la BD en cada request"""
+    to_encode = {
+        "sub": usuario.username,
+        "exp": datetime.utcnow() + timedelta(minutes=EXPIRATION_MINUTES),
+        "tipo_usuario": usuario.tipo_usuario,
+        "uid": usuario.identificador,
+        "matricula_activa": bool(usuario.matricula_activa),
+    }
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
 
 authRouter = APIRouter()
 
@@ -83,31 +115,102 @@ def debug_cors_origens():
 
 
 # ===== Seguridad (helpers) =====
-def require_admin(credentials: HTTPAuthorizationCredentials = Depends(security)):
+class Principal(TypedDict):
+    """Usuario autenticado según los claims del access token"""
+    username: str
+    tipo_usuario: str | None
+    identificador: int | None   # None en tokens emitidos antes de incluir uid
+    matricula_activa: bool
+
+
+def get_principal(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Principal:
+    """Dependencia base: decodifica el token una vez por request (FastAPI cachea
+    el resultado para todas las dependencias del request que la usen)"""
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        tipo_usuario: str | None = payload.get("tipo_usuario")
-        username: str | None = payload.get("sub")
-        if tipo_usuario != "admin":
-            raise HTTPException(status_code=403, detail="Acceso solo para administradores")
-        return {"username": username, "tipo_usuario": tipo_usuario}
+        payload = decodificar_token(credentials.credentials)
     except Exception:
         raise HTTPException(status_code=401, detail="Token inválido")
+    if not payload.get("sub"):
+        raise HTTPException(status_code=401, detail="Token inválido")
+    if revocaciones.revocado(payload["sub"]):
+        raise HTTPException(status_code=403, detail="Matrícula inactiva")
+    return Principal(
+        username=payload["sub"],
+        tipo_usuario=payload.get("tipo_usuario"),
+        identificador=payload.get("uid"),
+        matricula_activa=payload.get("matricula_activa", True),
+    )
 
-def require_roles(roles: list[str]):
-    def _dep(credentials: HTTPAuthorizationCredentials = Depends(security)):
-        try:
-            payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-            tipo_usuario: str | None = payload.get("tipo_usuario")
-            username: str | None = payload.get("sub")
-            if not tipo_usuario or tipo_usuario not in roles:
-                raise HTTPException(status_code=403, detail="Acceso no autorizado para este rol")
-            return {"username": username, "tipo_usuario": tipo_usuario}
-        except Exception:
-            raise HTTPException(status_code=401, detail="Token inválido")
+
+@lru_cache(maxsize=None)
+def _guardia_roles(roles: tuple[str, ...], detail: str):
+    def _dep(principal: Principal = Depends(get_principal)) -> Principal:
+        if principal["tipo_usuario"] not in roles:
+            raise HTTPException(status_code=403, detail=detail)
+        if principal["tipo_usuario"] == "estudiante" and principal["matricula_activa"] is False:
+            raise HTTPException(status_code=403, detail="Matrícula inactiva")
+        return principal
     return _dep
 
 
+def require_roles(roles: list[str], detail: str = "Acceso no autorizado para este rol"):
+    """Guardia de roles sobre get_principal; la misma combinación devuelve la misma dependencia"""
+    return _guardia_roles(tuple(roles), detail)
+
+
+require_admin = require_roles(["admin"], "Acceso solo para administradores")
+
+# ===== Usuario autenticado (una sola carga por request) =====
+def _usuario_de_request(request: Request, db: Session, username: str | None) -> models.Registro | None:
+    """Devuelve la fila Registro del usuario autenticado, cacheada en request.state
+    para que el resto del request (dependencias, helpers) no vuelva a consultarla."""
+    cacheado = getattr(request.state, "usuario", None)
+    if cacheado is not None and cacheado.username == username:
+        return cacheado
+    if not username:
+        return None
+    usuario = db.query(models.Registro).filter(models.Registro.username == username).first()
+    request.state.usuario = usuario
+    return usuario
+
+def get_current_usuario(
+    request: Request,
+    principal: Principal = Depends(get_principal),
+    db: Session = Depends(get_db),
+) -> models.Registro:
+    """Dependencia: carga el usuario (Registro) del token una sola vez por request."""
+    usuario = _usuario_de_request(request, db, principal["username"])
+    if not usuario:
+        raise HTTPException(status_code=401, detail="Usuario no encontrado")
+    return usuario
+
+@lru_cache(maxsize=None)
+def _guardia_usuario_roles(roles: tuple[str, ...]):
+    def _dep(usuario: models.Registro = Depends(get_current_usuario)) -> models.Registro:
+        if usuario.tipo_usuario not in roles:
+            raise HTTPException(status_code=403, detail="Acceso no autorizado para este rol")
+        return usuario
+    return _dep
+
+def require_usuario_roles(roles: list[str]):
+    """Como require_roles, pero devuelve el usuario (Registro) cargado por get_current_usuario;
+    la misma combinación de roles devuelve la misma dependencia."""
+    return _guardia_usuario_roles(tuple(roles))
+
+def _estudiante_asignado_a_profesor(db: Session, profesor: models.Registro | None, estudiante_username: str) -> bool:
+    """Verifica si un estudiante está asignado al profesor ya cargado (búsqueda en la caché de asignaciones)."""
+    if profesor is None or profesor.tipo_usuario != "profesor":
+        return False
+    return estudiante_username in asignaciones_cache.estudiantes_de(db, profesor.identificador)
+
+def _ensure_profesor_credentials(profesor_username: str, profesor: models.Registro):
+    """Valida que el usuario autenticado sea el profesor del path."""
+    if profesor.username != profesor_username:
+        raise HTTPException(status_code=403, detail="Token no corresponde al profesor")
+    if profesor.tipo_usuario != "profesor":
+        raise HTTPException(status_code=403, detail="Solo profesores pueden calificar tareas")
+
+
 # ===== Helpers/Endpoints de Administración =====
 
 # ==========================
@@ -120,7 +223,7 @@ def grades_resumen_estudiante(
     objetivo_min: int = 120,
     wt_tareas: float = 0.7,
     wt_tiempo: float = 0.3,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     Resumen REAL de calificaciones por estudiante, por unidad y global.
@@ -219,7 +322,7 @@ class UnidadFinalBody(BaseModel):
     aprobado: bool | None = None
 
 @authRouter.post("/grades/unidad/final")
-def upsert_unidad_final(body: UnidadFinalBody, db: Session = Depends(get_db), who=Depends(require_roles(["profesor", "empresa", "admin"]))):
+def upsert_unidad_final(body: UnidadFinalBody, db: Session = Depends(get_db), who: models.Registro = Depends(require_usuario_roles(["profesor", "empresa", "admin"]))):
     """Crea/actualiza una calificación final (override) para una unidad.
     - score: 0..100 opcional
     - aprobado: True/False opcional
@@ -268,7 +371,7 @@ def upsert_unidad_final(body: UnidadFinalBody, db: Session = Depends(get_db), wh
     # Notificar al estudiante sobre el cambio de nota final de la unidad
     try:
         est = db.query(models.Registro).filter(models.Registro.username == body.estudiante_username).first()
-        remitente = db.query(models.Registro).filter(models.Registro.username == who["username"]).first()
+        remitente = who  # Cargado una sola vez por la dependencia
         if est:
             score_txt = "sin nota" if row.score is None else f"{int(row.score)}/100"
             estado_txt = "Aprobado" if bool(row.aprobado) else "Pendiente"
@@ -284,55 +387,43 @@ def upsert_unidad_final(body: UnidadFinalBody, db: Session = Depends(get_db), wh
     except Exception as e:
         print(f"[WARN] Notificación unidad_final_actualizada fallida: {e}")
     return {"id": row.id, "estudiante_username": row.estudiante_username, "unidad_id": row.unidad_id, "score": row.score, "aprobado": row.aprobado}
-def require_admin(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        tipo_usuario: str | None = payload.get("tipo_usuario")
-        username: str | None = payload.get("sub")
-        if tipo_usuario != "admin":
-            raise HTTPException(status_code=403, detail="Acceso solo para administradores")
-        return {"username": username, "tipo_usuario": tipo_usuario}
-    except Exception:
-        raise HTTPException(status_code=401, detail="Token inválido")
-
 @authRouter.get("/admin/ping")
 def admin_ping(admin=Depends(require_admin)):
     return {"ok": True, "message": "pong", "admin": admin}
 
+@authRouter.get("/admin/pool-stats")
+def admin_pool_stats(admin=Depends(require_admin)):
+    """Estado del pool de conexiones (sync y async) para dimensionarlo con datos.
+    Incluye conexiones en uso, overflow, espera media de checkout y timeouts.
+    """
+    return {
+        "sync": sync_pool_stats.snapshot(engine.pool),
+        "async": async_pool_stats.snapshot(async_engine.sync_engine.pool),
+    }
+
 @authRouter.post("/admin/sync-models")
 def admin_sync_models(admin=Depends(require_admin)):
-    """Crea cualquier tabla faltante según los modelos ORM.
-    Útil para entornos sin migraciones. No borra ni altera tablas existentes.
+    """Aplica las migraciones pendientes (tablas faltantes e índices).
+    No borra tablas existentes.
     """
     try:
-        Base.metadata.create_all(bind=engine)
-        return {"ok": True, "message": "Tablas sincronizadas"}
+        from migrate import aplicar_migraciones
+        nuevas = aplicar_migraciones()
+        return {"ok": True, "message": "Tablas sincronizadas", "migraciones": nuevas}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error sincronizando modelos: {e}")
 
-def require_roles(roles: list[str]):
-    def _dep(credentials: HTTPAuthorizationCredentials = Depends(security)):
-        try:
-            payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-            tipo_usuario: str | None = payload.get("tipo_usuario")
-            username: str | None = payload.get("sub")
-            if not tipo_usuario or tipo_usuario not in roles:
-                raise HTTPException(status_code=403, detail="Acceso no autorizado para este rol")
-            return {"username": username, "tipo_usuario": tipo_usuario}
-        except Exception:
-            raise HTTPException(status_code=401, detail="Token inválido")
-    return _dep
-
 
 # ===== Gestión de usuarios (solo admin)
 @authRouter.get("/admin/usuarios")
-def listar_usuarios(q: str | None = None, db: Session = Depends(get_db), admin=Depends(require_admin)):
-    """Lista todos los usuarios. Permite filtro básico por username o email con ?q= """
+def listar_usuarios(response: Response, q: str | None = None, pagina: Pagina = Depends(pagina_params), db: Session = Depends(get_db), admin=Depends(require_admin)):
+    """Lista los usuarios (paginados con ?limit=&cursor=). Permite filtro básico por username o email con ?q= """
     query = db.query(models.Registro)
     if q:
         like = f"%{q}%"
         query = query.filter((models.Registro.username.like(like)) | (models.Registro.email.like(like)))
-    rows = query.order_by(models.Registro.username.asc()).all()
+    rows = paginar(query, crud.ORDEN_USUARIOS, pagina)
+    aplicar_cabeceras(response, pagina)
     return [
         {
             "username": r.username,
@@ -363,6 +454,7 @@ def cambiar_rol_usuario(username: str, body: CambiarRolBody, db: Session = Depen
     db.add(user)
     db.commit()
     db.refresh(user)
+    asignaciones_cache.invalidar()  # Las asignaciones cacheadas filtran por tipo_usuario
     return {
         "username": user.username,
         "tipo_usuario": user.tipo_usuario,
@@ -409,11 +501,7 @@ def admin_verify_user(body: VerifyUserBody, db: Session = Depends(get_db)):
 
     # Verificar siempre en True (no se expone 'verify' en el body)
     user.email_verified = True
-    # Si tu modelo tiene campos de tracking, ajusta aquí; usamos setdefault con hasattr
-    if hasattr(user, "verification_token"):
-        user.verification_token = None
-    if hasattr(user, "token_expires_at"):
-        user.token_expires_at = None
+    crud.eliminar_tokens_email(db, user.username, "verificacion")
 
     db.add(user)
     db.commit()
@@ -435,10 +523,8 @@ def admin_verify_user_by_username(username: str, verify: bool = True, db: Sessio
     if not user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     user.email_verified = bool(verify)
-    if hasattr(user, "verification_token") and verify:
-        user.verification_token = None
-    if hasattr(user, "token_expires_at") and verify:
-        user.token_expires_at = None
+    if verify:
+        crud.eliminar_tokens_email(db, user.username, "verificacion")
     db.add(user)
     db.commit()
     db.refresh(user)
@@ -455,7 +541,7 @@ def admin_verify_user_by_username(username: str, verify: bool = True, db: Sessio
 # Endpoint para actualizar el perfil del estudiante
 
 @authRouter.put("/update-perfil")
-async def update_perfil(perfil: dict = Body(...), db: Session = Depends(get_db)):
+def update_perfil(perfil: dict = Body(...), db: Session = Depends(get_db)):
     updated_user = crud.update_perfil_estudiante(db, perfil)
     if not updated_user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
@@ -467,15 +553,10 @@ async def register(
     user: schemas.RegistroCreate, # No tiene default, va primero
     background_tasks: BackgroundTasks, # No tiene default, va después de user
     request: Request, # No tiene default, va después de background_tasks
-    db: Session = Depends(get_db), # Este tiene default, va al final
+    db: AsyncSession = Depends(get_async_db), # Este tiene default, va al final
     
 ):
-    # Aquí puedes añadir una verificación si el email ya existe
-    existing_user = db.query(models.Registro).filter(models.Registro.email == user.email).first()
-    if existing_user:
-        raise HTTPException(status_code=400, detail="El correo electrónico ya está registrado.")
-
-    # Llama a la función CRUD para registrar al usuario, pasando las dependencias necesarias
+    # Llama a la función CRUD para registrar al usuario (valida email y username duplicados)
     new_user = await crud.registro_user(db, user, background_tasks, request)
     return new_user
 
@@ -497,28 +578,62 @@ def login(user: schemas.LoginUsuario, db: Session = Depends(get_db)):  # Importa
         )
 
     print(f"DEBUG LOGIN: tipo_usuario={getattr(usuario, 'tipo_usuario', None)}")
-    expire = datetime.utcnow() + timedelta(minutes=EXPIRATION_MINUTES)
-    to_encode = {
-        "sub": usuario.username, 
-        "exp": expire,
-        "tipo_usuario": usuario.tipo_usuario
-    }
-    token = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    response = {
-        "access_token": token,
+    response = _emitir_tokens(db, usuario)
+    print(f"DEBUG LOGIN: usuario={usuario.username} expires_in={response['expires_in']}")
+    return response
+
+
+def _emitir_tokens(db: Session, usuario: models.Registro) -> dict:
+    """Access token nuevo + refresh token nuevo (guardado hasheado)"""
+    refresh_token = crud.crear_refresh_token(db, usuario.username)
+    db.commit()
+    return {
+        "access_token": crear_access_token(usuario),
+        "refresh_token": refresh_token,
         "token_type": "bearer",
+        "expires_in": EXPIRATION_MINUTES * 60,
         "tipo_usuario": getattr(usuario, "tipo_usuario", None),
         "usuario": schemas.UsuarioResponse.from_orm(usuario)
     }
-    print(f"DEBUG LOGIN: response={response}")
-    return response
+
+
+class RefreshTokenBody(BaseModel):
+    refresh_token: str
+
+
+@authRouter.post("/refresh")
+def refresh(body: RefreshTokenBody, db: Session = Depends(get_db)):
+    """Cambia un refresh token vigente por un access token y un refresh token nuevos.
+    Cada refresh token sirve una sola vez; reusar uno ya usado revoca todas las sesiones del usuario."""
+    fila = crud.usar_refresh_token(db, body.refresh_token)
+    if not fila:
+        db.rollback()
+        raise HTTPException(status_code=401, detail="Refresh token inválido o expirado")
+    usuario = db.query(models.Registro).filter(models.Registro.username == fila.username).first()
+    if not usuario:
+        db.rollback()
+        raise HTTPException(status_code=401, detail="Refresh token inválido o expirado")
+    if usuario.tipo_usuario == "estudiante" and not usuario.matricula_activa:
+        db.commit()  # El token usado queda revocado
+        raise HTTPException(
+            status_code=403,
+            detail="Tu matrícula se encuentra inactiva. Contacta con el administrador para activar tu acceso."
+        )
+    return _emitir_tokens(db, usuario)
+
+
+@authRouter.post("/logout")
+def logout(body: RefreshTokenBody, db: Session = Depends(get_db)):
+    """Revoca el refresh token (el access token vence solo en EXPIRATION_MINUTES)"""
+    crud.usar_refresh_token(db, body.refresh_token)
+    db.commit()
+    return {"ok": True}
 
 
 @authRouter.get("/verify-email")
-async def verify_email(token: str, db: Session = Depends(get_db)):
-    user = db.query(models.Registro).filter(
-        models.Registro.verification_token == token
-    ).first()
+def verify_email(token: str, db: Session = Depends(get_db)):
+    fila = crud.obtener_token_email(db, token, "verificacion")  # Búsqueda por clave primaria
+    user = db.query(models.Registro).filter(models.Registro.username == fila.username).first() if fila else None
 
     if not user:
         raise HTTPException(status_code=404, detail="Token de verificación inválido o expirado.")
@@ -527,13 +642,12 @@ async def verify_email(token: str, db: Session = Depends(get_db)):
         # Ya verificado, redirigir a una página de "ya verificado" en el frontend
         return RedirectResponse(url="http://localhost:3000/email-already-verified", status_code=status.HTTP_302_FOUND)
 
-    if user.token_expires_at < datetime.utcnow():
+    if fila.expires_at < datetime.utcnow():
         # Token expirado, lanzar error o redirigir a una página para reenviar el email
         raise HTTPException(status_code=400, detail="El token de verificación ha expirado. Por favor, solicita uno nuevo.")
 
     user.email_verified = True
-    user.verification_token = None # Invalida el token después de usarlo
-    user.token_expires_at = None
+    db.delete(fila)  # Invalida el token después de usarlo
     db.add(user)
     db.commit()
     db.refresh(user)
@@ -547,7 +661,7 @@ async def verify_email(token: str, db: Session = Depends(get_db)):
 async def resend_verification_email(
     email: EmailStr, # No tiene default, va primero
     background_tasks: BackgroundTasks, # No tiene default
-    #request: Request, # No tiene default
+    request: Request, # No tiene default
     db: Session = Depends(get_db) # Este tiene default, va al final
 ):
     user = db.query(models.Registro).filter(models.Registro.email == email).first()
@@ -559,24 +673,15 @@ async def resend_verification_email(
     
       
         raise HTTPException(status_code=400, detail="El correo electrónico ya ha sido verificado.")
-    
-    if user.token_expires_at and user.token_expires_at.date() < datetime.utcnow().date():
-        raise HTTPException(status_code=400, detail="El token de verificación ha expirado. Por favor, solicita uno nuevo.")
 
-
-    # Generar nuevo token y fecha de expiración
-    new_token = str(uuid.uuid4())
-    new_token_expires_at = datetime.utcnow() + timedelta(hours=24)
-
-    user.verification_token = new_token
-    user.token_expires_at = new_token_expires_at
-    db.add(user)
+    # Generar nuevo token (reemplaza al anterior) con vencimiento en 24 h
+    new_token = crud.crear_token_email(db, user.username, "verificacion", horas=24)
     db.commit()
-    db.refresh(user)
+    background_tasks.add_task(crud.purgar_tokens_vencidos)
 
     verification_url = f"{request.base_url}auth/verify-email?token={new_token}"
     # Asegúrate de que send_verification_email esté importada o definida en crud.py
-    await crud.send_verification_email(email, user.username, verification_url, background_tasks)
+    await crud.send_verification_email(email, user.username, verification_url, background_tasks, request)
 
     return {"message": "Correo de verificación reenviado."}
 
@@ -599,8 +704,7 @@ class ForgotPasswordBody(BaseModel):
 
 @authRouter.post("/forgot-password")
 async def forgot_password(body: ForgotPasswordBody, request: Request, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
-    """Genera un token de restablecimiento y envía email con enlace. Reutiliza
-    verification_token y token_expires_at para evitar migraciones."""
+    """Genera un token de restablecimiento (tabla token_email, 2 h) y envía email con enlace."""
     if not body.username and not body.email:
         raise HTTPException(status_code=400, detail="Proporciona username o email")
 
@@ -614,13 +718,9 @@ async def forgot_password(body: ForgotPasswordBody, request: Request, background
     if not user:
         return {"message": "Si el usuario existe, se enviará un correo con instrucciones."}
 
-    reset_token = str(uuid.uuid4())
-    expires_at = datetime.utcnow() + timedelta(hours=2)
-    user.verification_token = reset_token
-    user.token_expires_at = expires_at
-    db.add(user)
+    reset_token = crud.crear_token_email(db, user.username, "reset", horas=2)
     db.commit()
-    db.refresh(user)
+    background_tasks.add_task(crud.purgar_tokens_vencidos)
 
     # Construir URL de restablecimiento hacia el FRONTEND
     frontend_base = os.getenv("FRONTEND_BASE_URL", "http://localhost:4200")
@@ -646,18 +746,17 @@ class ResetPasswordBody(BaseModel):
 @authRouter.post("/reset-password")
 def reset_password(body: ResetPasswordBody, db: Session = Depends(get_db)):
     """Valida el token de restablecimiento, actualiza la contraseña y limpia el token."""
-    user = db.query(models.Registro).filter(models.Registro.verification_token == body.token).first()
+    fila = crud.obtener_token_email(db, body.token, "reset")  # Búsqueda por clave primaria
+    user = db.query(models.Registro).filter(models.Registro.username == fila.username).first() if fila else None
     if not user:
         raise HTTPException(status_code=404, detail="Token inválido")
-    if not user.token_expires_at or user.token_expires_at < datetime.utcnow():
+    if fila.expires_at < datetime.utcnow():
         raise HTTPException(status_code=400, detail="El token ha expirado. Solicita uno nuevo.")
 
     # Hashear y guardar nueva contraseña
-    from crud import bcrypt_context
-    user.hashed_password = bcrypt_context.hash(body.new_password)
+    user.hashed_password = passwords.hash_password(body.new_password)
     # invalidar token
-    user.verification_token = None
-    user.token_expires_at = None
+    db.delete(fila)
     db.add(user)
     db.commit()
     db.refresh(user)
@@ -939,8 +1038,10 @@ def listar_quizzes(unidad_id: int | None = None, db: Session = Depends(get_db),
 @authRouter.get("/quizzes/{quiz_id}/respuestas", response_model=list[QuizRespuestaResponse])
 def listar_respuestas_quiz(
     quiz_id: int,
+    response: Response,
+    pagina: Pagina = Depends(pagina_params),
     db: Session = Depends(get_db),
-    who=Depends(require_roles(["profesor", "empresa", "admin"]))
+    who: models.Registro = Depends(require_usuario_roles(["profesor", "empresa", "admin"]))
 ):
     """Lista las respuestas de un quiz para revisión.
 
@@ -951,29 +1052,16 @@ def listar_respuestas_quiz(
         models.EstudianteQuizRespuesta.quiz_id == quiz_id
     )
 
-    tipo_usuario = who.get("tipo_usuario")
-    username = who.get("username")
-
-    if tipo_usuario == "profesor":
-        profesor = db.query(models.Registro).filter(models.Registro.username == username).first()
-        if not profesor:
-            raise HTTPException(status_code=404, detail="Profesor no encontrado")
-
-        asignaciones = db.query(models.profesor_estudiante.c.estudiante_id).filter(
-            models.profesor_estudiante.c.profesor_id == profesor.identificador
-        ).all()
-        est_ids = [row[0] for row in asignaciones]
-        if not est_ids:
-            return []
-
-        estudiantes = db.query(models.Registro).filter(models.Registro.identificador.in_(est_ids)).all()
-        usernames = [e.username for e in estudiantes]
+    if who.tipo_usuario == "profesor":
+        # Estudiantes asignados desde la caché (sin consultar profesor_estudiante en cada request)
+        usernames = list(asignaciones_cache.estudiantes_de(db, who.identificador).keys())
         if not usernames:
             return []
 
         query = query.filter(models.EstudianteQuizRespuesta.estudiante_username.in_(usernames))
 
-    rows = query.order_by(models.EstudianteQuizRespuesta.created_at.desc()).all()
+    rows = paginar(query, [(models.EstudianteQuizRespuesta.created_at, True), (models.EstudianteQuizRespuesta.id, True)], pagina)
+    aplicar_cabeceras(response, pagina)
     return rows
 
 @authRouter.get("/quizzes/{quiz_id}/respuestas/{estudiante_username}", response_model=QuizRespuestaResponse)
@@ -981,19 +1069,16 @@ def obtener_respuesta_quiz_estudiante(
     quiz_id: int,
     estudiante_username: str,
     db: Session = Depends(get_db),
-    who=Depends(require_roles(["profesor", "empresa", "admin"]))
+    who: models.Registro = Depends(require_usuario_roles(["profesor", "empresa", "admin"]))
 ):
     """Devuelve el detalle de la respuesta de un estudiante para un quiz específico.
 
     - Profesores solo pueden ver respuestas de estudiantes que tengan asignados.
     - Empresa/Admin pueden ver cualquier respuesta.
     """
-    tipo_usuario = who.get("tipo_usuario")
-    username = who.get("username")
-
-    if tipo_usuario == "profesor":
+    if who.tipo_usuario == "profesor":
         # Reusar helper existente para verificar asignación profesor-estudiante
-        if not _estudiante_asignado_a_profesor(db, username, estudiante_username):
+        if not _estudiante_asignado_a_profesor(db, who, estudiante_username):
             raise HTTPException(status_code=403, detail="Estudiante no asignado a este profesor")
 
     row = db.query(models.EstudianteQuizRespuesta).filter(
@@ -1012,7 +1097,7 @@ def aprobar_calificacion_quiz(
     quiz_id: int,
     estudiante_username: str,
     db: Session = Depends(get_db),
-    who=Depends(require_roles(["profesor", "empresa", "admin"]))
+    who: models.Registro = Depends(require_usuario_roles(["profesor", "empresa", "admin"]))
 ):
     """Marca como aprobada la calificación de un estudiante para un quiz.
 
@@ -1020,12 +1105,11 @@ def aprobar_calificacion_quiz(
     - Empresa/Admin pueden aprobar cualquier calificación.
     """
     now = datetime.utcnow()
-    tipo_usuario = who.get("tipo_usuario")
-    username = who.get("username")
+    username = who.username
 
-    if tipo_usuario == "profesor":
+    if who.tipo_usuario == "profesor":
         # Verificar que el estudiante esté asignado a este profesor
-        if not _estudiante_asignado_a_profesor(db, username, estudiante_username):
+        if not _estudiante_asignado_a_profesor(db, who, estudiante_username):
             raise HTTPException(status_code=403, detail="Estudiante no asignado a este profesor")
 
     # Buscar calificación existente
@@ -1077,7 +1161,7 @@ def establecer_calificacion_manual_quiz(
     estudiante_username: str,
     body: QuizCalificacionManualBody,
     db: Session = Depends(get_db),
-    who=Depends(require_roles(["profesor", "empresa", "admin"]))
+    who: models.Registro = Depends(require_usuario_roles(["profesor", "empresa", "admin"]))
 ):
     """Permite fijar una calificación manual (override) para un quiz.
 
@@ -1085,11 +1169,10 @@ def establecer_calificacion_manual_quiz(
     - Profesores solo pueden calificar manualmente a estudiantes que tengan asignados.
     """
     now = datetime.utcnow()
-    tipo_usuario = who.get("tipo_usuario")
-    username = who.get("username")
+    username = who.username
 
-    if tipo_usuario == "profesor":
-        if not _estudiante_asignado_a_profesor(db, username, estudiante_username):
+    if who.tipo_usuario == "profesor":
+        if not _estudiante_asignado_a_profesor(db, who, estudiante_username):
             raise HTTPException(status_code=403, detail="Estudiante no asignado a este profesor")
 
     # Normalizar score entre 0 y 100
@@ -1162,7 +1245,7 @@ def establecer_calificacion_manual_quiz(
 # ============================
 
 @authRouter.get("/estudiante/quizzes-disponibles", response_model=list[QuizResponse])
-def quizzes_disponibles_estudiante(db: Session = Depends(get_db), who=Depends(require_roles(["estudiante", "admin"]))):
+async def quizzes_disponibles_estudiante(db: AsyncSession = Depends(get_async_db), who=Depends(require_roles(["estudiante", "admin"]))):
     """Lista evaluaciones disponibles para el estudiante autenticado según:
     - Existe asignación en quiz_asignacion
     - Ventana vigente (start_at <= now <= end_at) o sin límites
@@ -1170,31 +1253,24 @@ def quizzes_disponibles_estudiante(db: Session = Depends(get_db), who=Depends(re
     - El quiz está habilitado individualmente para el estudiante (según tabla estudiante_quiz_permiso)
     """
     now = datetime.utcnow()
-    user = db.query(models.Registro).filter(models.Registro.username == who["username"]).first()
-    if not user:
+    user_id = who.get("identificador") or await db.scalar(
+        select(models.Registro.identificador).where(models.Registro.username == who["username"])
+    )
+    if user_id is None:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
     # Join Quiz -> QuizAsignacion -> estudiante_unidad
-    quizzes = (
-        db.query(models.Quiz)
-        .join(models.QuizAsignacion, models.Quiz.id == models.QuizAsignacion.quiz_id)
-        .join(models.estudiante_unidad, models.estudiante_unidad.c.unidad_id == models.QuizAsignacion.unidad_id)
-        .filter(
-            models.estudiante_unidad.c.estudiante_id == user.identificador,
-            (models.QuizAsignacion.start_at.is_(None) | (models.QuizAsignacion.start_at <= now)),
-            (models.QuizAsignacion.end_at.is_(None) | (models.QuizAsignacion.end_at >= now)),
-        )
-        .order_by(models.Quiz.created_at.desc())
-        .all()
+    result = await db.execute(crud.select_quizzes_disponibles(user_id, now))
+    quizzes = result.scalars().unique().all()
+
+    # Filtrar por permisos individuales de quiz (una sola consulta; sin registro = habilitado)
+    permisos = await db.execute(
+        select(models.EstudianteQuizPermiso.quiz_id, models.EstudianteQuizPermiso.habilitado)
+        .where(models.EstudianteQuizPermiso.estudiante_username == who["username"])
     )
-    
-    # Filtrar por permisos individuales de quiz
-    quizzes_habilitados = []
-    for quiz in quizzes:
-        if crud.verificar_permiso_quiz_estudiante(db, who["username"], quiz.id):
-            quizzes_habilitados.append(quiz)
-    
-    return quizzes_habilitados
+    deshabilitados = {quiz_id for quiz_id, habilitado in permisos.all() if not habilitado}
+
+    return [quiz for quiz in quizzes if quiz.id not in deshabilitados]
 
 @authRouter.get("/estudiante/mis-calificaciones-quizzes")
 def obtener_calificaciones_quizzes_estudiante(db: Session = Depends(get_db), who=Depends(require_roles(["estudiante", "admin"]))):
@@ -1203,11 +1279,18 @@ def obtener_calificaciones_quizzes_estudiante(db: Session = Depends(get_db), who
         models.EstudianteQuizCalificacion.estudiante_username == who["username"]
     ).order_by(models.EstudianteQuizCalificacion.updated_at.desc()).all()
     
-    # Obtener información adicional de quizzes y unidades
+    # Obtener información adicional de quizzes y unidades (una consulta por tabla, no por fila)
+    quiz_ids = {cal.quiz_id for cal in calificaciones}
+    unidad_ids = {cal.unidad_id for cal in calificaciones}
+    titulos = dict(
+        db.query(models.Quiz.id, models.Quiz.titulo).filter(models.Quiz.id.in_(quiz_ids)).all()
+    ) if quiz_ids else {}
+    nombres = dict(
+        db.query(models.Unidad.id, models.Unidad.nombre).filter(models.Unidad.id.in_(unidad_ids)).all()
+    ) if unidad_ids else {}
+
     resultado = []
     for cal in calificaciones:
-        quiz = db.query(models.Quiz).filter(models.Quiz.id == cal.quiz_id).first()
-        unidad = db.query(models.Unidad).filter(models.Unidad.id == cal.unidad_id).first()
 
         aprobada = getattr(cal, "aprobada", None)
         visible_score = cal.score if aprobada else None
@@ -1218,9 +1301,9 @@ def obtener_calificaciones_quizzes_estudiante(db: Session = Depends(get_db), who
         resultado.append({
             "id": cal.id,
             "quiz_id": cal.quiz_id,
-            "quiz_titulo": quiz.titulo if quiz else "Quiz eliminado",
+            "quiz_titulo": titulos[cal.quiz_id] if cal.quiz_id in titulos else "Quiz eliminado",
             "unidad_id": cal.unidad_id,
-            "unidad_nombre": unidad.nombre if unidad else "Unidad eliminada",
+            "unidad_nombre": nombres[cal.unidad_id] if cal.unidad_id in nombres else "Unidad eliminada",
             "score": visible_score,
             "created_at": cal.created_at,
             "updated_at": cal.updated_at,
@@ -1233,10 +1316,10 @@ def obtener_calificaciones_quizzes_estudiante(db: Session = Depends(get_db), who
     return resultado
 
 @authRouter.get("/estudiante/unidades/{unidad_id}/resumen-calificaciones")
-def obtener_resumen_calificaciones_unidad(unidad_id: int, db: Session = Depends(get_db), who=Depends(require_roles(["estudiante", "admin"]))):
+def obtener_resumen_calificaciones_unidad(unidad_id: int, db: Session = Depends(get_db), who: models.Registro = Depends(require_usuario_roles(["estudiante", "admin"]))):
     """Obtiene el resumen completo de calificaciones para una unidad específica"""
     # Usar la función existente del sistema de calificaciones
-    resumen = crud.get_unidad_grade_detalle(db, username=who["username"], unidad_id=unidad_id)
+    resumen = crud.get_unidad_grade_detalle(db, username=who.username, unidad_id=unidad_id)
     
     # Agregar información adicional de la unidad
     unidad = db.query(models.Unidad).filter(models.Unidad.id == unidad_id).first()
@@ -1244,11 +1327,9 @@ def obtener_resumen_calificaciones_unidad(unidad_id: int, db: Session = Depends(
         raise HTTPException(status_code=404, detail="Unidad no encontrada")
     
     # Verificar acceso del estudiante a la unidad
-    user = db.query(models.Registro).filter(models.Registro.username == who["username"]).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    user = who  # Cargado una sola vez por la dependencia
     
-    acceso = db.query(models.estudiante_unidad).filter(
+    acceso = borrado_logico.solo_unidades_vivas(db.query(models.estudiante_unidad), models.estudiante_unidad.c.unidad_id).filter(
         models.estudiante_unidad.c.estudiante_id == user.identificador,
         models.estudiante_unidad.c.unidad_id == unidad_id,
         models.estudiante_unidad.c.habilitada == True
@@ -1267,14 +1348,12 @@ def obtener_resumen_calificaciones_unidad(unidad_id: int, db: Session = Depends(
     return resumen
 
 @authRouter.get("/estudiante/quizzes/{quiz_id}", response_model=QuizResponse)
-def obtener_quiz_estudiante(quiz_id: int, db: Session = Depends(get_db), who=Depends(require_roles(["estudiante", "admin"]))):
+def obtener_quiz_estudiante(quiz_id: int, db: Session = Depends(get_db), who: models.Registro = Depends(require_usuario_roles(["estudiante", "admin"]))):
     now = datetime.utcnow()
-    user = db.query(models.Registro).filter(models.Registro.username == who["username"]).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    user = who  # Cargado una sola vez por la dependencia
     
     # Verificar permiso individual de quiz
-    if not crud.verificar_permiso_quiz_estudiante(db, who["username"], quiz_id):
+    if not crud.verificar_permiso_quiz_estudiante(db, who.username, quiz_id):
         raise HTTPException(status_code=403, detail="No tienes permiso para acceder a esta evaluación")
     
     q = (
@@ -1294,15 +1373,13 @@ def obtener_quiz_estudiante(quiz_id: int, db: Session = Depends(get_db), who=Dep
     return q
 
 @authRouter.get("/estudiante/quizzes/{quiz_id}/detalle", response_model=QuizDetalleEstudiante)
-def obtener_quiz_detalle_estudiante(quiz_id: int, db: Session = Depends(get_db), who=Depends(require_roles(["estudiante", "admin"]))):
+def obtener_quiz_detalle_estudiante(quiz_id: int, db: Session = Depends(get_db), who: models.Registro = Depends(require_usuario_roles(["estudiante", "admin"]))):
     """Obtiene los detalles completos de un quiz para el estudiante, incluyendo si ya fue respondido"""
     now = datetime.utcnow()
-    user = db.query(models.Registro).filter(models.Registro.username == who["username"]).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    user = who  # Cargado una sola vez por la dependencia
     
     # Verificar permiso individual de quiz
-    if not crud.verificar_permiso_quiz_estudiante(db, who["username"], quiz_id):
+    if not crud.verificar_permiso_quiz_estudiante(db, who.username, quiz_id):
         raise HTTPException(status_code=403, detail="No tienes permiso para acceder a esta evaluación")
     
     # Obtener el quiz
@@ -1324,7 +1401,7 @@ def obtener_quiz_detalle_estudiante(quiz_id: int, db: Session = Depends(get_db),
     # Tomar la asignación principal para extraer max_intentos (si hubiera varias, usamos la más reciente)
     # Se filtra por las unidades a las que está asignado el estudiante y por la ventana de disponibilidad
     asig = (
-        db.query(models.QuizAsignacion)
+        borrado_logico.solo_unidades_vivas(db.query(models.QuizAsignacion), models.QuizAsignacion.unidad_id)
         .join(models.estudiante_unidad, models.estudiante_unidad.c.unidad_id == models.QuizAsignacion.unidad_id)
         .filter(
             models.QuizAsignacion.quiz_id == quiz_id,
@@ -1340,7 +1417,7 @@ def obtener_quiz_detalle_estudiante(quiz_id: int, db: Session = Depends(get_db),
 
     # Contar intentos de apertura realizados por el estudiante
     intentos_previos = db.query(models.EstudianteQuizIntento).filter(
-        models.EstudianteQuizIntento.estudiante_username == who["username"],
+        models.EstudianteQuizIntento.estudiante_username == who.username,
         models.EstudianteQuizIntento.quiz_id == quiz_id
     ).count()
 
@@ -1350,7 +1427,7 @@ def obtener_quiz_detalle_estudiante(quiz_id: int, db: Session = Depends(get_db),
     if puede_crear_nuevo_intento:
         unidad_id_intento = getattr(asig, "unidad_id", q.unidad_id)
         nuevo_intento = models.EstudianteQuizIntento(
-            estudiante_username=who["username"],
+            estudiante_username=who.username,
             quiz_id=quiz_id,
             unidad_id=unidad_id_intento,
             intento_num=intentos_previos + 1,
@@ -1364,13 +1441,13 @@ def obtener_quiz_detalle_estudiante(quiz_id: int, db: Session = Depends(get_db),
 
     # Obtener la última respuesta (si existe) para fecha_respuesta
     respuesta_existente = db.query(models.EstudianteQuizRespuesta).filter(
-        models.EstudianteQuizRespuesta.estudiante_username == who["username"],
+        models.EstudianteQuizRespuesta.estudiante_username == who.username,
         models.EstudianteQuizRespuesta.quiz_id == quiz_id
     ).order_by(models.EstudianteQuizRespuesta.created_at.desc()).first()
 
     # Obtener calificación si existe
     calificacion_obj = db.query(models.EstudianteQuizCalificacion).filter(
-        models.EstudianteQuizCalificacion.estudiante_username == who["username"],
+        models.EstudianteQuizCalificacion.estudiante_username == who.username,
         models.EstudianteQuizCalificacion.quiz_id == quiz_id
     ).first()
     
@@ -1423,11 +1500,13 @@ def obtener_quiz_detalle_estudiante(quiz_id: int, db: Session = Depends(get_db),
     return data
 
 @authRouter.post("/estudiante/quizzes/{quiz_id}/responder", response_model=QuizRespuestaResponse)
-def responder_quiz(quiz_id: int, body: QuizRespuestaCreate, db: Session = Depends(get_db), who=Depends(require_roles(["estudiante", "admin"]))):
+async def responder_quiz(quiz_id: int, body: QuizRespuestaCreate, db: AsyncSession = Depends(get_async_db), who=Depends(require_roles(["estudiante", "admin"]))):
     """Permite al estudiante enviar sus respuestas a un quiz"""
     now = datetime.utcnow()
-    user = db.query(models.Registro).filter(models.Registro.username == who["username"]).first()
-    if not user:
+    user_id = who.get("identificador") or await db.scalar(
+        select(models.Registro.identificador).where(models.Registro.username == who["username"])
+    )
+    if user_id is None:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     
     # Verificar que el quiz_id coincida
@@ -1435,39 +1514,41 @@ def responder_quiz(quiz_id: int, body: QuizRespuestaCreate, db: Session = Depend
         raise HTTPException(status_code=400, detail="El ID del quiz no coincide")
     
     # Verificar permiso individual de quiz
-    if not crud.verificar_permiso_quiz_estudiante(db, who["username"], quiz_id):
+    if not await db.run_sync(crud.verificar_permiso_quiz_estudiante, who["username"], quiz_id):
         raise HTTPException(status_code=403, detail="No tienes permiso para responder esta evaluación")
     
     # Verificar que el quiz existe y está disponible
-    q = (
-        db.query(models.Quiz)
+    q = await db.scalar(
+        select(models.Quiz)
         .join(models.QuizAsignacion, models.Quiz.id == models.QuizAsignacion.quiz_id)
         .join(models.estudiante_unidad, models.estudiante_unidad.c.unidad_id == models.QuizAsignacion.unidad_id)
-        .filter(
+        .where(
             models.Quiz.id == quiz_id,
-            models.estudiante_unidad.c.estudiante_id == user.identificador,
+            models.estudiante_unidad.c.estudiante_id == user_id,
             (models.QuizAsignacion.start_at.is_(None) | (models.QuizAsignacion.start_at <= now)),
             (models.QuizAsignacion.end_at.is_(None) | (models.QuizAsignacion.end_at >= now)),
         )
-        .first()
+        .limit(1)
     )
     if not q:
         raise HTTPException(status_code=403, detail="No tienes acceso a esta evaluación o no está disponible")
     
     # Verificar cantidad de intentos permitidos para esta asignación
-    asig = (
-        db.query(models.QuizAsignacion)
-        .filter(models.QuizAsignacion.quiz_id == quiz_id, models.QuizAsignacion.unidad_id == q.unidad_id)
+    asig = await db.scalar(
+        select(models.QuizAsignacion)
+        .where(models.QuizAsignacion.quiz_id == quiz_id, models.QuizAsignacion.unidad_id == q.unidad_id)
         .order_by(models.QuizAsignacion.created_at.desc())
-        .first()
+        .limit(1)
     )
     max_intentos = getattr(asig, "max_intentos", None) if asig else None
 
     # Contar intentos ya consumidos (aperturas)
-    intentos_usados = db.query(models.EstudianteQuizIntento).filter(
-        models.EstudianteQuizIntento.estudiante_username == who["username"],
-        models.EstudianteQuizIntento.quiz_id == quiz_id
-    ).count()
+    intentos_usados = await db.scalar(
+        select(func.count(models.EstudianteQuizIntento.id)).where(
+            models.EstudianteQuizIntento.estudiante_username == who["username"],
+            models.EstudianteQuizIntento.quiz_id == quiz_id
+        )
+    ) or 0
 
     if intentos_usados == 0:
         unidad_id_intento = getattr(asig, "unidad_id", q.unidad_id)
@@ -1498,24 +1579,26 @@ def responder_quiz(quiz_id: int, body: QuizRespuestaCreate, db: Session = Depend
         )
         db.add(nueva_respuesta)
         
-        db.commit()
-        db.refresh(nueva_respuesta)
+        await db.commit()
+        await db.refresh(nueva_respuesta)
         
         # Usar la función existente para actualizar calificaciones, guardando la mejor nota alcanzada
         try:
             # Obtener calificación previa, si existe
-            cal_prev = db.query(models.EstudianteQuizCalificacion).filter(
-                models.EstudianteQuizCalificacion.estudiante_username == who["username"],
-                models.EstudianteQuizCalificacion.unidad_id == q.unidad_id,
-                models.EstudianteQuizCalificacion.quiz_id == quiz_id
-            ).first()
+            score_prev = await db.scalar(
+                select(models.EstudianteQuizCalificacion.score).where(
+                    models.EstudianteQuizCalificacion.estudiante_username == who["username"],
+                    models.EstudianteQuizCalificacion.unidad_id == q.unidad_id,
+                    models.EstudianteQuizCalificacion.quiz_id == quiz_id
+                ).limit(1)
+            )
 
             best_score = score
-            if cal_prev and cal_prev.score is not None:
-                best_score = max(best_score, int(cal_prev.score))
+            if score_prev is not None:
+                best_score = max(best_score, int(score_prev))
 
-            crud.upsert_quiz_calificacion(
-                db,
+            await db.run_sync(
+                crud.upsert_quiz_calificacion,
                 estudiante_username=who["username"],
                 unidad_id=q.unidad_id,
                 quiz_id=quiz_id,
@@ -1524,18 +1607,16 @@ def responder_quiz(quiz_id: int, body: QuizRespuestaCreate, db: Session = Depend
         except Exception as e:
             print(f"[WARN] Error actualizando calificación de quiz con mejor nota: {e}")
         
-        # Crear notificación de evaluación completada
+        # Crear notificación de evaluación completada (el usuario ya se cargó al inicio)
         try:
-            user_record = db.query(models.Registro).filter(models.Registro.username == who["username"]).first()
-            if user_record:
-                mensaje = f"Has completado la evaluación '{q.titulo}' con una calificación de {score}/100."
-                crud.crear_notificacion(
-                    db,
-                    usuario_id=int(user_record.identificador),
-                    tipo="quiz_completado",
-                    mensaje=mensaje,
-                    unidad_id=q.unidad_id,
-                )
+            mensaje = f"Has completado la evaluación '{q.titulo}' con una calificación de {score}/100."
+            await db.run_sync(
+                crud.crear_notificacion,
+                usuario_id=int(user_id),
+                tipo="quiz_completado",
+                mensaje=mensaje,
+                unidad_id=q.unidad_id,
+            )
         except Exception as e:
             print(f"[WARN] Error creando notificación de quiz completado: {e}")
         
@@ -1551,7 +1632,7 @@ def responder_quiz(quiz_id: int, body: QuizRespuestaCreate, db: Session = Depend
         )
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error al guardar respuestas: {str(e)}")
 
 def calcular_puntaje_quiz(preguntas: dict, respuestas: dict) -> int:
@@ -1695,12 +1776,27 @@ def obtener_quiz(quiz_id: int, db: Session = Depends(get_db), who=Depends(requir
 def create_tables_endpoint(db: Session = Depends(get_db)):
     """Endpoint temporal para crear las tablas necesarias"""
     try:
-        from Clever_MySQL_conn import Base, engine
-        Base.metadata.create_all(bind=engine)
+        from migrate import aplicar_migraciones
+        aplicar_migraciones()
         return {"message": "Tablas creadas exitosamente"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al crear tablas: {str(e)}")
 
+@authRouter.post("/admin/purgar-tokens")
+def purgar_tokens_endpoint(db: Session = Depends(get_db), admin=Depends(require_admin)):
+    """Borra ya los tokens de correo y refresh tokens vencidos"""
+    return {"borradas": crud.purgar_tokens_vencidos(db)}
+
+@authRouter.post("/admin/procesar-archivo")
+def procesar_archivo_endpoint(db: Session = Depends(get_db), admin=Depends(require_admin)):
+    """Mueve ya el historial pendiente de archivar/restaurar (retoma corridas interrumpidas)"""
+    return {"movidas": archivo.procesar_pendientes(db)}
+
+@authRouter.post("/admin/purgar-eliminados")
+def purgar_eliminados_endpoint(db: Session = Depends(get_db), admin=Depends(require_admin)):
+    """Ejecuta ya la cascada diferida de unidades y quizzes eliminados (retoma corridas interrumpidas)"""
+    return {"borradas": borrado_logico.purgar_eliminados(db)}
+
 @authRouter.put("/quizzes/{quiz_id}", response_model=QuizResponse)
 def actualizar_quiz(quiz_id: int, body: QuizCreate, db: Session = Depends(get_db), who=Depends(require_roles(["profesor", "empresa", "admin"]))):
     q = db.query(models.Quiz).filter(models.Quiz.id == quiz_id).first()
@@ -1716,29 +1812,18 @@ def actualizar_quiz(quiz_id: int, body: QuizCreate, db: Session = Depends(get_db
     return q
 
 @authRouter.delete("/quizzes/{quiz_id}")
-def eliminar_quiz(quiz_id: int, db: Session = Depends(get_db), who=Depends(require_roles(["profesor", "empresa", "admin"]))):
+def eliminar_quiz(quiz_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db), who=Depends(require_roles(["profesor", "empresa", "admin"]))):
     q = db.query(models.Quiz).filter(models.Quiz.id == quiz_id).first()
     if not q:
         raise HTTPException(status_code=404, detail="Quiz no encontrado")
     
     try:
-        # Eliminar usando delete() en masa para mejor rendimiento
-        print(f"Eliminando asignaciones para quiz_id: {quiz_id}")
-        db.query(models.QuizAsignacion).filter(models.QuizAsignacion.quiz_id == quiz_id).delete()
-        
-        print(f"Eliminando calificaciones para quiz_id: {quiz_id}")
-        db.query(models.EstudianteQuizCalificacion).filter(models.EstudianteQuizCalificacion.quiz_id == quiz_id).delete()
-        
-        print(f"Eliminando permisos para quiz_id: {quiz_id}")
-        db.query(models.EstudianteQuizPermiso).filter(models.EstudianteQuizPermiso.quiz_id == quiz_id).delete()
-        
-        print(f"Eliminando quiz con id: {quiz_id}")
-        # Finalmente eliminar el quiz
-        db.delete(q)
-        
-        print("Haciendo commit...")
+        # Borrado lógico: el quiz desaparece ya de las consultas; asignaciones, calificaciones,
+        # permisos, respuestas e intentos se borran en segundo plano por bloques
+        print(f"Marcando quiz eliminado: {quiz_id}")
+        borrado_logico.marcar_eliminados(db, models.Quiz, models.Quiz.id == quiz_id)
         db.commit()
-        print("Quiz eliminado exitosamente")
+        background_tasks.add_task(borrado_logico.purgar_eliminados)
         return {"eliminado": True, "id": quiz_id}
     except Exception as e:
         print(f"Error al eliminar quiz: {str(e)}")
@@ -1822,7 +1907,7 @@ async def registrar_profesor(
     user: schemas.RegistroCreate,
     background_tasks: BackgroundTasks,
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     if user.tipo_usuario != "profesor":
         raise HTTPException(status_code=400, detail="tipo_usuario debe ser 'profesor'")
@@ -1839,8 +1924,10 @@ def obtener_profesor(username: str, db: Session = Depends(get_db)):
 # Endpoint para obtener estudiantes disponibles (solo tipo_usuario = 'estudiante')
 from typing import List
 @authRouter.get("/estudiantes-disponibles", response_model=List[schemas.EstudianteEnClase])
-def estudiantes_disponibles(db: Session = Depends(get_db)):
-    return crud.obtener_estudiantes_disponibles(db)
+def estudiantes_disponibles(response: Response, pagina: Pagina = Depends(pagina_params), db: Session = Depends(get_db)):
+    filas = crud.obtener_estudiantes_disponibles(db, pagina)
+    aplicar_cabeceras(response, pagina)
+    return filas
 
 
 # GET: Ver clases de un estudiante
@@ -1883,26 +1970,32 @@ def ver_clases_estudiante(estudiante_username: str, db: Session = Depends(get_db
 from typing import List
 
 @authRouter.get("/profesor/", response_model=List[schemas.UsuarioResponse])
-def obtener_profesores(db: Session = Depends(get_db)):
-    return crud.obtener_profesores(db)
+def obtener_profesores(response: Response, pagina: Pagina = Depends(pagina_params), db: Session = Depends(get_db)):
+    filas = crud.obtener_profesores(db, pagina)
+    aplicar_cabeceras(response, pagina)
+    return filas
 
 # Alias plural para compatibilidad con clientes que consultan /profesores/
 @authRouter.get("/profesores/", response_model=List[schemas.UsuarioResponse])
-def obtener_profesores_plural(db: Session = Depends(get_db)):
-    return crud.obtener_profesores(db)
+def obtener_profesores_plural(response: Response, pagina: Pagina = Depends(pagina_params), db: Session = Depends(get_db)):
+    return obtener_profesores(response, pagina, db)
 
 # Endpoints para gestión de matrículas
 @authRouter.get("/matriculas/", response_model=List[schemas.UsuarioResponse])
-def obtener_matriculas(db: Session = Depends(get_db), who=Depends(require_roles(["admin", "empresa"]))):
-    """Obtiene todos los estudiantes registrados en la plataforma"""
-    return crud.obtener_estudiantes(db)
+def obtener_matriculas(response: Response, pagina: Pagina = Depends(pagina_params), db: Session = Depends(get_db), who=Depends(require_roles(["admin", "empresa"]))):
+    """Obtiene los estudiantes registrados en la plataforma (paginados con ?limit=&cursor=)"""
+    filas = crud.obtener_estudiantes(db, pagina)
+    aplicar_cabeceras(response, pagina)
+    return filas
 
 @authRouter.put("/matriculas/{username}/toggle")
-def toggle_matricula(username: str, db: Session = Depends(get_db), who=Depends(require_roles(["admin", "empresa"]))):
+def toggle_matricula(username: str, background_tasks: BackgroundTasks, db: Session = Depends(get_db), who=Depends(require_roles(["admin", "empresa"]))):
     """Activa o desactiva la matrícula de un estudiante"""
     estudiante = crud.toggle_matricula_estudiante(db, username)
     if not estudiante:
         raise HTTPException(status_code=404, detail="Estudiante no encontrado")
+    # Historial al archivo al desactivar, de vuelta a las tablas al reactivar
+    background_tasks.add_task(archivo.procesar_pendientes)
     return {
         "username": estudiante.username,
         "matricula_activa": estudiante.matricula_activa,
@@ -1911,9 +2004,11 @@ def toggle_matricula(username: str, db: Session = Depends(get_db), who=Depends(r
 
 # Endpoints para gestión de unidades
 @authRouter.post("/unidades/sync")
-def sincronizar_unidades(unidades: List[dict], db: Session = Depends(get_db), admin=Depends(require_admin)):
+def sincronizar_unidades(unidades: List[dict], background_tasks: BackgroundTasks, db: Session = Depends(get_db), admin=Depends(require_admin)):
     """Sincroniza las unidades del frontend con la base de datos"""
-    return crud.sincronizar_unidades(db, unidades)
+    res = crud.sincronizar_unidades(db, unidades)
+    background_tasks.add_task(borrado_logico.purgar_eliminados)
+    return res
 
 @authRouter.get("/unidades/", response_model=List[dict])
 def obtener_unidades(db: Session = Depends(get_db), who=Depends(require_roles(["admin", "empresa", "profesor"]))):
@@ -1927,8 +2022,10 @@ def obtener_unidades(db: Session = Depends(get_db), who=Depends(require_roles(["
 
 # ============ Listados de calificaciones por estudiante ==========
 @authRouter.get("/grades/estudiantes/{username}/tareas", response_model=List[dict])
-def listar_tareas_calificaciones(username: str, db: Session = Depends(get_db), who=Depends(require_roles(["profesor", "empresa", "admin"]))):
-    rows = db.query(models.TareaCalificacion).filter(models.TareaCalificacion.estudiante_username == username).order_by(models.TareaCalificacion.updated_at.desc()).all()
+def listar_tareas_calificaciones(username: str, incluir_archivo: bool = False, db: Session = Depends(get_db), who=Depends(require_roles(["profesor", "empresa", "admin"]))):
+    # El archivo (estudiantes con matrícula desactivada) solo se lee si se pide explícitamente
+    tareas = archivo.select_tareas_calificacion(username, incluir_archivo).subquery()
+    rows = db.execute(select(tareas).order_by(tareas.c.updated_at.desc())).all()
     # nombre de unidad
     unidades = {u.id: u.nombre for u in db.query(models.Unidad.id, models.Unidad.nombre).all()}
     return [
@@ -1938,7 +2035,8 @@ def listar_tareas_calificaciones(username: str, db: Session = Depends(get_db), w
             "unidad_nombre": unidades.get(r.unidad_id),
             "filename": r.filename,
             "score": r.score,
-            "updated_at": getattr(r, 'updated_at', None)
+            "updated_at": getattr(r, 'updated_at', None),
+            "archivada": bool(r.archivada),
         }
         for r in rows
     ]
@@ -2000,11 +2098,13 @@ def actualizar_unidad(unidad_id: int, body: dict = Body(...), db: Session = Depe
     return res
 
 @authRouter.delete("/unidades/{unidad_id}")
-def eliminar_unidad(unidad_id: int, db: Session = Depends(get_db), admin=Depends(require_admin)):
-    """Elimina una unidad. Solo admin. Limpia relaciones pivot."""
+def eliminar_unidad(unidad_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db), admin=Depends(require_admin)):
+    """Elimina una unidad. Solo admin. Borrado lógico inmediato; las relaciones pivot y
+    demás dependientes se limpian en segundo plano."""
     ok = crud.eliminar_unidad(db, unidad_id)
     if not ok:
         raise HTTPException(status_code=404, detail="Unidad no encontrada")
+    background_tasks.add_task(borrado_logico.purgar_eliminados)
     return {"eliminada": True, "id": unidad_id}
 
 # ===== Subcarpetas =====
@@ -2069,9 +2169,11 @@ def toggle_subcarpeta(unidad_id: int, subcarpeta_id: int, db: Session = Depends(
 
 # ===== Notificaciones =====
 @authRouter.get("/notificaciones/usuario/{usuario_id}")
-def listar_notificaciones_usuario(usuario_id: int, db: Session = Depends(get_db), who=Depends(require_roles(["admin", "empresa", "profesor", "estudiante"]))):
-    """Lista notificaciones del usuario destinatario"""
-    return crud.listar_notificaciones_usuario(db, usuario_id)
+async def listar_notificaciones_usuario(usuario_id: int, response: Response, pagina: Pagina = Depends(pagina_params), db: AsyncSession = Depends(get_async_db), who=Depends(require_roles(["admin", "empresa", "profesor", "estudiante"]))):
+    """Lista notificaciones del usuario destinatario (más recientes primero, paginadas con ?limit=&cursor=)"""
+    filas = await db.run_sync(crud.listar_notificaciones_usuario, usuario_id, pagina)
+    aplicar_cabeceras(response, pagina)
+    return filas
 
 @authRouter.post("/notificaciones", response_model=dict)
 def crear_notificacion(body: dict = Body(...), db: Session = Depends(get_db), who=Depends(require_roles(["admin", "empresa", "profesor"]))):
@@ -2103,26 +2205,20 @@ def marcar_notificacion_leida(notificacion_id: int, db: Session = Depends(get_db
 def marcar_todas_leidas(
     usuario_id: int, 
     db: Session = Depends(get_db), 
-    who=Depends(require_roles(["admin", "empresa", "profesor", "estudiante"]))
+    who: models.Registro = Depends(require_usuario_roles(["admin", "empresa", "profesor", "estudiante"]))
 ):
     """Marcar todas las notificaciones como leídas para un usuario específico"""
     
     # Obtener información del usuario autenticado
-    username_autenticado = who.get("username")
-    tipo_usuario = who.get("tipo_usuario")
+    username_autenticado = who.username
+    tipo_usuario = who.tipo_usuario
     
     print(f"🔔 DEBUG: marcar_todas_leidas - usuario_id={usuario_id}, auth_user={username_autenticado}, tipo={tipo_usuario}")
     
     # Validar permisos: solo admins pueden modificar notificaciones de otros usuarios
     if tipo_usuario != "admin":
         # Obtener el usuario autenticado desde la BD
-        usuario_autenticado = db.query(models.Registro).filter(
-            models.Registro.username == username_autenticado
-        ).first()
-        
-        if not usuario_autenticado:
-            print(f"❌ DEBUG: Usuario autenticado no encontrado: {username_autenticado}")
-            raise HTTPException(status_code=404, detail="Usuario autenticado no encontrado")
+        usuario_autenticado = who  # Ya cargado por la dependencia
         
         # Verificar que el usuario_id coincida con el usuario autenticado
         if usuario_autenticado.identificador != usuario_id:
@@ -2142,26 +2238,12 @@ def marcar_todas_leidas(
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
 @authRouter.get("/estudiantes/me/unidades-habilitadas")
-def obtener_unidades_habilitadas_estudiante(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
+def obtener_unidades_habilitadas_estudiante(
+    db: Session = Depends(get_db),
+    principal: Principal = Depends(require_roles(["estudiante"], "Solo estudiantes pueden acceder a este endpoint")),
+):
     """Obtiene solo las unidades habilitadas para el estudiante actual"""
-    try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        tipo_usuario: str = payload.get("tipo_usuario")
-        
-        print(f"Token decodificado - Usuario: {username}, Tipo: {tipo_usuario}")
-        
-        if not username:
-            raise HTTPException(status_code=401, detail="Token inválido - no se encontró username")
-        
-        if tipo_usuario != "estudiante":
-            print(f"Acceso denegado - tipo_usuario: {tipo_usuario} (esperado: estudiante)")
-            raise HTTPException(status_code=403, detail=f"Solo estudiantes pueden acceder a este endpoint. Tipo actual: {tipo_usuario}")
-        
-        return crud.obtener_unidades_habilitadas_estudiante(db, username)
-    except jwt.JWTError as e:
-        print(f"Error JWT: {e}")
-        raise HTTPException(status_code=401, detail="Token inválido")
+    return crud.obtener_unidades_habilitadas_estudiante(db, principal["username"])
 
 @authRouter.get("/estudiantes/{username}/unidades")
 def obtener_unidades_estudiante(username: str, db: Session = Depends(get_db)):
@@ -2287,7 +2369,7 @@ class UpsertTareaBody(BaseModel):
     score: int
 
 @authRouter.post("/grades/tareas")
-def upsert_tarea(body: UpsertTareaBody, db: Session = Depends(get_db), who=Depends(require_roles(["profesor", "empresa", "admin"]))):
+def upsert_tarea(body: UpsertTareaBody, db: Session = Depends(get_db), who: models.Registro = Depends(require_usuario_roles(["profesor", "empresa", "admin"]))):
     row = crud.upsert_tarea_calificacion(
         db,
         estudiante_username=body.estudiante_username,
@@ -2297,7 +2379,7 @@ def upsert_tarea(body: UpsertTareaBody, db: Session = Depends(get_db), who=Depen
     )
     try:
         est = db.query(models.Registro).filter(models.Registro.username == body.estudiante_username).first()
-        remitente = db.query(models.Registro).filter(models.Registro.username == who["username"]).first()
+        remitente = who  # Cargado una sola vez por la dependencia
         if est:
             msg = f"Tu tarea de la unidad {body.unidad_id} fue calificada: {body.score}/100."
             crud.crear_notificacion(
@@ -2339,28 +2421,17 @@ def listar_quizzes_unidad(unidad_id: int, db: Session = Depends(get_db)):
     return [QuizResponse.from_orm(q) for q in quizzes]
 
 @authRouter.delete("/unidades/quizzes/{quiz_id}")
-def eliminar_quiz_unidad(quiz_id: int, db: Session = Depends(get_db)):
+def eliminar_quiz_unidad(quiz_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     quiz = db.query(models.Quiz).filter(models.Quiz.id == quiz_id).first()
     if not quiz:
         raise HTTPException(status_code=404, detail="Quiz no encontrado")
     try:
-        # Eliminar usando delete() en masa para mejor rendimiento
-        print(f"[UNIDAD] Eliminando asignaciones para quiz_id: {quiz_id}")
-        db.query(models.QuizAsignacion).filter(models.QuizAsignacion.quiz_id == quiz_id).delete()
-        
-        print(f"[UNIDAD] Eliminando calificaciones para quiz_id: {quiz_id}")
-        db.query(models.EstudianteQuizCalificacion).filter(models.EstudianteQuizCalificacion.quiz_id == quiz_id).delete()
-        
-        print(f"[UNIDAD] Eliminando permisos para quiz_id: {quiz_id}")
-        db.query(models.EstudianteQuizPermiso).filter(models.EstudianteQuizPermiso.quiz_id == quiz_id).delete()
-        
-        print(f"[UNIDAD] Eliminando quiz con id: {quiz_id}")
-        # Finalmente eliminar el quiz
-        db.delete(quiz)
-        
-        print("[UNIDAD] Haciendo commit...")
+        # Borrado lógico: el quiz desaparece ya de las consultas; asignaciones, calificaciones,
+        # permisos, respuestas e intentos se borran en segundo plano por bloques
+        print(f"[UNIDAD] Marcando quiz eliminado: {quiz_id}")
+        borrado_logico.marcar_eliminados(db, models.Quiz, models.Quiz.id == quiz_id)
         db.commit()
-        print("[UNIDAD] Quiz eliminado exitosamente")
+        background_tasks.add_task(borrado_logico.purgar_eliminados)
         return {"eliminado": True, "id": quiz_id}
     except Exception as e:
         print(f"[UNIDAD] Error al eliminar quiz: {str(e)}")
@@ -2393,12 +2464,12 @@ def desasignar_estudiante_profesor(profesor_username: str, estudiante_username:
 # Resumen de asignaciones por profesor: cantidad de grupos y estudiantes asignados
 @authRouter.get("/profesores/{profesor_username}/resumen-asignaciones")
 def resumen_asignaciones_profesor(profesor_username: str, db: Session = Depends(get_db)):
-    # Contar estudiantes asignados por la tabla profesor_estudiante
     # Primero obtener el id del profesor
     profesor = db.query(models.Registro).filter(models.Registro.username == profesor_username).first()
     if not profesor:
         raise HTTPException(status_code=404, detail="Profesor no encontrado")
-    estudiantes_asignados = db.query(models.profesor_estudiante).filter(models.profesor_estudiante.c.profesor_id == profesor.identificador).count()
+    # Estudiantes asignados desde la caché de asignaciones (sin contar sobre profesor_estudiante)
+    estudiantes_asignados = len(asignaciones_cache.estudiantes_de(db, profesor.identificador))
     # Conteo de grupos creados: solo clases usadas como "grupo de unidad"
     # Se consideran grupos aquellas clases cuyo tema sigue el patrón "Grupo Unidad X"
     grupos_creados = db.query(models.Clase).filter(
@@ -2418,28 +2489,27 @@ def resumen_asignaciones_profesor(profesor_username: str, db: Session = Depends(
 
 @authRouter.get("/estudiantes")
 def obtener_todos_estudiantes(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    response: Response,
+    pagina: Pagina = Depends(pagina_params),
+    db: Session = Depends(get_db),
+    # Solo empresa y profesor pueden ver lista de estudiantes
+    principal: Principal = Depends(require_roles(["empresa", "profesor"], "No tienes permisos para acceder a esta información")),
 ):
     """Obtiene todos los estudiantes registrados (solo empresa/profesor)."""
-    # Verificar autenticación
-    current_username, tipo_usuario = _username_from_token(credentials)
-    if not current_username:
-        raise HTTPException(status_code=401, detail="Token inválido")
-
-    # Solo empresa y profesor pueden ver lista de estudiantes
-    if tipo_usuario not in ["empresa", "profesor"]:
-        raise HTTPException(status_code=403, detail="No tienes permisos para acceder a esta información")
+    current_username, tipo_usuario = principal["username"], principal["tipo_usuario"]
 
     try:
         # Si es profesor, solo devolver estudiantes asignados
         if tipo_usuario == "profesor":
-            estudiantes = crud.obtener_estudiantes_asignados(db, current_username)
+            estudiantes = crud.obtener_estudiantes_asignados(db, current_username, pagina)
         else:
             # Si es empresa (u otro rol autorizado), devolver todos los estudiantes
-            estudiantes = crud.obtener_estudiantes(db)
+            estudiantes = crud.obtener_estudiantes(db, pagina)
 
+        aplicar_cabeceras(response, pagina)
         return [schemas.UsuarioResponse.from_orm(est) for est in estudiantes]
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error obteniendo estudiantes: {e}")
 
@@ -2447,68 +2517,53 @@ def obtener_todos_estudiantes(
 # Tracking & Analytics (Nuevos)
 # ==========================
 
-def _username_from_token(credentials: HTTPAuthorizationCredentials):
-    try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload.get("sub"), payload.get("tipo_usuario")
-    except Exception:
-        return None, None
-
 @authRouter.post("/tracking/start")
-def tracking_start(
+async def tracking_start(
     unidad_id: int = Body(..., embed=True),
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    principal: Principal = Depends(get_principal),
 ):
-    username, _ = _username_from_token(credentials)
-    if not username:
-        raise HTTPException(status_code=401, detail="Token inválido")
+    username = principal["username"]
     # Validar que la unidad exista para evitar FK
-    unidad = db.query(models.Unidad).filter(models.Unidad.id == unidad_id).first()
-    if not unidad:
+    unidad = await db.scalar(select(models.Unidad.id).where(models.Unidad.id == unidad_id))
+    if unidad is None:
         raise HTTPException(status_code=404, detail="Unidad no encontrada para tracking")
-    return crud.track_activity(db, username=username, unidad_id=unidad_id, tipo_evento="start")
+    return await db.run_sync(crud.track_activity, username=username, unidad_id=unidad_id, tipo_evento="start")
 
 @authRouter.post("/tracking/heartbeat")
-def tracking_heartbeat(
+async def tracking_heartbeat(
     unidad_id: int = Body(..., embed=True),
     duracion_min: int = Body(..., embed=True),
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    principal: Principal = Depends(get_principal),
 ):
-    username, _ = _username_from_token(credentials)
-    if not username:
-        raise HTTPException(status_code=401, detail="Token inválido")
-    unidad = db.query(models.Unidad).filter(models.Unidad.id == unidad_id).first()
-    if not unidad:
+    username = principal["username"]
+    unidad = await db.scalar(select(models.Unidad.id).where(models.Unidad.id == unidad_id))
+    if unidad is None:
         raise HTTPException(status_code=404, detail="Unidad no encontrada para tracking")
-    return crud.track_activity(db, username=username, unidad_id=unidad_id, tipo_evento="heartbeat", duracion_min=duracion_min)
+    return await db.run_sync(crud.track_activity, username=username, unidad_id=unidad_id, tipo_evento="heartbeat", duracion_min=duracion_min)
 
 @authRouter.post("/tracking/end")
-def tracking_end(
+async def tracking_end(
     unidad_id: int = Body(..., embed=True),
     duracion_min: int | None = Body(None, embed=True),
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    principal: Principal = Depends(get_principal),
 ):
-    username, _ = _username_from_token(credentials)
-    if not username:
-        raise HTTPException(status_code=401, detail="Token inválido")
-    unidad = db.query(models.Unidad).filter(models.Unidad.id == unidad_id).first()
-    if not unidad:
+    username = principal["username"]
+    unidad = await db.scalar(select(models.Unidad.id).where(models.Unidad.id == unidad_id))
+    if unidad is None:
         raise HTTPException(status_code=404, detail="Unidad no encontrada para tracking")
-    return crud.track_activity(db, username=username, unidad_id=unidad_id, tipo_evento="end", duracion_min=duracion_min)
+    return await db.run_sync(crud.track_activity, username=username, unidad_id=unidad_id, tipo_evento="end", duracion_min=duracion_min)
 
 @authRouter.put("/progreso/{unidad_id}")
 def upsert_progreso(
     unidad_id: int,
     body: dict = Body(...),
-    credentials: HTTPAuthorizationCredentials = Depends(security),
+    usuario: models.Registro = Depends(get_current_usuario),
     db: Session = Depends(get_db)
 ):
-    username, _ = _username_from_token(credentials)
-    if not username:
-        raise HTTPException(status_code=401, detail="Token inválido")
+    username = usuario.username
     porcentaje = body.get("porcentaje_completado")
     score = body.get("score")
     row = crud.upsert_progreso_score(db, username=username, unidad_id=unidad_id, porcentaje_completado=porcentaje, score=score)
@@ -2521,7 +2576,7 @@ def upsert_progreso(
     try:
         if porcentaje is not None and float(porcentaje) >= 100:
             msg = f"El estudiante {username} entregó la unidad #{unidad_id}."
-            created = _notify_profesores_asignados(db, estudiante_username=username, mensaje=msg, unidad_id=unidad_id, tipo="entrega_unidad")
+            created = _notify_profesores_asignados(db, usuario, mensaje=msg, unidad_id=unidad_id, tipo="entrega_unidad")
             print(f"[NOTIFY] entrega_unidad -> profesores_notificados={created} | estudiante={username} | unidad={unidad_id}")
         else:
             print(f"[NOTIFY] entrega_unidad -> no dispara (porcentaje={porcentaje}) | estudiante={username} | unidad={unidad_id}")
@@ -2539,14 +2594,12 @@ def analytics_resumen(
     username: str, 
     desde: str | None = None, 
     hasta: str | None = None, 
-    credentials: HTTPAuthorizationCredentials = Depends(security),
+    usuario: models.Registro = Depends(get_current_usuario),
     db: Session = Depends(get_db)
 ):
     """Analytics de resumen para un usuario específico (uso empresa/profesor)."""
-    # Verificar autenticación
-    current_username, tipo_usuario = _username_from_token(credentials)
-    if not current_username:
-        raise HTTPException(status_code=401, detail="Token inválido")
+    # Usuario autenticado (cargado una vez por la dependencia)
+    current_username, tipo_usuario = usuario.username, usuario.tipo_usuario
     
     # Verificar permisos: solo empresa/profesor pueden ver datos de otros usuarios
     if tipo_usuario not in ['empresa', 'profesor'] and current_username != username:
@@ -2554,7 +2607,7 @@ def analytics_resumen(
     
     # Si es profesor, verificar que el estudiante esté asignado
     if tipo_usuario == 'profesor':
-        if not _estudiante_asignado_a_profesor(db, current_username, username):
+        if not _estudiante_asignado_a_profesor(db, usuario, username):
             raise HTTPException(status_code=403, detail="Estudiante no asignado a este profesor")
     
     try:
@@ -2573,14 +2626,12 @@ def analytics_unidades(
     username: str, 
     desde: str | None = None, 
     hasta: str | None = None, 
-    credentials: HTTPAuthorizationCredentials = Depends(security),
+    usuario: models.Registro = Depends(get_current_usuario),
     db: Session = Depends(get_db)
 ):
     """Analytics de unidades para un usuario específico (uso empresa/profesor)."""
-    # Verificar autenticación
-    current_username, tipo_usuario = _username_from_token(credentials)
-    if not current_username:
-        raise HTTPException(status_code=401, detail="Token inválido")
+    # Usuario autenticado (cargado una vez por la dependencia)
+    current_username, tipo_usuario = usuario.username, usuario.tipo_usuario
     
     # Verificar permisos: solo empresa/profesor pueden ver datos de otros usuarios
     if tipo_usuario not in ['empresa', 'profesor'] and current_username != username:
@@ -2588,7 +2639,7 @@ def analytics_unidades(
     
     # Si es profesor, verificar que el estudiante esté asignado
     if tipo_usuario == 'profesor':
-        if not _estudiante_asignado_a_profesor(db, current_username, username):
+        if not _estudiante_asignado_a_profesor(db, usuario, username):
             raise HTTPException(status_code=403, detail="Estudiante no asignado a este profesor")
     
     try:
@@ -2603,18 +2654,12 @@ def analytics_unidades(
 
 @authRouter.get("/analytics/dashboard/stats")
 def analytics_dashboard_stats(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db),
+    # Solo empresa y profesor pueden acceder
+    principal: Principal = Depends(require_roles(["empresa", "profesor"], "No tienes permisos para acceder a esta información")),
 ):
     """Estadísticas generales del dashboard de analytics (empresa/profesor)"""
-    # Verificar autenticación
-    current_username, tipo_usuario = _username_from_token(credentials)
-    if not current_username:
-        raise HTTPException(status_code=401, detail="Token inválido")
-    
-    # Solo empresa y profesor pueden acceder
-    if tipo_usuario not in ['empresa', 'profesor']:
-        raise HTTPException(status_code=403, detail="No tienes permisos para acceder a esta información")
+    current_username, tipo_usuario = principal["username"], principal["tipo_usuario"]
     
     try:
         # Obtener estudiantes según el tipo de usuario
@@ -2660,16 +2705,11 @@ def analytics_dashboard_stats(
 
 @authRouter.get("/analytics/dashboard/unidades")
 def analytics_dashboard_unidades(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db),
+    principal: Principal = Depends(require_roles(["empresa", "profesor"], "No tienes permisos para acceder a esta información")),
 ):
     """Progreso por unidad agregado para dashboard empresa/profesor."""
-    current_username, tipo_usuario = _username_from_token(credentials)
-    if not current_username:
-        raise HTTPException(status_code=401, detail="Token inválido")
-
-    if tipo_usuario not in ["empresa", "profesor"]:
-        raise HTTPException(status_code=403, detail="No tienes permisos para acceder a esta información")
+    current_username, tipo_usuario = principal["username"], principal["tipo_usuario"]
 
     try:
         # Estudiantes según el tipo de usuario
@@ -2727,16 +2767,11 @@ def analytics_dashboard_unidades(
 
 @authRouter.get("/analytics/dashboard/activity")
 def analytics_dashboard_activity(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db),
+    principal: Principal = Depends(require_roles(["empresa", "profesor"], "No tienes permisos para acceder a esta información")),
 ):
     """Actividad reciente y alertas para dashboard empresa/profesor."""
-    current_username, tipo_usuario = _username_from_token(credentials)
-    if not current_username:
-        raise HTTPException(status_code=401, detail="Token inválido")
-
-    if tipo_usuario not in ["empresa", "profesor"]:
-        raise HTTPException(status_code=403, detail="No tienes permisos para acceder a esta información")
+    current_username, tipo_usuario = principal["username"], principal["tipo_usuario"]
 
     try:
         # Estudiantes según el tipo de usuario
@@ -2785,6 +2820,14 @@ def analytics_dashboard_activity(
         bajo_prog_candidatos: list[dict] = []
         inactivos: list[dict] = []
 
+        # Última actividad de cada estudiante en una sola consulta agrupada
+        ultima_actividad = dict(
+            db.query(models.ActividadEstudiante.username, func.max(models.ActividadEstudiante.creado_at))
+            .filter(models.ActividadEstudiante.username.in_(usernames))
+            .group_by(models.ActividadEstudiante.username)
+            .all()
+        )
+
         for est in estudiantes:
             resumen = crud.get_analytics_resumen(db, est.username)
             progreso = float(resumen.get("progreso_general", 0))
@@ -2799,15 +2842,10 @@ def analytics_dashboard_activity(
             )
 
             # Última actividad para detectar inactividad prolongada
-            last_ev = (
-                db.query(models.ActividadEstudiante)
-                .filter(models.ActividadEstudiante.username == est.username)
-                .order_by(models.ActividadEstudiante.creado_at.desc())
-                .first()
-            )
+            last_at = ultima_actividad.get(est.username)
 
-            if last_ev is not None and last_ev.creado_at is not None:
-                dias = (hoy - last_ev.creado_at.date()).days
+            if last_at is not None:
+                dias = (hoy - last_at.date()).days
                 if dias >= 7:
                     inactivos.append(
                         {
@@ -2837,14 +2875,11 @@ def analytics_dashboard_activity(
 @authRouter.get("/debug/actividad/{username}")
 def debug_actividad_estudiante(
     username: str,
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    principal: Principal = Depends(get_principal),
 ):
     """Debug: Ver actividades registradas de un estudiante"""
-    # Verificar autenticación
-    current_username, tipo_usuario = _username_from_token(credentials)
-    if not current_username:
-        raise HTTPException(status_code=401, detail="Token inválido")
+    current_username, tipo_usuario = principal["username"], principal["tipo_usuario"]
     
     # Solo empresa/profesor o el mismo estudiante pueden ver
     if tipo_usuario not in ['empresa', 'profesor'] and current_username != username:
@@ -2903,13 +2938,11 @@ def debug_actividad_estudiante(
 @authRouter.post("/debug/registrar-actividad")
 def debug_registrar_actividad(
     unidad_id: int = Body(..., embed=True),
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    principal: Principal = Depends(get_principal),
 ):
     """Debug: Registrar actividad manualmente para testing"""
-    username, _ = _username_from_token(credentials)
-    if not username:
-        raise HTTPException(status_code=401, detail="Token inválido")
+    username = principal["username"]
     
     try:
         # Registrar actividad de estudio
@@ -2948,34 +2981,17 @@ QUIZ_IMAGE_DIR.mkdir(parents=True, exist_ok=True)
 EMPRESA_FILES_DIR = Path(os.getenv("EMPRESA_FILES_BASE_DIR", str(BASE_DIR / "archivos_empresa")))
 EMPRESA_FILES_DIR.mkdir(parents=True, exist_ok=True)
 
-def get_current_user_from_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """Extrae el username del token JWT"""
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Token inválido")
-        return username
-    except Exception as e:
-        # Compatibilidad con PyJWT: manejar expiración y otros errores
-        try:
-            from jwt import exceptions as jwt_exceptions  # type: ignore
-            if isinstance(e, jwt_exceptions.ExpiredSignatureError):
-                raise HTTPException(status_code=401, detail="Token expirado")
-        except Exception:
-            pass
-        raise HTTPException(status_code=401, detail="Token inválido")
-
+# `def` (no async): la sesión sincrónica y la copia de archivos corren en el threadpool, no en el event loop
 @authRouter.post("/estudiantes/subcarpetas/{unidad_id}/{subcarpeta_nombre}/upload")
-async def upload_student_file(
+def upload_student_file(
     unidad_id: int,
     subcarpeta_nombre: str,
     files: list[UploadFile] = File(...),
-    current_user: str = Depends(get_current_user_from_token),
+    usuario: models.Registro = Depends(get_current_usuario),
     db: Session = Depends(get_db)
 ):
     """Endpoint EXCLUSIVO para estudiantes - subir archivos a SOLO TAREAS"""
+    current_user = usuario.username
     
     # RESTRICCIÓN: Solo subcarpeta "SOLO TAREAS"
     if subcarpeta_nombre != "SOLO TAREAS":
@@ -2988,15 +3004,10 @@ async def upload_student_file(
     print(f"🔍 DEBUG: current_user={current_user}, unidad_id={unidad_id}, subcarpeta={subcarpeta_nombre}")
     
     # Primero obtener el ID del estudiante
-    estudiante = db.query(models.Registro).filter(models.Registro.username == current_user).first()
-    if not estudiante:
-        print(f"❌ DEBUG: Usuario {current_user} no encontrado")
-        raise HTTPException(status_code=403, detail="Usuario no encontrado")
-    
-    print(f"✅ DEBUG: Estudiante encontrado: ID={estudiante.identificador}")
+    estudiante = usuario  # Ya cargado por get_current_usuario
     
     # Verificar relación en tabla estudiante_unidad
-    acceso = db.query(models.estudiante_unidad).filter(
+    acceso = borrado_logico.solo_unidades_vivas(db.query(models.estudiante_unidad), models.estudiante_unidad.c.unidad_id).filter(
         models.estudiante_unidad.c.estudiante_id == estudiante.identificador,
         models.estudiante_unidad.c.unidad_id == unidad_id,
         models.estudiante_unidad.c.habilitada == True
@@ -3036,7 +3047,7 @@ async def upload_student_file(
                 db.rollback()
                 print(f"⚠️ DEBUG: Falló auto-reparación: {e2}")
         # Revalidar acceso
-        acceso = db.query(models.estudiante_unidad).filter(
+        acceso = borrado_logico.solo_unidades_vivas(db.query(models.estudiante_unidad), models.estudiante_unidad.c.unidad_id).filter(
             models.estudiante_unidad.c.estudiante_id == estudiante.identificador,
             models.estudiante_unidad.c.unidad_id == unidad_id,
             models.estudiante_unidad.c.habilitada == True
@@ -3046,7 +3057,7 @@ async def upload_student_file(
             # dejando un log para diagnóstico. Esto evita errores cuando la unidad no está
             # registrada en BD pero existe en el filesystem de tareas.
             try:
-                relaciones = db.query(models.estudiante_unidad).filter(
+                relaciones = borrado_logico.solo_unidades_vivas(db.query(models.estudiante_unidad), models.estudiante_unidad.c.unidad_id).filter(
                     models.estudiante_unidad.c.estudiante_id == estudiante.identificador
                 ).all()
                 print(f"⚠️ WARN: Subiendo sin relación habilitada. estudiante_id={estudiante.identificador}, unidad_id={unidad_id}, relaciones={relaciones}")
@@ -3102,7 +3113,7 @@ async def upload_student_file(
     try:
         if uploaded_files:
             msg = f"El estudiante {current_user} subió {len(uploaded_files)} archivo(s) en SOLO TAREAS de la unidad #{unidad_id}."
-            notifications_created = _notify_profesores_asignados(db, estudiante_username=current_user, mensaje=msg, unidad_id=unidad_id, tipo="subida_tarea")
+            notifications_created = _notify_profesores_asignados(db, estudiante, mensaje=msg, unidad_id=unidad_id, tipo="subida_tarea")
             print(f"[NOTIFY] subida_tarea -> profesores_notificados={notifications_created} | estudiante={current_user} | unidad={unidad_id}")
             # Registrar actividad para racha por entrega de tarea
             try:
@@ -3128,22 +3139,21 @@ async def upload_student_file(
 def get_student_files(
     unidad_id: int,
     subcarpeta_nombre: str,
-    current_user: str = Depends(get_current_user_from_token),
+    usuario: models.Registro = Depends(get_current_usuario),
     db: Session = Depends(get_db)
 ):
     """Listar archivos subidos por el estudiante"""
+    current_user = usuario.username
     
     if subcarpeta_nombre != "SOLO TAREAS":
         raise HTTPException(status_code=403, detail="Acceso denegado")
     
     # Verificar acceso
     # Primero obtener el ID del estudiante
-    estudiante = db.query(models.Registro).filter(models.Registro.username == current_user).first()
-    if not estudiante:
-        raise HTTPException(status_code=403, detail="Usuario no encontrado")
+    estudiante = usuario  # Ya cargado por get_current_usuario
     
     # Verificar relación en tabla estudiante_unidad
-    acceso = db.query(models.estudiante_unidad).filter(
+    acceso = borrado_logico.solo_unidades_vivas(db.query(models.estudiante_unidad), models.estudiante_unidad.c.unidad_id).filter(
         models.estudiante_unidad.c.estudiante_id == estudiante.identificador,
         models.estudiante_unidad.c.unidad_id == unidad_id,
         models.estudiante_unidad.c.habilitada == True
@@ -3174,7 +3184,7 @@ def get_student_files(
                 db.commit()
             except Exception:
                 db.rollback()
-        acceso = db.query(models.estudiante_unidad).filter(
+        acceso = borrado_logico.solo_unidades_vivas(db.query(models.estudiante_unidad), models.estudiante_unidad.c.unidad_id).filter(
             models.estudiante_unidad.c.estudiante_id == estudiante.identificador,
             models.estudiante_unidad.c.unidad_id == unidad_id,
             models.estudiante_unidad.c.habilitada == True
@@ -3205,10 +3215,11 @@ def delete_student_file(
     unidad_id: int,
     subcarpeta_nombre: str,
     filename: str,
-    current_user: str = Depends(get_current_user_from_token),
+    usuario: models.Registro = Depends(get_current_usuario),
     db: Session = Depends(get_db)
 ):
     """Endpoint para que estudiantes eliminen sus propias tareas"""
+    current_user = usuario.username
     
     # RESTRICCIÓN: Solo subcarpeta "SOLO TAREAS"
     if subcarpeta_nombre != "SOLO TAREAS":
@@ -3221,13 +3232,10 @@ def delete_student_file(
     print(f"🗑️ DEBUG: Eliminando archivo - user={current_user}, unidad_id={unidad_id}, filename={filename}")
     
     # Obtener el ID del estudiante
-    estudiante = db.query(models.Registro).filter(models.Registro.username == current_user).first()
-    if not estudiante:
-        print(f"❌ DEBUG: Usuario {current_user} no encontrado")
-        raise HTTPException(status_code=403, detail="Usuario no encontrado")
+    estudiante = usuario  # Ya cargado por get_current_usuario
     
     # Verificar relación en tabla estudiante_unidad (con auto-reparación)
-    acceso = db.query(models.estudiante_unidad).filter(
+    acceso = borrado_logico.solo_unidades_vivas(db.query(models.estudiante_unidad), models.estudiante_unidad.c.unidad_id).filter(
         models.estudiante_unidad.c.estudiante_id == estudiante.identificador,
         models.estudiante_unidad.c.unidad_id == unidad_id,
         models.estudiante_unidad.c.habilitada == True
@@ -3275,7 +3283,7 @@ def delete_student_file(
             msg = f"El estudiante {current_user} eliminó el archivo '{original_name}' de SOLO TAREAS en la unidad #{unidad_id}."
             notifications_created = _notify_profesores_asignados(
                 db, 
-                estudiante_username=current_user, 
+                estudiante, 
                 mensaje=msg, 
                 unidad_id=unidad_id, 
                 tipo="eliminacion_tarea"
@@ -3322,7 +3330,7 @@ def delete_student_file(
 def empresa_listar_tareas_estudiante(
     username: str,
     unidad_id: int,
-    credentials: HTTPAuthorizationCredentials = Depends(security),
+    usuario: models.Registro = Depends(get_current_usuario),
     db: Session = Depends(get_db)
 ):
     """Devuelve la lista de archivos de 'SOLO TAREAS' para un estudiante y unidad dada.
@@ -3330,18 +3338,12 @@ def empresa_listar_tareas_estudiante(
       - empresa: puede ver TODOS los estudiantes.
       - profesor: solo estudiantes ASIGNADOS a ese profesor.
     """
-    # Validar rol desde token
-    try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        sub = payload.get("sub")
-        tipo = payload.get("tipo_usuario")
-    except Exception:
-        raise HTTPException(status_code=401, detail="Token inválido")
+    tipo = usuario.tipo_usuario
 
     if tipo == "empresa":
         pass  # acceso total
     elif tipo == "profesor":
-        if not _estudiante_asignado_a_profesor(db, profesor_username=sub, estudiante_username=username):
+        if not _estudiante_asignado_a_profesor(db, usuario, username):
             raise HTTPException(status_code=403, detail="Estudiante no asignado a este profesor")
     else:
         raise HTTPException(status_code=403, detail="Acceso denegado")
@@ -3414,21 +3416,16 @@ def empresa_listar_tareas_estudiante(
 @authRouter.get("/empresa/estudiantes/{username}/tareas")
 def empresa_listar_todas_tareas_estudiante(
     username: str,
-    credentials: HTTPAuthorizationCredentials = Depends(security),
+    usuario: models.Registro = Depends(get_current_usuario),
     db: Session = Depends(get_db)
 ):
     """Lista TODAS las tareas del estudiante agrupadas por unidad (solo lectura).
     Permisos: empresa (todos), profesor (solo asignados)."""
-    try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        sub = payload.get("sub")
-        tipo = payload.get("tipo_usuario")
-    except Exception:
-        raise HTTPException(status_code=401, detail="Token inválido")
+    tipo = usuario.tipo_usuario
     if tipo == "empresa":
         pass
     elif tipo == "profesor":
-        if not _estudiante_asignado_a_profesor(db, profesor_username=sub, estudiante_username=username):
+        if not _estudiante_asignado_a_profesor(db, usuario, username):
             raise HTTPException(status_code=403, detail="Estudiante no asignado a este profesor")
     else:
         raise HTTPException(status_code=403, detail="Acceso denegado")
@@ -3453,20 +3450,19 @@ def get_student_file(
     unidad_id: int,
     subcarpeta_nombre: str,
     filename: str,
-    current_user: str = Depends(get_current_user_from_token),
+    usuario: models.Registro = Depends(get_current_usuario),
     db: Session = Depends(get_db)
 ):
     """Servir archivo específico del estudiante"""
+    current_user = usuario.username
     
     if subcarpeta_nombre != "SOLO TAREAS":
         raise HTTPException(status_code=403, detail="Acceso denegado")
     
     # Verificar acceso (mismo código que en get_student_files)
-    estudiante = db.query(models.Registro).filter(models.Registro.username == current_user).first()
-    if not estudiante:
-        raise HTTPException(status_code=403, detail="Usuario no encontrado")
+    estudiante = usuario  # Ya cargado por get_current_usuario
     
-    acceso = db.query(models.estudiante_unidad).filter(
+    acceso = borrado_logico.solo_unidades_vivas(db.query(models.estudiante_unidad), models.estudiante_unidad.c.unidad_id).filter(
         models.estudiante_unidad.c.estudiante_id == estudiante.identificador,
         models.estudiante_unidad.c.unidad_id == unidad_id,
         models.estudiante_unidad.c.habilitada == True
@@ -3679,11 +3675,11 @@ def profesor_calificar_tarea(
     estudiante_username: str,
     unidad_id: int,
     body: GradeBody,
-    credentials: HTTPAuthorizationCredentials = Depends(security),
+    profesor: models.Registro = Depends(get_current_usuario),
     db: Session = Depends(get_db)
 ):
-    _ensure_profesor_credentials(profesor_username, credentials)
-    if not _estudiante_asignado_a_profesor(db, profesor_username, estudiante_username):
+    _ensure_profesor_credentials(profesor_username, profesor)
+    if not _estudiante_asignado_a_profesor(db, profesor, estudiante_username):
         raise HTTPException(status_code=403, detail="Estudiante no asignado a este profesor")
     # Guardar/actualizar calificación en BD (tarea_calificacion)
     try:
@@ -3743,24 +3739,19 @@ def profesor_bonus_asistencia(
     estudiante_username: str,
     unidad_id: int,
     body: BonusBody,
-    credentials: HTTPAuthorizationCredentials = Depends(security),
+    profesor: models.Registro = Depends(get_current_usuario),
     db: Session = Depends(get_db)
 ):
-    _ensure_profesor_credentials(profesor_username, credentials)
-    if not _estudiante_asignado_a_profesor(db, profesor_username, estudiante_username):
+    _ensure_profesor_credentials(profesor_username, profesor)
+    if not _estudiante_asignado_a_profesor(db, profesor, estudiante_username):
         raise HTTPException(status_code=403, detail="Estudiante no asignado a este profesor")
-    # Aplicar bonus vía upsert_progreso_score
+    # Aplicar bonus con incremento atómico (tiempo + n, LEAST(100, score + n))
     try:
-        # Recuperar fila actual
-        row = crud._ensure_progreso_row(db, username=estudiante_username, unidad_id=unidad_id)
-        nuevo_tiempo = (row.tiempo_dedicado_min or 0) + int(max(0, body.add_min or 0))
-        nuevo_score = min(100, (row.score or 0) + int(max(0, body.add_score or 0)))
-        row.tiempo_dedicado_min = nuevo_tiempo
-        row.score = nuevo_score
-        row.ultima_actividad_at = datetime.utcnow()
-        db.add(row)
+        row_id = crud.incrementar_progreso(
+            db, estudiante_username, unidad_id, add_min=body.add_min or 0, add_score=body.add_score or 0
+        )
         db.commit()
-        db.refresh(row)
+        row = db.get(models.EstudianteProgresoUnidad, row_id, populate_existing=True)
         return {"ok": True, "unidad_id": unidad_id, "tiempo_dedicado_min": row.tiempo_dedicado_min, "score": row.score}
     except Exception as e:
         db.rollback()
@@ -3772,12 +3763,12 @@ def profesor_obtener_calificacion(
     estudiante_username: str,
     unidad_id: int,
     filename: str,
-    credentials: HTTPAuthorizationCredentials = Depends(security),
+    profesor: models.Registro = Depends(get_current_usuario),
     db: Session = Depends(get_db)
 ):
     """Obtiene la calificación (si existe) para un archivo específico."""
-    _ensure_profesor_credentials(profesor_username, credentials)
-    if not _estudiante_asignado_a_profesor(db, profesor_username, estudiante_username):
+    _ensure_profesor_credentials(profesor_username, profesor)
+    if not _estudiante_asignado_a_profesor(db, profesor, estudiante_username):
         raise HTTPException(status_code=403, detail="Estudiante no asignado a este profesor")
     row = db.query(models.TareaCalificacion).filter(
         models.TareaCalificacion.estudiante_username == estudiante_username,
@@ -3806,28 +3797,6 @@ def profesor_obtener_calificacion(
 # ==========================
 from typing import Optional
 
-def _ensure_profesor_credentials(profesor_username: str, credentials: HTTPAuthorizationCredentials):
-    """Valida que el token pertenece a un profesor y coincide con el username del path."""
-    try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        sub = payload.get("sub")
-        tipo = payload.get("tipo_usuario")
-        if tipo != "profesor" or sub != profesor_username:
-            raise HTTPException(status_code=403, detail="No autorizado")
-    except Exception:
-        raise HTTPException(status_code=401, detail="Token inválido")
-
-def _estudiante_asignado_a_profesor(db: Session, profesor_username: str, estudiante_username: str) -> bool:
-    profesor = db.query(models.Registro).filter(models.Registro.username == profesor_username).first()
-    estudiante = db.query(models.Registro).filter(models.Registro.username == estudiante_username).first()
-    if not profesor or not estudiante:
-        return False
-    rel = db.query(models.profesor_estudiante).filter(
-        models.profesor_estudiante.c.profesor_id == profesor.identificador,
-        models.profesor_estudiante.c.estudiante_id == estudiante.identificador
-    ).first()
-    return rel is not None
-
 def _listar_tareas_estudiante(username: str, unidad_id: Optional[int] = None):
     tareas = []
     base = UPLOAD_DIR / "estudiantes" / username
@@ -3867,19 +3836,18 @@ def profesor_listar_tareas(
     unidad_id: Optional[int] = None,
     desde: Optional[str] = None,
     hasta: Optional[str] = None,
-    credentials: HTTPAuthorizationCredentials = Depends(security),
+    profesor: models.Registro = Depends(get_current_usuario),
     db: Session = Depends(get_db)
 ):
-    _ensure_profesor_credentials(profesor_username, credentials)
-    # estudiantes asignados
-    profesor = db.query(models.Registro).filter(models.Registro.username == profesor_username).first()
-    if not profesor:
-        raise HTTPException(status_code=404, detail="Profesor no encontrado")
-    asignaciones = db.query(models.profesor_estudiante.c.estudiante_id).filter(models.profesor_estudiante.c.profesor_id == profesor.identificador).all()
-    est_ids = [row[0] for row in asignaciones]
+    _ensure_profesor_credentials(profesor_username, profesor)
+    # estudiantes asignados desde la caché (el profesor ya viene cargado por la dependencia);
+    # de Registro solo se leen los nombres para la respuesta
+    est_ids = list(asignaciones_cache.estudiantes_de(db, profesor.identificador).values())
     if not est_ids:
         return []
-    estudiantes = db.query(models.Registro).filter(models.Registro.identificador.in_(est_ids)).all()
+    estudiantes = db.query(
+        models.Registro.username, models.Registro.nombres, models.Registro.apellidos
+    ).filter(models.Registro.identificador.in_(est_ids)).all()
     # filtrar por fecha
     def _en_rango(fecha_iso: str) -> bool:
         if not fecha_iso:
@@ -3915,11 +3883,11 @@ def profesor_listar_tareas_de_estudiante(
     unidad_id: Optional[int] = None,
     desde: Optional[str] = None,
     hasta: Optional[str] = None,
-    credentials: HTTPAuthorizationCredentials = Depends(security),
+    profesor: models.Registro = Depends(get_current_usuario),
     db: Session = Depends(get_db)
 ):
-    _ensure_profesor_credentials(profesor_username, credentials)
-    if not _estudiante_asignado_a_profesor(db, profesor_username, estudiante_username):
+    _ensure_profesor_credentials(profesor_username, profesor)
+    if not _estudiante_asignado_a_profesor(db, profesor, estudiante_username):
         raise HTTPException(status_code=403, detail="Estudiante no asignado a este profesor")
     tareas = _listar_tareas_estudiante(estudiante_username, unidad_id)
     # filtrar por fecha
@@ -3950,11 +3918,11 @@ def profesor_descargar_tarea(
     estudiante_username: str,
     unidad_id: int,
     filename: str,
-    credentials: HTTPAuthorizationCredentials = Depends(security),
+    profesor: models.Registro = Depends(get_current_usuario),
     db: Session = Depends(get_db)
 ):
-    _ensure_profesor_credentials(profesor_username, credentials)
-    if not _estudiante_asignado_a_profesor(db, profesor_username, estudiante_username):
+    _ensure_profesor_credentials(profesor_username, profesor)
+    if not _estudiante_asignado_a_profesor(db, profesor, estudiante_username):
         raise HTTPException(status_code=403, detail="Estudiante no asignado a este profesor")
     file_path = UPLOAD_DIR / "estudiantes" / estudiante_username / f"unidad_{unidad_id}" / "SOLO_TAREAS" / filename
     if not file_path.exists() or not file_path.is_file():
@@ -3972,30 +3940,28 @@ def profesor_descargar_tarea(
 
 @authRouter.get("/estudiantes/resumen")
 def get_resumen_estudiante(
-    current_user: str = Depends(get_current_user_from_token),
+    usuario: models.Registro = Depends(get_current_usuario),
     db: Session = Depends(get_db),
     desde: str | None = None,
     hasta: str | None = None,
 ):
     """Obtener resumen de progreso del estudiante"""
+    current_user = usuario.username
     from datetime import datetime
     d_from = datetime.fromisoformat(desde) if desde else None
     d_to = datetime.fromisoformat(hasta) if hasta else None
-    # Obtener datos del estudiante
-    estudiante = db.query(models.Registro).filter(models.Registro.username == current_user).first()
-    if not estudiante:
-        raise HTTPException(status_code=404, detail="Estudiante no encontrado")
     return crud.get_analytics_resumen(db, username=current_user, desde=d_from, hasta=d_to)
 
 
 @authRouter.get("/estudiantes/analytics/unidades")
 def get_analytics_unidades_estudiante(
-    current_user: str = Depends(get_current_user_from_token),
+    usuario: models.Registro = Depends(get_current_usuario),
     db: Session = Depends(get_db),
     desde: str | None = None,
     hasta: str | None = None,
 ):
     """Analytics de unidades para el estudiante autenticado."""
+    current_user = usuario.username
     from datetime import datetime
     d_from = datetime.fromisoformat(desde) if desde else None
     d_to = datetime.fromisoformat(hasta) if hasta else None
@@ -4008,7 +3974,7 @@ from pydantic import BaseModel
 from typing import Optional
 import json
 
-ASISTENCIAS_DIR = Path(__file__).resolve().parent / "asistencias"
+ASISTENCIAS_DIR = Path(os.getenv("ASISTENCIAS_DIR", str(Path(__file__).resolve().parent / "asistencias")))
 ASISTENCIAS_DIR.mkdir(exist_ok=True)
 
 class AsistenciaRegistroIn(BaseModel):
@@ -4231,7 +4197,7 @@ def empresa_ver_asistencia_clase(clase_id: int, db: Session = Depends(get_db)):
 @authRouter.get("/estudiantes/asistencia-resumen")
 def get_asistencia_resumen_estudiante(
     db: Session = Depends(get_db),
-    who=Depends(require_roles(["estudiante", "admin"]))
+    who: models.Registro = Depends(require_usuario_roles(["estudiante", "admin"]))
 ):
     """Resumen de asistencia del estudiante autenticado.
 
@@ -4239,13 +4205,7 @@ def get_asistencia_resumen_estudiante(
     cuántas tienen registro de asistencia y en cuántas aparece como presente.
     """
     # Obtener registro del estudiante
-    estudiante = (
-        db.query(models.Registro)
-        .filter(models.Registro.username == who["username"])
-        .first()
-    )
-    if not estudiante:
-        raise HTTPException(status_code=404, detail="Estudiante no encontrado")
+    estudiante = who  # Cargado una sola vez por la dependencia
 
     # Clases en las que el estudiante está inscrito
     clases = (
@@ -4321,8 +4281,11 @@ def get_asistencia_resumen_estudiante(
 # Listado de clases para empresa con estado de asistencia
 @authRouter.get("/empresa/clases")
 def empresa_listar_clases(
+    response: Response,
     desde: str | None = None,
     hasta: str | None = None,
+    incluir_totales: bool = False,
+    pagina: Pagina = Depends(pagina_params),
     db: Session = Depends(get_db),
     who=Depends(require_roles(["empresa", "admin"]))
 ):
@@ -4333,14 +4296,30 @@ def empresa_listar_clases(
             q = q.filter(models.Clase.dia >= desde)
         if hasta:
             q = q.filter(models.Clase.dia <= hasta)
-        clases = q.order_by(models.Clase.dia.desc(), models.Clase.hora.desc()).all()
+
+        def _resumen(consulta) -> dict:
+            """clase_id -> (inscritos, presentes, ausentes, tiene_asistencia) de las clases de la consulta"""
+            inscritos = dict(
+                consulta.with_entities(models.Clase.id, func.count(models.clase_estudiante.c.estudiante_id))
+                .outerjoin(models.clase_estudiante, models.clase_estudiante.c.clase_id == models.Clase.id)
+                .group_by(models.Clase.id)
+                .all()
+            )
+            resumen = {}
+            for clase_id, total in inscritos.items():
+                raw = _read_asistencia(clase_id)
+                presentes = len((raw or {}).get("presentes", []))
+                resumen[clase_id] = (total, presentes, max(total - presentes, 0), raw is not None)
+            return resumen
+
+        clases = paginar(q, [(models.Clase.dia, True), (models.Clase.hora, True), (models.Clase.id, True)], pagina)
+        aplicar_cabeceras(response, pagina)
+        # Inscritos y asistencia solo de las clases de esta página
+        ids_pagina = [c.id for c in clases]
+        resumen = _resumen(q.filter(models.Clase.id.in_(ids_pagina))) if ids_pagina else {}
         resp = []
         for c in clases:
-            raw = _read_asistencia(c.id)
-            data = raw or {}
-            presentes = len(data.get("presentes", []))
-            total = len(getattr(c, "estudiantes", []) or [])
-            ausentes = max(total - presentes, 0)
+            total, presentes, ausentes, tiene_asistencia = resumen.get(c.id, (0, 0, 0, False))
             resp.append({
                 "id": c.id,
                 "dia": c.dia,
@@ -4350,15 +4329,21 @@ def empresa_listar_clases(
                 "total_inscritos": total,
                 "presentes": presentes,
                 "ausentes": ausentes,
-                "tiene_asistencia": raw is not None,
+                "tiene_asistencia": tiene_asistencia,
             })
-        return {
-            "clases": resp,
-            "total_clases": len(resp),
-            "total_inscritos": sum(c["total_inscritos"] for c in resp),
-            "total_presentes": sum(c["presentes"] for c in resp),
-            "total_ausentes": sum(c["ausentes"] for c in resp),
-        }
+        resultado = {"clases": resp, "next_cursor": pagina.next_cursor}
+        if incluir_totales:
+            # Totales de todo el rango (lee la asistencia de cada clase): solo bajo demanda
+            rango = _resumen(q)
+            resultado.update({
+                "total_clases": len(rango),
+                "total_inscritos": sum(r[0] for r in rango.values()),
+                "total_presentes": sum(r[1] for r in rango.values()),
+                "total_ausentes": sum(r[2] for r in rango.values()),
+            })
+        return resultado
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error listando clases para empresa: {e}")
 
@@ -4367,7 +4352,7 @@ def empresa_listar_clases(
 def empresa_reporte_asistencias_mensual(
     anio: int,
     mes: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     who=Depends(require_roles(["empresa", "admin"]))
 ):
     try:
@@ -4700,46 +4685,6 @@ def _empresa_reporte_asistencias_mensual_impl(
 
     return {"anio": anio, "mes": mes, "mes_label": mes_label, "grupos": grupos_resp}
 
-def _estudiante_asignado_a_profesor(db: Session, profesor_username: str, estudiante_username: str) -> bool:
-    """Verifica si un estudiante está asignado a un profesor."""
-    profesor = db.query(models.Registro).filter(
-        models.Registro.username == profesor_username,
-        models.Registro.tipo_usuario == "profesor"
-    ).first()
-
-    if not profesor:
-        return False
-
-    estudiante = db.query(models.Registro).filter(
-        models.Registro.username == estudiante_username,
-        models.Registro.tipo_usuario == "estudiante"
-    ).first()
-
-    if not estudiante:
-        return False
-
-    # Verificar asignación en tabla profesor_estudiante
-    asignacion = db.query(models.profesor_estudiante).filter(
-        models.profesor_estudiante.c.profesor_id == profesor.identificador,
-        models.profesor_estudiante.c.estudiante_id == estudiante.identificador
-    ).first()
-
-    return asignacion is not None
-
-def _ensure_profesor_credentials(profesor_username: str, credentials: HTTPAuthorizationCredentials):
-    """Valida que el token corresponda al profesor especificado."""
-    try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        token_username = payload.get("sub")
-        token_tipo = payload.get("tipo_usuario")
-
-        if token_username != profesor_username:
-            raise HTTPException(status_code=403, detail="Token no corresponde al profesor")
-        if token_tipo != "profesor":
-            raise HTTPException(status_code=403, detail="Solo profesores pueden calificar tareas")
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Token inválido")
-
 def _listar_tareas_estudiante(username: str, unidad_id: int | None) -> list:
     """Lista tareas de un estudiante (simplificado)."""
     from pathlib import Path
@@ -4803,20 +4748,11 @@ async def upload_empresa_file(
     unidad_id: int,
     subcarpeta_id: int,
     files: list[UploadFile] = File(...),
-    current_user: str = Depends(get_current_user_from_token),
+    principal: Principal = Depends(require_roles(["empresa", "profesor"], "Solo empresa y profesor pueden subir archivos")),
     db: Session = Depends(get_db)
 ):
     """Endpoint para empresa/profesor - subir archivos a cualquier subcarpeta"""
-
-    # Verificar permisos
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        tipo = payload.get("tipo_usuario")
-        if tipo not in ["empresa", "profesor"]:
-            raise HTTPException(status_code=403, detail="Solo empresa y profesor pueden subir archivos")
-    except Exception:
-        raise HTTPException(status_code=401, detail="Token inválido")
+    current_user = principal["username"]
 
     # Crear directorio si no existe
     archivos_dir = EMPRESA_FILES_DIR
@@ -4885,21 +4821,11 @@ async def upload_empresa_file(
 def get_empresa_files(
     unidad_id: int,
     subcarpeta_id: int,
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    current_user: str = Depends(get_current_user_from_token),
+    principal: Principal = Depends(require_roles(["empresa", "profesor"], "Solo empresa y profesor pueden ver archivos")),
     db: Session = Depends(get_db)
 ):
     """Listar archivos subidos por empresa/profesor en una subcarpeta"""
-
-    # Verificar permisos
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        tipo = payload.get("tipo_usuario")
-        if tipo not in ["empresa", "profesor"]:
-            raise HTTPException(status_code=403, detail="Solo empresa y profesor pueden ver archivos")
-    except Exception:
-        raise HTTPException(status_code=401, detail="Token inválido")
+    current_user = principal["username"]
 
     archivos = crud.listar_archivos_empresa(db, unidad_id, subcarpeta_id, current_user)
     return {"files": archivos}
@@ -4909,21 +4835,11 @@ def delete_empresa_file(
     unidad_id: int,
     subcarpeta_id: int,
     archivo_id: str,
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    current_user: str = Depends(get_current_user_from_token),
+    principal: Principal = Depends(require_roles(["empresa", "profesor"], "Solo empresa y profesor pueden eliminar archivos")),
     db: Session = Depends(get_db)
 ):
     """Eliminar archivo de empresa/profesor"""
-
-    # Verificar permisos
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        tipo = payload.get("tipo_usuario")
-        if tipo not in ["empresa", "profesor"]:
-            raise HTTPException(status_code=403, detail="Solo empresa y profesor pueden eliminar archivos")
-    except Exception:
-        raise HTTPException(status_code=401, detail="Token inválido")
+    current_user = principal["username"]
 
     ok = crud.eliminar_archivo_empresa(unidad_id, subcarpeta_id, archivo_id, current_user)
     if not ok:
@@ -4936,21 +4852,11 @@ def crear_link_empresa(
     unidad_id: int,
     subcarpeta_id: int,
     body: dict = Body(...),
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    current_user: str = Depends(get_current_user_from_token),
+    principal: Principal = Depends(require_roles(["empresa", "profesor"], "Solo empresa y profesor pueden adjuntar links")),
     db: Session = Depends(get_db)
 ):
     """Adjuntar link en subcarpeta (empresa/profesor)"""
-
-    # Verificar permisos
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        tipo = payload.get("tipo_usuario")
-        if tipo not in ["empresa", "profesor"]:
-            raise HTTPException(status_code=403, detail="Solo empresa y profesor pueden adjuntar links")
-    except Exception:
-        raise HTTPException(status_code=401, detail="Token inválido")
+    current_user = principal["username"]
 
     nombre = body.get("nombre", "").strip()
     url = body.get("url", "").strip()
@@ -4985,21 +4891,11 @@ def download_empresa_file(
     unidad_id: int,
     subcarpeta_id: int,
     archivo_id: str,
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    current_user: str = Depends(get_current_user_from_token),
+    principal: Principal = Depends(require_roles(["empresa", "profesor"], "Solo empresa y profesor pueden descargar archivos")),
     db: Session = Depends(get_db)
 ):
     """Descargar archivo de empresa/profesor"""
-
-    # Verificar permisos
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        tipo = payload.get("tipo_usuario")
-        if tipo not in ["empresa", "profesor"]:
-            raise HTTPException(status_code=403, detail="Solo empresa y profesor pueden descargar archivos")
-    except Exception:
-        raise HTTPException(status_code=401, detail="Token inválido")
+    current_user = principal["username"]
 
     # Buscar metadata del archivo
     archivos_dir = EMPRESA_FILES_DIR / current_user / f"unidad_{unidad_id}" / f"subcarpeta_{subcarpeta_id}"
@@ -0,0 +1,198 @@
+"""
+Benchmark de endpoints en proceso
+=================================
+
+Siembra una base SQLite temporal con N estudiantes × M unidades × K quizzes
+(actividad, tareas calificadas, archivos en SOLO_TAREAS y JSON de asistencia)
+y ejecuta la app ASGI en el mismo proceso mediante httpx, sin servidor ni MySQL.
+
+Para cada endpoint reporta latencia p50/p95 y las consultas SQL por request
+(cabecera X-DB-Queries), y guarda el resultado en JSON para comparar corridas.
+
+Uso:
+    python bench_endpoints.py --estudiantes 200 --unidades 10 --quizzes 2 \\
+        --iteraciones 30 --salida bench_results.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+
+def _preparar_entorno(tmp: Path) -> None:
+    """Debe ejecutarse antes de importar la app: fija base y carpetas temporales"""
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp / 'bench.db'}"
+    os.environ["FILES_BASE_DIR"] = str(tmp / "archivos_estudiantes")
+    os.environ["EMPRESA_FILES_BASE_DIR"] = str(tmp / "archivos_empresa")
+    os.environ["ASISTENCIAS_DIR"] = str(tmp / "asistencias")
+    os.environ["RATE_LIMIT_ENABLED"] = "false"  # Se mide la app, no el limitador
+
+
+def _percentil(valores: list, p: float) -> float:
+    """Percentil por rango más cercano (valores no vacíos)"""
+    ordenados = sorted(valores)
+    idx = max(0, min(len(ordenados) - 1, int(round(p / 100 * len(ordenados) + 0.5)) - 1))
+    return ordenados[idx]
+
+
+def _git_rev() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+async def _medir(client, metodo: str, url: str, headers: dict, body: dict | None = None):
+    t0 = time.perf_counter()
+    resp = await client.request(metodo, url, headers=headers, json=body)
+    ms = (time.perf_counter() - t0) * 1000
+    return ms, int(resp.headers.get("X-DB-Queries", 0)), resp.status_code
+
+
+async def _ejecutar(args, info: dict) -> dict:
+    import httpx
+    from main import AcademyEnApp
+
+    hoy = datetime.utcnow()
+    transport = httpx.ASGITransport(app=AcademyEnApp)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def _token(username: str) -> dict:
+            resp = await client.post("/auth/login", json={"username": username, "password": info["password"]})
+            resp.raise_for_status()
+            return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+        empresa = await _token(info["empresa"])
+        estudiantes = info["estudiantes"][: max(1, min(len(info["estudiantes"]), 10))]
+        tokens_est = {u: await _token(u) for u in estudiantes}
+
+        def _est(i: int) -> str:
+            return estudiantes[i % len(estudiantes)]
+
+        def _quiz(i: int) -> int:
+            return info["quiz_ids"][i % len(info["quiz_ids"])]
+
+        casos = {
+            "grades_resumen_estudiante": lambda i: (
+                "GET", f"/auth/grades/estudiantes/{_est(i)}/resumen", {}, None),
+            "analytics_dashboard_stats": lambda i: (
+                "GET", "/auth/analytics/dashboard/stats", empresa, None),
+            "_empresa_reporte_asistencias_mensual_impl": lambda i: (
+                "GET", f"/auth/empresa/asistencias/mensual?anio={hoy.year}&mes={hoy.month}", empresa, None),
+            "quizzes_disponibles_estudiante": lambda i: (
+                "GET", "/auth/estudiante/quizzes-disponibles", tokens_est[_est(i)], None),
+            "responder_quiz": lambda i: (
+                "POST", f"/auth/estudiante/quizzes/{_quiz(i)}/responder", tokens_est[_est(i)],
+                {"quiz_id": _quiz(i), "respuestas": {"pregunta_0": 1}}),
+        }
+
+        resultados = {}
+        for nombre, caso in casos.items():
+            if args.solo and nombre not in args.solo:
+                continue
+            tiempos, queries, status = [], [], {}
+            for i in range(args.calentamiento + args.iteraciones):
+                metodo, url, headers, body = caso(i)
+                ms, nq, code = await _medir(client, metodo, url, headers, body)
+                if i < args.calentamiento:
+                    continue
+                tiempos.append(ms)
+                queries.append(nq)
+                status[str(code)] = status.get(str(code), 0) + 1
+            resultados[nombre] = {
+                "iteraciones": len(tiempos),
+                "p50_ms": round(_percentil(tiempos, 50), 3),
+                "p95_ms": round(_percentil(tiempos, 95), 3),
+                "media_ms": round(statistics.fmean(tiempos), 3),
+                "max_ms": round(max(tiempos), 3),
+                "queries_p50": _percentil(queries, 50),
+                "queries_max": max(queries),
+                "status": status,
+            }
+
+    # Cerrar las conexiones asíncronas dentro del loop (aiosqlite deja hilos vivos si no)
+    from Clever_MySQL_conn import async_engine
+    await async_engine.dispose()
+    return resultados
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark en proceso de endpoints críticos")
+    parser.add_argument("--estudiantes", type=int, default=50)
+    parser.add_argument("--unidades", type=int, default=5)
+    parser.add_argument("--quizzes", type=int, default=2, help="Quizzes por unidad")
+    parser.add_argument("--eventos", type=int, default=10, help="Eventos de actividad por estudiante y unidad")
+    parser.add_argument("--tareas", type=int, default=3, help="Tareas por estudiante y unidad")
+    parser.add_argument("--clases", type=int, default=4, help="Clases del mes por unidad")
+    parser.add_argument("--iteraciones", type=int, default=20)
+    parser.add_argument("--calentamiento", type=int, default=2)
+    parser.add_argument("--solo", nargs="*", help="Limitar a estos endpoints")
+    parser.add_argument("--salida", default="bench_results.json", help="Archivo JSON de resultados")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bls_bench_") as tmpdir:
+        tmp = Path(tmpdir)
+        _preparar_entorno(tmp)
+        sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+        from Clever_MySQL_conn import Base, engine, SessionLocal
+        import models  # noqa: F401
+        from seed_data import sembrar_datos, sembrar_archivos
+
+        t0 = time.perf_counter()
+        Base.metadata.create_all(bind=engine)
+        with SessionLocal() as db:
+            info = sembrar_datos(
+                db,
+                n_estudiantes=args.estudiantes,
+                n_unidades=args.unidades,
+                n_quizzes_por_unidad=args.quizzes,
+                eventos_por_unidad=args.eventos,
+                tareas_por_unidad=args.tareas,
+                clases_por_unidad=args.clases,
+            )
+        sembrar_archivos(info, Path(os.environ["FILES_BASE_DIR"]), Path(os.environ["ASISTENCIAS_DIR"]), args.tareas)
+        seed_s = time.perf_counter() - t0
+
+        # Los print de depuración de la app se ejecutan igual, pero no inundan la consola
+        with contextlib.redirect_stdout(io.StringIO()):
+            resultados = asyncio.run(_ejecutar(args, info))
+        engine.dispose()
+
+    salida = {
+        "fecha": datetime.utcnow().isoformat(),
+        "git_rev": _git_rev(),
+        "parametros": {
+            "estudiantes": args.estudiantes,
+            "unidades": args.unidades,
+            "quizzes_por_unidad": args.quizzes,
+            "eventos_por_unidad": args.eventos,
+            "tareas_por_unidad": args.tareas,
+            "clases_por_unidad": args.clases,
+            "iteraciones": args.iteraciones,
+            "calentamiento": args.calentamiento,
+        },
+        "seed_s": round(seed_s, 3),
+        "resultados": resultados,
+    }
+    Path(args.salida).write_text(json.dumps(salida, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    print(f"{'endpoint':45} {'p50 ms':>9} {'p95 ms':>9} {'queries':>8}  status")
+    for nombre, r in resultados.items():
+        print(f"{nombre:45} {r['p50_ms']:9.2f} {r['p95_ms']:9.2f} {r['queries_p50']:8}  {r['status']}")
+    print(f"Resultados guardados en {args.salida}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+Benchmark de login bajo concurrencia
+====================================
+
+Siembra una base SQLite temporal y lanza logins concurrentes contra la app
+ASGI en el mismo proceso (httpx, sin servidor). Sirve para comparar el costo
+de bcrypt (BCRYPT_ROUNDS) y el pool de procesos (PASSWORD_HASH_WORKERS).
+
+Reporta logins/s, latencia p50/p95 y los códigos de respuesta.
+
+Uso:
+    python bench_login.py --usuarios 50 --peticiones 200 --concurrencia 20 \\
+        --workers 4 --rounds 12
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bench_endpoints import _git_rev, _percentil, _preparar_entorno
+
+
+async def _ejecutar(args, info: dict) -> dict:
+    import httpx
+    from main import AcademyEnApp
+
+    transport = httpx.ASGITransport(app=AcademyEnApp)
+    usuarios = info["estudiantes"]
+    tiempos, status = [], {}
+    sem = asyncio.Semaphore(args.concurrencia)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        async def _login(i: int):
+            async with sem:
+                body = {"username": usuarios[i % len(usuarios)], "password": info["password"]}
+                t0 = time.perf_counter()
+                resp = await client.post("/auth/login", json=body)
+                tiempos.append((time.perf_counter() - t0) * 1000)
+                status[str(resp.status_code)] = status.get(str(resp.status_code), 0) + 1
+
+        await _login(0)  # Calentamiento: arranca el pool de procesos
+        tiempos.clear()
+        status.clear()
+        t0 = time.perf_counter()
+        await asyncio.gather(*[_login(i) for i in range(args.peticiones)])
+        total_s = time.perf_counter() - t0
+
+    from Clever_MySQL_conn import async_engine
+    await async_engine.dispose()
+    return {
+        "logins_por_s": round(args.peticiones / total_s, 2),
+        "total_s": round(total_s, 3),
+        "p50_ms": round(_percentil(tiempos, 50), 3),
+        "p95_ms": round(_percentil(tiempos, 95), 3),
+        "media_ms": round(statistics.fmean(tiempos), 3),
+        "status": status,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Throughput de /auth/login bajo concurrencia")
+    parser.add_argument("--usuarios", type=int, default=20)
+    parser.add_argument("--peticiones", type=int, default=100)
+    parser.add_argument("--concurrencia", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=None, help="PASSWORD_HASH_WORKERS (0 = sin pool)")
+    parser.add_argument("--rounds", type=int, default=None, help="BCRYPT_ROUNDS")
+    parser.add_argument("--salida", default="bench_login.json", help="Archivo JSON de resultados")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bls_bench_login_") as tmpdir:
+        _preparar_entorno(Path(tmpdir))
+        # Deben fijarse antes de importar settings (se leen una vez)
+        if args.workers is not None:
+            os.environ["PASSWORD_HASH_WORKERS"] = str(args.workers)
+        if args.rounds is not None:
+            os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+        sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+        from Clever_MySQL_conn import Base, engine, SessionLocal
+        import models  # noqa: F401
+        import passwords
+        from seed_data import sembrar_datos
+        from settings import settings
+
+        Base.metadata.create_all(bind=engine)
+        with SessionLocal() as db:
+            info = sembrar_datos(db, n_estudiantes=args.usuarios, n_unidades=1, n_quizzes_por_unidad=0,
+                                 eventos_por_unidad=0, tareas_por_unidad=0, clases_por_unidad=0)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            resultado = asyncio.run(_ejecutar(args, info))
+        passwords.cerrar_pool()
+        engine.dispose()
+
+    salida = {
+        "git_rev": _git_rev(),
+        "parametros": {
+            "usuarios": args.usuarios,
+            "peticiones": args.peticiones,
+            "concurrencia": args.concurrencia,
+            "password_hash_workers": settings.PASSWORD_HASH_WORKERS,
+            "bcrypt_rounds": settings.BCRYPT_ROUNDS,
+        },
+        "resultado": resultado,
+    }
+    Path(args.salida).write_text(json.dumps(salida, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"workers={settings.PASSWORD_HASH_WORKERS} rounds={settings.BCRYPT_ROUNDS}: "
+          f"{resultado['logins_por_s']} logins/s  p50 {resultado['p50_ms']} ms  p95 {resultado['p95_ms']} ms  {resultado['status']}")
+    print(f"Resultados guardados en {args.salida}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""
+Borrado lógico con cascada diferida
+===================================
+
+Eliminar una unidad o un quiz solo marca `deleted_at` (un UPDATE, respuesta
+inmediata). Todas las consultas ORM ocultan las filas marcadas mediante un
+`with_loader_criteria` global; el borrado real de la fila y de sus dependientes
+lo hace `purgar_eliminados` en segundo plano, por bloques de BULK_CHUNK_SIZE
+con un commit por bloque, para no bloquear tablas en horario de clases.
+
+El purgado nunca borra historial calificado (actividad, progreso, entregas,
+calificaciones, respuestas e intentos, vivos o archivados) de una unidad
+eliminada: solo quita sus relaciones (estudiante_unidad, subcarpetas,
+asignaciones). Mientras quede historial, la unidad y sus quizzes se conservan
+marcados (ocultos) para que las FKs sigan siendo válidas. Borrar un quiz
+directamente sí elimina sus calificaciones y respuestas, como antes.
+
+Para ver las filas marcadas (p. ej. en el propio purgado) se usa la opción
+de ejecución `incluir_eliminados=True`.
+"""
+
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, delete, event, select, tuple_, update
+from sqlalchemy.orm import Session, with_loader_criteria
+
+from settings import settings
+
+# Entidades con columna deleted_at (las registra models.py)
+_ENTIDADES: List[type] = []
+
+_purgando = threading.Lock()
+
+
+def registrar(*entidades) -> None:
+    """Oculta las filas con deleted_at de las entidades dadas en todas las consultas ORM"""
+    _ENTIDADES.extend(entidades)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _ocultar_eliminados(orm_execute_state):
+    if (
+        not orm_execute_state.is_select
+        or orm_execute_state.execution_options.get("incluir_eliminados", False)
+    ):
+        return
+    orm_execute_state.statement = orm_execute_state.statement.options(*[
+        with_loader_criteria(entidad, lambda cls: cls.deleted_at.is_(None), include_aliases=True)
+        for entidad in _ENTIDADES
+    ])
+
+
+def solo_unidades_vivas(query, columna_unidad):
+    """
+    Une la query a las unidades sin deleted_at. Las tablas pivote (estudiante_unidad,
+    quiz_asignacion) no tienen deleted_at y with_loader_criteria no las filtra: sin
+    esta unión una unidad eliminada seguiría accesible por ellas hasta el purgado.
+    """
+    import models
+
+    unidad = models.Unidad.__table__
+    return query.join(unidad, and_(unidad.c.id == columna_unidad, unidad.c.deleted_at.is_(None)))
+
+
+def marcar_eliminados(db: Session, entidad, *condiciones) -> int:
+    """Marca deleted_at=ahora en las filas vivas que cumplen las condiciones (sin commit)"""
+    result = db.execute(
+        update(entidad)
+        .where(entidad.deleted_at.is_(None), *condiciones)
+        .values(deleted_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount or 0
+
+
+def borrar_por_bloques(db: Session, tabla, condicion, lote: int) -> int:
+    """DELETE por bloques de clave primaria (commit por bloque); devuelve filas borradas"""
+    claves = list(tabla.primary_key.columns)
+    total = 0
+    while True:
+        filas = db.execute(select(*claves).where(condicion).limit(lote)).all()
+        if not filas:
+            return total
+        if len(claves) == 1:
+            filtro = claves[0].in_([f[0] for f in filas])
+        else:
+            filtro = tuple_(*claves).in_([tuple(f) for f in filas])
+        total += db.execute(delete(tabla).where(filtro)).rowcount or 0
+        db.commit()
+
+
+def _pendientes(db: Session, entidad, *condiciones) -> List[int]:
+    return db.execute(
+        select(entidad.id).where(entidad.deleted_at.isnot(None), *condiciones).execution_options(incluir_eliminados=True)
+    ).scalars().all()
+
+
+def _tablas_historial():
+    """Historial calificado de los estudiantes (vivo y archivado); todas tienen unidad_id"""
+    import models
+
+    return (
+        models.ActividadEstudiante.__table__,
+        models.EstudianteProgresoUnidad.__table__,
+        models.TareaCalificacion.__table__,
+        models.UnidadCalificacionFinal.__table__,
+        models.EstudianteQuizCalificacion.__table__,
+        models.EstudianteQuizRespuesta.__table__,
+        models.EstudianteQuizIntento.__table__,
+        models.actividad_estudiante_archive,
+        models.estudiante_quiz_respuesta_archive,
+        models.tarea_calificacion_archive,
+    )
+
+
+def _referenciada(db: Session, tablas, columna: str, valor: int) -> bool:
+    return any(
+        db.execute(select(t.c[columna]).where(t.c[columna] == valor).limit(1)).first() is not None
+        for t in tablas
+    )
+
+
+def _purgar_quiz(db: Session, quiz_id: int, lote: int, conservar_historial: bool = False) -> Dict[str, int]:
+    """Borra las relaciones del quiz y, si no se conserva el historial, también sus
+    calificaciones y respuestas. El quiz se borra solo si ya nada lo referencia."""
+    import models
+
+    relaciones = [models.QuizAsignacion.__table__, models.EstudianteQuizPermiso.__table__]
+    historial = [
+        models.EstudianteQuizCalificacion.__table__,
+        models.EstudianteQuizRespuesta.__table__,
+        models.EstudianteQuizIntento.__table__,
+        models.estudiante_quiz_respuesta_archive,
+    ]
+    borradas = {}
+    for tabla in relaciones + ([] if conservar_historial else historial):
+        borradas[tabla.name] = borrar_por_bloques(db, tabla, tabla.c.quiz_id == quiz_id, lote)
+    if not _referenciada(db, historial, "quiz_id", quiz_id):
+        db.execute(delete(models.Quiz.__table__).where(models.Quiz.__table__.c.id == quiz_id))
+        borradas["quiz"] = 1
+    db.commit()
+    return borradas
+
+
+def _purgar_unidad(db: Session, unidad_id: int, lote: int) -> Dict[str, int]:
+    """Borra las relaciones de la unidad; la unidad solo se borra si no queda historial"""
+    import models
+
+    borradas = {}
+    for tabla in (
+        models.estudiante_unidad,
+        models.Subcarpeta.__table__,
+        models.QuizAsignacion.__table__,
+    ):
+        borradas[tabla.name] = borrar_por_bloques(db, tabla, tabla.c.unidad_id == unidad_id, lote)
+    if not _referenciada(db, _tablas_historial() + (models.Quiz.__table__,), "unidad_id", unidad_id):
+        # Clases y notificaciones conservan su historial, solo pierden la referencia
+        for tabla in (models.Clase.__table__, models.Notificacion.__table__, models.notificaciones_archive):
+            db.execute(update(tabla).where(tabla.c.unidad_id == unidad_id).values(unidad_id=None))
+        db.execute(delete(models.Unidad.__table__).where(models.Unidad.__table__.c.id == unidad_id))
+        borradas["unidad"] = 1
+    db.commit()
+    return borradas
+
+
+def purgar_eliminados(db: Optional[Session] = None, lote: Optional[int] = None) -> Dict[str, int]:
+    """
+    Cascada diferida: borra de verdad los quizzes y unidades marcados y sus relaciones
+    (el historial calificado de una unidad se conserva, ver arriba).
+    Es idempotente y retoma lo pendiente si una corrida anterior se interrumpió.
+
+    Args:
+        db: Sesión a usar (por defecto abre una propia, para BackgroundTasks)
+        lote: Filas por bloque (default BULK_CHUNK_SIZE)
+
+    Returns:
+        Dict tabla -> filas borradas (vacío si ya había un purgado en curso)
+    """
+    import models
+
+    if not _purgando.acquire(blocking=False):
+        return {}  # El purgado en curso vuelve a buscar pendientes antes de terminar
+    propia = db is None
+    if propia:
+        from Clever_MySQL_conn import SessionLocal
+        db = SessionLocal()
+    lote = max(1, lote or settings.BULK_CHUNK_SIZE)
+    totales: Dict[str, int] = {}
+
+    def _sumar(borradas: Dict[str, int]):
+        for tabla, n in borradas.items():
+            totales[tabla] = totales.get(tabla, 0) + n
+
+    try:
+        # Las unidades y quizzes que conservan historial quedan marcados: se revisan una vez por corrida
+        vistas, vistos = set(), set()
+        while True:
+            unidades = [u for u in _pendientes(db, models.Unidad) if u not in vistas]
+            if unidades:
+                # Los quizzes de una unidad eliminada caen con ella
+                marcar_eliminados(db, models.Quiz, models.Quiz.unidad_id.in_(unidades))
+                db.commit()
+            quizzes = [q for q in _pendientes(db, models.Quiz) if q not in vistos]
+            if not unidades and not quizzes:
+                break
+            # Un quiz que cae con su unidad conserva el historial; uno borrado directamente no
+            con_unidad = set(_pendientes(db, models.Quiz, models.Quiz.unidad_id.in_(
+                select(models.Unidad.id).where(models.Unidad.deleted_at.isnot(None))
+            )))
+            for quiz_id in quizzes:
+                _sumar(_purgar_quiz(db, quiz_id, lote, conservar_historial=quiz_id in con_unidad))
+                vistos.add(quiz_id)
+            for unidad_id in unidades:
+                _sumar(_purgar_unidad(db, unidad_id, lote))
+                vistas.add(unidad_id)
+        if totales:
+            print(f"DEBUG purgado de eliminados: {totales}")
+        return totales
+    except Exception as e:
+        db.rollback()
+        print(f"[WARN] Purgado de eliminados interrumpido (se retoma en la próxima corrida): {e}")
+        return totales
+    finally:
+        if propia:
+            db.close()
+        _purgando.release()
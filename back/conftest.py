@@ -0,0 +1,69 @@
+"""
+Fixtures de pytest sobre SQLite en memoria
+==========================================
+
+Permiten probar crud.py, grading_service.py y los endpoints sin MySQL:
+`DATABASE_URL` se fija antes de importar Clever_MySQL_conn, el esquema se
+crea desde `Base.metadata` en cada test y `seed` inserta datos de ejemplo.
+"""
+
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")  # bcrypt en el hilo del test (el pool se prueba aparte)
+
+import pytest
+
+from Clever_MySQL_conn import Base, engine, SessionLocal
+import models  # noqa: F401  (registra las tablas en Base.metadata)
+from seed_data import sembrar_datos
+
+
+@pytest.fixture
+def db_engine():
+    """Esquema completo creado desde los modelos y eliminado al terminar"""
+    import asignaciones_cache
+    import rate_limit
+    import revocaciones
+    asignaciones_cache.invalidar()  # Los ids se repiten entre tests: no arrastrar asignaciones cacheadas
+    rate_limit.reiniciar()  # Cada test empieza con las cubetas llenas
+    Base.metadata.create_all(bind=engine)
+    revocaciones.recargar()  # Base nueva: sin matrículas inactivas
+    yield engine
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def db(db_engine):
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def seed(db):
+    """Datos de ejemplo: admin, empresa, profesor, 3 estudiantes, 2 unidades, 2 quizzes"""
+    return sembrar_datos(db)
+
+
+@pytest.fixture
+def client(db_engine):
+    from fastapi.testclient import TestClient
+    from main import AcademyEnApp
+
+    with TestClient(AcademyEnApp) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def auth_headers(client, seed):
+    """Devuelve una función username -> cabeceras Authorization obtenidas vía /auth/login"""
+
+    def _headers(username: str) -> dict:
+        resp = client.post("/auth/login", json={"username": username, "password": seed["password"]})
+        assert resp.status_code == 200, resp.text
+        return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+    return _headers
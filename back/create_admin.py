@@ -14,13 +14,11 @@ from __future__ import annotations
 
 import argparse
 from sqlalchemy.orm import Session
-from passlib.context import CryptContext
 
 # Módulos del proyecto
 from Clever_MySQL_conn import SessionLocal, Base, engine
 import models
-
-bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from passwords import hash_password
 
 def ensure_tables():
     """Crea las tablas si aún no existen (idempotente)."""
@@ -35,7 +33,7 @@ def ensure_tables():
 
 
 def upsert_admin(db: Session, username: str, password: str, email: str):
-    hashed_pw = bcrypt_context.hash(password)
+    hashed_pw = hash_password(password)
 
     # Buscar por username primero
     user = db.query(models.Registro).filter(models.Registro.username == username).first()
@@ -3,14 +3,14 @@
 Script para crear las nuevas tablas necesarias para el sistema de respuestas de evaluaciones
 """
 
-from Clever_MySQL_conn import engine, Base
-import models
+from Clever_MySQL_conn import engine
+from migrate import aplicar_migraciones
 
 def create_tables():
     """Crear todas las tablas definidas en los modelos"""
     try:
         print("Creando tablas...")
-        Base.metadata.create_all(bind=engine)
+        aplicar_migraciones()  # Tablas faltantes + índices versionados
         print("✅ Tablas creadas exitosamente")
         
         # Mostrar las tablas que se crearon
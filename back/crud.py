@@ -1,11 +1,14 @@
 # crud.py
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, or_, case, func, null, select
 # Importaciones necesarias para Jinja2
 from jinja2 import Environment, FileSystemLoader, select_autoescape
-from passlib.context import CryptContext
 from fastapi import BackgroundTasks, Request, HTTPException
 from pydantic import EmailStr
 import uuid
+import hashlib
+import secrets
 from datetime import datetime, timedelta
 from pathlib import Path
 import os
@@ -24,17 +27,23 @@ from email.mime.multipart import MIMEMultipart
 
 import models, schemas
 from config import conf
+from upserts import upsert
+from pagination import Pagina, paginar
 from settings import settings
+import borrado_logico
+import passwords
+import asignaciones_cache
+import revocaciones
 
-bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+bcrypt_context = passwords.bcrypt_context  # Compatibilidad: hash/verify van por passwords.py
 
+# Orden estable de los listados de usuarios (clave del cursor de paginación)
+ORDEN_USUARIOS = [(models.Registro.username, False), (models.Registro.identificador, False)]
 
 
-# Función para registrar un nuevo usuario (sin cambios aquí)
-async def registro_user(db: Session, user: schemas.RegistroCreate, background_tasks: BackgroundTasks, request: Request):
-    print(f"DEBUG CRUD: Iniciando registro para usuario: {user.username}, email: {user.email}")
-    print(f"DEBUG CRUD: Datos completos recibidos: {user.dict()}")
 
+# Función para registrar un nuevo usuario (sin cambios aquí)
+def _validar_registro_nuevo(db: Session, user: schemas.RegistroCreate) -> None:
     existing_user_email = db.query(models.Registro).filter(models.Registro.email == user.email).first()
     if existing_user_email:
         print(f"DEBUG CRUD: ERROR - Email {user.email} ya registrado.")
@@ -45,10 +54,7 @@ async def registro_user(db: Session, user: schemas.RegistroCreate, background_ta
         print(f"DEBUG CRUD: ERROR - Nombre de usuario {user.username} ya registrado.")
         raise HTTPException(status_code=400, detail="El nombre de usuario ya está registrado.")
 
-    verification_token = str(uuid.uuid4())
-    token_expires_at = datetime.utcnow() + timedelta(hours=24)
-
-    hashed_pw = bcrypt_context.hash(user.password)
+def _guardar_registro(db: Session, user: schemas.RegistroCreate, hashed_pw: str):
     nuevo_registro = models.Registro(
         username=user.username,
         hashed_password=hashed_pw,
@@ -56,13 +62,12 @@ async def registro_user(db: Session, user: schemas.RegistroCreate, background_ta
         apellidos=user.apellidos,
         email=user.email,
         email_verified=False,
-        verification_token=verification_token,
         tipo_usuario=user.tipo_usuario,
-        token_expires_at=token_expires_at
     )
 
     try:
         db.add(nuevo_registro)
+        verification_token = crear_token_email(db, nuevo_registro.username, "verificacion", horas=24)
         print("DEBUG CRUD: Objeto de usuario añadido a la sesión de DB.")
         db.commit()
         print("DEBUG CRUD: Commit a la base de datos realizado.")
@@ -72,6 +77,17 @@ async def registro_user(db: Session, user: schemas.RegistroCreate, background_ta
         db.rollback()
         print(f"DEBUG CRUD: ERROR FATAL en la base de datos durante el commit: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno del servidor al guardar usuario: {e}")
+    return nuevo_registro, verification_token
+
+async def registro_user(db: AsyncSession, user: schemas.RegistroCreate, background_tasks: BackgroundTasks, request: Request):
+    """Registra el usuario con una AsyncSession: las consultas y el commit corren
+    en run_sync y el hash de bcrypt en el pool, sin bloquear el event loop."""
+    print(f"DEBUG CRUD: Iniciando registro para usuario: {user.username}, email: {user.email}")
+    print(f"DEBUG CRUD: Datos completos recibidos: {user.dict()}")
+
+    await db.run_sync(_validar_registro_nuevo, user)
+    hashed_pw = await passwords.hash_password_async(user.password)  # bcrypt fuera del event loop
+    nuevo_registro, verification_token = await db.run_sync(_guardar_registro, user, hashed_pw)
 
     base_url_str = str(request.base_url)
     path_to_verify = f"auth/verify-email?token={verification_token}"
@@ -97,10 +113,119 @@ async def registro_user(db: Session, user: schemas.RegistroCreate, background_ta
 # Función para autenticar un usuario (sin cambios aquí)
 def autenticar_usuario(db: Session, username: str, password: str):
     user = db.query(models.Registro).filter(models.Registro.username == username).first()
-    if user and bcrypt_context.verify(password, user.hashed_password):
+    if user and passwords.verify_password(password, user.hashed_password):
+        if passwords.necesita_rehash(user.hashed_password):
+            # Cambió BCRYPT_ROUNDS: regenerar el hash ahora que tenemos la contraseña en claro
+            try:
+                user.hashed_password = passwords.hash_password(password)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                print(f"[WARN] No se pudo actualizar el hash de {username}: {e}")
         return user
     return None
 
+def _hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+# ===== Refresh tokens (rotación con detección de reuso) =====
+def crear_refresh_token(db: Session, username: str) -> str:
+    """Emite un refresh token opaco y guarda su hash; no hace commit"""
+    token = secrets.token_urlsafe(32)
+    db.add(models.RefreshToken(
+        token_hash=_hash_token(token),
+        username=username,
+        expires_at=datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return token
+
+def revocar_refresh_tokens(db: Session, username: str) -> int:
+    """Revoca todos los refresh tokens vigentes del usuario; no hace commit"""
+    return db.query(models.RefreshToken).filter(
+        models.RefreshToken.username == username,
+        models.RefreshToken.revoked_at.is_(None),
+    ).update({models.RefreshToken.revoked_at: datetime.utcnow()}, synchronize_session=False)
+
+def usar_refresh_token(db: Session, token: str) -> models.RefreshToken | None:
+    """Valida y revoca (rota) el refresh token. Devuelve la fila o None si no sirve.
+    La revocación es un UPDATE condicional: de dos usos concurrentes del mismo token solo
+    uno lo revoca (rowcount == 1); el otro cuenta como reuso.
+    Si el token ya estaba revocado, se revocan todos los del usuario (reuso = posible robo)."""
+    token_hash = _hash_token(token)
+    ahora = datetime.utcnow()
+    revocado = db.query(models.RefreshToken).filter(
+        models.RefreshToken.token_hash == token_hash,
+        models.RefreshToken.revoked_at.is_(None),
+        models.RefreshToken.expires_at > ahora,
+    ).update({models.RefreshToken.revoked_at: ahora}, synchronize_session=False)
+    fila = db.query(models.RefreshToken).filter(
+        models.RefreshToken.token_hash == token_hash
+    ).execution_options(populate_existing=True).first()
+    if revocado == 1:
+        return fila
+    if fila is not None and fila.revoked_at is not None:
+        print(f"[WARN] Reuso de refresh token revocado para {fila.username}: se revocan todos sus tokens")
+        revocar_refresh_tokens(db, fila.username)
+        db.commit()
+    return None
+
+# ===== Tokens de un solo uso por correo (verificación y reset de contraseña) =====
+def crear_token_email(db: Session, username: str, proposito: str, horas: int) -> str:
+    """Emite un token (reemplaza al anterior del mismo propósito) y guarda su hash; no hace commit"""
+    eliminar_tokens_email(db, username, proposito)
+    token = secrets.token_urlsafe(32)
+    db.add(models.TokenEmail(
+        token_hash=_hash_token(token),
+        proposito=proposito,
+        username=username,
+        expires_at=datetime.utcnow() + timedelta(hours=horas),
+    ))
+    return token
+
+def obtener_token_email(db: Session, token: str, proposito: str) -> models.TokenEmail | None:
+    """Busca el token por clave primaria (vencido o no: el llamador decide)"""
+    fila = db.get(models.TokenEmail, _hash_token(token))
+    return fila if fila is not None and fila.proposito == proposito else None
+
+def eliminar_tokens_email(db: Session, username: str, proposito: str) -> int:
+    """Invalida los tokens del usuario para ese propósito; no hace commit"""
+    return db.query(models.TokenEmail).filter(
+        models.TokenEmail.username == username,
+        models.TokenEmail.proposito == proposito,
+    ).delete(synchronize_session=False)
+
+def purgar_tokens_vencidos(db: Session | None = None, lote: int | None = None) -> dict:
+    """
+    Borra por bloques los tokens de correo y refresh tokens vencidos (commit por bloque)
+
+    Args:
+        db: Sesión a usar (por defecto abre una propia, para BackgroundTasks)
+        lote: Filas por bloque (default BULK_CHUNK_SIZE)
+
+    Returns:
+        Dict tabla -> filas borradas
+    """
+    propia = db is None
+    if propia:
+        from Clever_MySQL_conn import SessionLocal
+        db = SessionLocal()
+    lote = max(1, lote or settings.BULK_CHUNK_SIZE)
+    ahora = datetime.utcnow()
+    borradas = {}
+    try:
+        for tabla in (models.TokenEmail.__table__, models.RefreshToken.__table__):
+            borradas[tabla.name] = borrado_logico.borrar_por_bloques(db, tabla, tabla.c.expires_at < ahora, lote)
+        if any(borradas.values()):
+            print(f"DEBUG purgado de tokens vencidos: {borradas}")
+        return borradas
+    except Exception as e:
+        db.rollback()
+        print(f"[WARN] Purgado de tokens vencidos interrumpido: {e}")
+        return borradas
+    finally:
+        if propia:
+            db.close()
+
 # --- FUNCIÓN send_verification_email CORREGIDA ---
 # Aquí se usa exclusivamente aiosmtplib para construir y enviar el correo.
 async def send_verification_email(recipient_email: EmailStr, username: str, verification_url: str, background_tasks: BackgroundTasks, request: Request):
@@ -222,8 +347,9 @@ async def send_reset_password_email(recipient_email: EmailStr, username: str, re
     background_tasks.add_task(_send_email_task)
     print("DEBUG RESET EMAIL: Tarea de envío programada.")
 
-def obtener_estudiantes_disponibles(db):
-    return db.query(models.Registro).filter(models.Registro.tipo_usuario == "estudiante").all()
+def obtener_estudiantes_disponibles(db, pagina: Pagina | None = None):
+    q = db.query(models.Registro).filter(models.Registro.tipo_usuario == "estudiante")
+    return paginar(q, ORDEN_USUARIOS, pagina)
 
 # Obtener clases de un profesor por su identificador
 def obtener_clases_profesor(db, profesor_username):
@@ -307,15 +433,15 @@ def obtener_clases_estudiante(db, estudiante_username):
 def eliminar_clases_antiguas(db: Session, dias: int = 15, profesor_username: str | None = None) -> int:
     from models import Clase, clase_estudiante
     limite_dt = datetime.utcnow() - timedelta(days=dias)
+    bloque = max(1, settings.BULK_CHUNK_SIZE)
 
-    # Traer clases candidatas
-    q = db.query(Clase)
+    # Recorrer solo (id, dia, hora) en streaming (cursor del servidor, bloques de `bloque` filas)
+    q = db.query(Clase.id, Clase.dia, Clase.hora)
     if profesor_username:
         q = q.filter(Clase.profesor_username == profesor_username)
 
-    clases = q.all()
     a_eliminar = []
-    for c in clases:
+    for c in q.execution_options(stream_results=True, yield_per=bloque):
         try:
             # c.dia formato 'YYYY-MM-DD', c.hora 'HH:MM' o 'HH:MM:SS'
             hora = (c.hora or '00:00')[:5]
@@ -324,23 +450,20 @@ def eliminar_clases_antiguas(db: Session, dias: int = 15, profesor_username: str
             # Si hay error parseando, no eliminar por seguridad
             continue
         if fecha_hora < limite_dt:
-            a_eliminar.append(c)
+            a_eliminar.append(c.id)
 
+    # Borrado masivo por bloques de ids, con commit por bloque
     count = 0
-    for c in a_eliminar:
+    for i in range(0, len(a_eliminar), bloque):
+        ids = a_eliminar[i:i + bloque]
         try:
             # Borrar relaciones en tabla pivot
-            db.execute(
-                clase_estudiante.delete().where(clase_estudiante.c.clase_id == c.id)
-            )
-            db.delete(c)
-            count += 1
+            db.execute(clase_estudiante.delete().where(clase_estudiante.c.clase_id.in_(ids)))
+            count += db.execute(Clase.__table__.delete().where(Clase.id.in_(ids))).rowcount or 0
+            db.commit()
         except Exception:
             db.rollback()
             continue
-
-    if count:
-        db.commit()
     return count
 
 # Eliminar una clase por ID (incluye limpieza de relaciones pivot)
@@ -361,42 +484,69 @@ def eliminar_clase(db: Session, clase_id: int) -> bool:
         return False
 
 # crud.py
-def obtener_profesores(db):
-    return db.query(models.Registro).filter(models.Registro.tipo_usuario == "profesor").all()
+def obtener_profesores(db, pagina: Pagina | None = None):
+    q = db.query(models.Registro).filter(models.Registro.tipo_usuario == "profesor")
+    return paginar(q, ORDEN_USUARIOS, pagina)
 
-def obtener_estudiantes(db):
-    """Obtiene todos los estudiantes registrados en la plataforma"""
-    return db.query(models.Registro).filter(models.Registro.tipo_usuario == "estudiante").all()
+def obtener_estudiantes(db, pagina: Pagina | None = None):
+    """Obtiene los estudiantes registrados en la plataforma (paginados si se pasa `pagina`)"""
+    q = db.query(models.Registro).filter(models.Registro.tipo_usuario == "estudiante")
+    return paginar(q, ORDEN_USUARIOS, pagina)
 
 def toggle_matricula_estudiante(db: Session, username: str):
     """Activa o desactiva la matrícula de un estudiante"""
     estudiante = db.query(models.Registro).filter(models.Registro.username == username).first()
     if estudiante:
         estudiante.matricula_activa = not estudiante.matricula_activa
+        if not estudiante.matricula_activa:
+            # Sin matrícula no se renuevan sesiones
+            revocar_refresh_tokens(db, username)
+        # El historial se mueve en segundo plano (archivo.procesar_pendientes)
+        estudiante.historial_pendiente = True
         db.commit()
         db.refresh(estudiante)
+        revocaciones.actualizar(estudiante.username, estudiante.matricula_activa)
     return estudiante
 
 # Funciones CRUD para gestión de unidades
 def sincronizar_unidades(db: Session, unidades_frontend: list):
-    """Sincroniza las unidades del frontend con la base de datos"""
-    # Primero eliminar las relaciones en estudiante_unidad
-    db.execute(models.estudiante_unidad.delete())
-    db.commit()
-    
-    # Luego eliminar las unidades existentes
-    db.query(models.Unidad).delete()
-    db.commit()
-    
-    # Insertar nuevas unidades
-    for i, unidad in enumerate(unidades_frontend):
-        nueva_unidad = models.Unidad(
-            nombre=unidad.get('nombre', ''),
-            descripcion=unidad.get('descripcion', ''),
-            orden=i + 1
-        )
-        db.add(nueva_unidad)
-    
+    """Sincroniza las unidades del frontend con la base de datos.
+    Cada unidad recibida se empareja con una existente por id (o, si no trae id, por nombre)
+    y se actualiza en su lugar, conservando su id y todo lo que cuelga de ella. Solo las
+    unidades que ya no vienen (y sus quizzes) se marcan como eliminadas; sus relaciones
+    se borran en segundo plano (borrado_logico.purgar_eliminados).
+    """
+    existentes = db.query(models.Unidad).order_by(models.Unidad.orden, models.Unidad.id).all()
+    por_id = {u.id: u for u in existentes}
+    por_nombre = {}
+    for u in existentes:
+        por_nombre.setdefault((u.nombre or '').strip().lower(), u)
+
+    usadas = set()
+    for i, datos in enumerate(unidades_frontend):
+        try:
+            unidad = por_id.get(int(datos.get('id')))
+        except (TypeError, ValueError):
+            unidad = None
+        if unidad is None:
+            unidad = por_nombre.get((datos.get('nombre') or '').strip().lower())
+        if unidad is None or unidad.id in usadas:
+            unidad = models.Unidad(nombre=datos.get('nombre', ''), descripcion=datos.get('descripcion', ''))
+            db.add(unidad)
+        else:
+            usadas.add(unidad.id)
+            if 'nombre' in datos:
+                unidad.nombre = datos['nombre']
+            if 'descripcion' in datos:
+                unidad.descripcion = datos['descripcion']
+        unidad.orden = i + 1
+
+    # Marcar como eliminadas (con sus quizzes) solo las unidades que ya no existen en el frontend
+    sobrantes = [u.id for u in existentes if u.id not in usadas]
+    if sobrantes:
+        borrado_logico.marcar_eliminados(db, models.Quiz, models.Quiz.unidad_id.in_(sobrantes))
+        borrado_logico.marcar_eliminados(db, models.Unidad, models.Unidad.id.in_(sobrantes))
+
     db.commit()
     return {"message": f"Se sincronizaron {len(unidades_frontend)} unidades"}
 
@@ -486,78 +636,59 @@ def calcular_nota_unidad(db: Session, username: str, unidad_id: int) -> dict:
 
 def upsert_tarea_calificacion(db: Session, *, estudiante_username: str, unidad_id: int, filename: str, score: int):
     from models import TareaCalificacion
-    row = db.query(TareaCalificacion).filter(
-        TareaCalificacion.estudiante_username == estudiante_username,
-        TareaCalificacion.unidad_id == unidad_id,
-        TareaCalificacion.filename == filename,
-    ).first()
     now = datetime.utcnow()
-    if row:
-        row.score = int(score)
-        row.updated_at = now
-        db.add(row)
-    else:
-        row = TareaCalificacion(
-            estudiante_username=estudiante_username,
-            unidad_id=unidad_id,
-            filename=filename,
-            score=int(score),
-            created_at=now,
-            updated_at=now,
-        )
-        db.add(row)
+    row_id = upsert(
+        db,
+        TareaCalificacion,
+        {
+            "estudiante_username": estudiante_username,
+            "unidad_id": unidad_id,
+            "filename": filename,
+            "score": int(score),
+            "created_at": now,
+            "updated_at": now,
+        },
+        claves=["estudiante_username", "unidad_id", "filename"],
+        actualizar=lambda c, nuevos: [("score", nuevos.score), ("updated_at", nuevos.updated_at)],
+    )
     db.commit()
-    db.refresh(row)
-    return row
+    return db.get(TareaCalificacion, row_id, populate_existing=True)
+
+def _actualizar_quiz_calificacion(c, nuevos):
+    # Si la calificación fue fijada manualmente por un profesor, no la sobreescribimos.
+    # Si la nota cambia, reiniciamos el estado de aprobación para que el profesor vuelva a validar.
+    cambia = and_(
+        func.coalesce(c.origen_manual, False).is_(False),
+        or_(c.score.is_(None), c.score != nuevos.score),
+    )
+    return [
+        ("updated_at", case((cambia, nuevos.updated_at), else_=c.updated_at)),
+        ("aprobada", case((cambia, False), else_=c.aprobada)),
+        ("aprobada_por", case((cambia, null()), else_=c.aprobada_por)),
+        ("aprobada_at", case((cambia, null()), else_=c.aprobada_at)),
+        ("score", case((cambia, nuevos.score), else_=c.score)),  # Último: MySQL evalúa en orden
+    ]
 
 def upsert_quiz_calificacion(db: Session, *, estudiante_username: str, unidad_id: int, quiz_id: int, score: int):
     from models import EstudianteQuizCalificacion
-    row = db.query(EstudianteQuizCalificacion).filter(
-        EstudianteQuizCalificacion.estudiante_username == estudiante_username,
-        EstudianteQuizCalificacion.unidad_id == unidad_id,
-        EstudianteQuizCalificacion.quiz_id == quiz_id,
-    ).first()
     now = datetime.utcnow()
-    if row:
-        # Si la calificación fue fijada manualmente por un profesor, no la sobreescribimos
-        is_manual = False
-        try:
-            is_manual = bool(getattr(row, "origen_manual", False))
-        except Exception:
-            is_manual = False
-
-        if not is_manual:
-            new_score = int(score)
-            # Si la nota cambia, reiniciamos el estado de aprobación para que el profesor vuelva a validar
-            if row.score != new_score:
-                row.score = new_score
-                row.updated_at = now
-                try:
-                    row.aprobada = False
-                    row.aprobada_por = None
-                    row.aprobada_at = None
-                except Exception:
-                    # Compatibilidad si aún no existen las columnas
-                    pass
-            db.add(row)
-    else:
-        new_score = int(score)
-        row = EstudianteQuizCalificacion(
-            estudiante_username=estudiante_username,
-            unidad_id=unidad_id,
-            quiz_id=quiz_id,
-            score=new_score,
-            created_at=now,
-            updated_at=now,
-        )
-        try:
-            row.aprobada = False
-        except Exception:
-            pass
-        db.add(row)
+    row_id = upsert(
+        db,
+        EstudianteQuizCalificacion,
+        {
+            "estudiante_username": estudiante_username,
+            "unidad_id": unidad_id,
+            "quiz_id": quiz_id,
+            "score": int(score),
+            "created_at": now,
+            "updated_at": now,
+            "aprobada": False,
+        },
+        claves=["estudiante_username", "unidad_id", "quiz_id"],
+        actualizar=_actualizar_quiz_calificacion,
+    )
     db.commit()
-    db.refresh(row)
-    return row
+    return db.get(EstudianteQuizCalificacion, row_id, populate_existing=True)
 
 def get_unidad_grade_detalle(db: Session, *, username: str, unidad_id: int) -> dict:
     from models import TareaCalificacion, EstudianteQuizCalificacion, EstudianteProgresoUnidad
@@ -674,20 +805,17 @@ def actualizar_unidad(db: Session, unidad_id: int, data: dict):
     return {"id": u.id, "nombre": u.nombre, "descripcion": u.descripcion, "orden": u.orden}
 
 def eliminar_unidad(db: Session, unidad_id: int) -> bool:
-    """Elimina una unidad y limpia relaciones en estudiante_unidad."""
+    """Marca la unidad (y sus quizzes) como eliminada. Las relaciones en estudiante_unidad
+    y demás dependientes se borran en segundo plano (borrado_logico.purgar_eliminados)."""
     print(f"[CRUD] eliminar_unidad() id={unidad_id}")
     u = db.query(models.Unidad).filter(models.Unidad.id == unidad_id).first()
     if not u:
         return False
     try:
-        # Borrar relaciones pivot si existen
-        db.execute(
-            models.estudiante_unidad.delete().where(
-                models.estudiante_unidad.c.unidad_id == unidad_id
-            )
-        )
-        db.delete(u)
+        borrado_logico.marcar_eliminados(db, models.Quiz, models.Quiz.unidad_id == unidad_id)
+        borrado_logico.marcar_eliminados(db, models.Unidad, models.Unidad.id == unidad_id)
         db.commit()
+        db.expunge(u)
         print(f"[CRUD] eliminar_unidad() ok id={unidad_id}")
         return True
     except Exception:
@@ -845,7 +973,7 @@ def obtener_unidades_habilitadas_estudiante(db: Session, username: str):
         return []
     
     # Verificar si el estudiante tiene alguna configuración de unidades
-    tiene_configuracion = db.query(models.estudiante_unidad).filter(
+    tiene_configuracion = borrado_logico.solo_unidades_vivas(db.query(models.estudiante_unidad), models.estudiante_unidad.c.unidad_id).filter(
         models.estudiante_unidad.c.estudiante_id == estudiante.identificador
     ).first()
     
@@ -914,7 +1042,7 @@ def obtener_unidades_habilitadas_estudiante(db: Session, username: str):
         })
     
     # Obtener también las unidades que no tienen configuración específica (están habilitadas por defecto)
-    unidades_configuradas = db.query(models.estudiante_unidad.c.unidad_id).filter(
+    unidades_configuradas = borrado_logico.solo_unidades_vivas(db.query(models.estudiante_unidad.c.unidad_id), models.estudiante_unidad.c.unidad_id).filter(
         models.estudiante_unidad.c.estudiante_id == estudiante.identificador
     ).all()
     
@@ -969,8 +1097,9 @@ def crear_notificacion(db: Session, *, usuario_id: int, tipo: str, mensaje: str,
         "unidad_id": n.unidad_id,
     }
 
-def listar_notificaciones_usuario(db: Session, usuario_id: int) -> list[dict]:
-    filas = db.query(models.Notificacion).filter(models.Notificacion.usuario_id == usuario_id).order_by(models.Notificacion.fecha_creacion.desc(), models.Notificacion.id.desc()).all()
+def listar_notificaciones_usuario(db: Session, usuario_id: int, pagina: Pagina | None = None) -> list[dict]:
+    q = db.query(models.Notificacion).filter(models.Notificacion.usuario_id == usuario_id)
+    filas = paginar(q, [(models.Notificacion.fecha_creacion, True), (models.Notificacion.id, True)], pagina)
     return [{
         "id": n.id,
         "usuario_id": n.usuario_id,
@@ -1031,7 +1160,7 @@ def obtener_estado_unidades_estudiante(db: Session, username: str):
     
     # Obtener configuraciones del estudiante
     configuraciones = {}
-    relaciones = db.query(models.estudiante_unidad).filter(
+    relaciones = borrado_logico.solo_unidades_vivas(db.query(models.estudiante_unidad), models.estudiante_unidad.c.unidad_id).filter(
         models.estudiante_unidad.c.estudiante_id == estudiante.identificador
     ).all()
     
@@ -1061,7 +1190,7 @@ def obtener_estado_unidades_estudiante(db: Session, username: str):
     return resultado
 
 # Funciones CRUD para gestión de asignaciones profesor-estudiante
-def obtener_estudiantes_asignados(db: Session, profesor_username: str):
+def obtener_estudiantes_asignados(db: Session, profesor_username: str, pagina: Pagina | None = None):
     """Obtiene los estudiantes asignados a un profesor"""
     profesor = db.query(models.Registro).filter(
         models.Registro.username == profesor_username,
@@ -1071,15 +1200,13 @@ def obtener_estudiantes_asignados(db: Session, profesor_username: str):
     if not profesor:
         return []
     
-    estudiantes = db.query(models.Registro).join(
-        models.profesor_estudiante,
-        models.Registro.identificador == models.profesor_estudiante.c.estudiante_id
-    ).filter(
-        models.profesor_estudiante.c.profesor_id == profesor.identificador,
-        models.Registro.tipo_usuario == "estudiante"
-    ).all()
+    # Ids desde la caché de asignaciones (sin join con profesor_estudiante)
+    ids = list(asignaciones_cache.estudiantes_de(db, profesor.identificador).values())
+    if not ids:
+        return []
+    q = db.query(models.Registro).filter(models.Registro.identificador.in_(ids))
     
-    return estudiantes
+    return paginar(q, ORDEN_USUARIOS, pagina)
 
 def asignar_estudiante_profesor(db: Session, profesor_username: str, estudiante_username: str):
     """Asigna un estudiante a un profesor"""
@@ -1115,6 +1242,7 @@ def asignar_estudiante_profesor(db: Session, profesor_username: str, estudiante_
         )
     )
     db.commit()
+    asignaciones_cache.invalidar(profesor.identificador)
     return True
 
 # ==========================
@@ -1122,23 +1250,21 @@ def asignar_estudiante_profesor(db: Session, profesor_username: str, estudiante_
 # ==========================
 
 def _ensure_progreso_row(db: Session, username: str, unidad_id: int):
-    row = db.query(models.EstudianteProgresoUnidad).filter(
-        models.EstudianteProgresoUnidad.username == username,
-        models.EstudianteProgresoUnidad.unidad_id == unidad_id
-    ).first()
-    if not row:
-        row = models.EstudianteProgresoUnidad(
-            username=username,
-            unidad_id=unidad_id,
-            porcentaje_completado=0,
-            score=0,
-            tiempo_dedicado_min=0,
-            ultima_actividad_at=datetime.utcnow()
-        )
-        db.add(row)
-        db.commit()
-        db.refresh(row)
-    return row
+    # Inserta la fila si falta (una sola sentencia, sin duplicados concurrentes); no hace commit
+    row_id = upsert(
+        db,
+        models.EstudianteProgresoUnidad,
+        {
+            "username": username,
+            "unidad_id": unidad_id,
+            "porcentaje_completado": 0,
+            "score": 0,
+            "tiempo_dedicado_min": 0,
+            "ultima_actividad_at": datetime.utcnow(),
+        },
+        claves=["username", "unidad_id"],
+    )
+    return db.get(models.EstudianteProgresoUnidad, row_id, populate_existing=True)
 
 def track_activity(db: Session, username: str, unidad_id: int, tipo_evento: str, duracion_min: int | None = None, metadata: dict | None = None):
     evento = models.ActividadEstudiante(
@@ -1151,16 +1277,49 @@ def track_activity(db: Session, username: str, unidad_id: int, tipo_evento: str,
     )
     db.add(evento)
 
-    # Acumular tiempo si corresponde
+    # Acumular tiempo si corresponde (incremento atómico en la base, sin leer la fila)
     if duracion_min and duracion_min > 0:
-        row = _ensure_progreso_row(db, username, unidad_id)
-        row.tiempo_dedicado_min = (row.tiempo_dedicado_min or 0) + int(duracion_min)
-        row.ultima_actividad_at = datetime.utcnow()
-        db.add(row)
+        incrementar_progreso(db, username, unidad_id, add_min=int(duracion_min))
 
     db.commit()
     return {"ok": True}
 
+def incrementar_progreso(db: Session, username: str, unidad_id: int, add_min: int = 0, add_score: int = 0) -> int:
+    """
+    Suma minutos y/o puntos al progreso de la unidad en una sola sentencia
+    (upsert con tiempo_dedicado_min + :n y LEAST(100, score + :n)), de modo que
+    dos heartbeats simultáneos no se pisen. No hace commit.
+
+    Returns:
+        id de la fila de progreso
+    """
+    add_min = max(0, int(add_min or 0))
+    add_score = max(0, int(add_score or 0))
+
+    def _actualizar(c, nuevos):
+        asignaciones = [
+            ("tiempo_dedicado_min", func.coalesce(c.tiempo_dedicado_min, 0) + nuevos.tiempo_dedicado_min),
+            ("ultima_actividad_at", nuevos.ultima_actividad_at),
+        ]
+        if add_score:
+            asignaciones.append(("score", func.least(100, func.coalesce(c.score, 0) + add_score)))
+        return asignaciones
+
+    return upsert(
+        db,
+        models.EstudianteProgresoUnidad,
+        {
+            "username": username,
+            "unidad_id": unidad_id,
+            "porcentaje_completado": 0,
+            "score": min(100, add_score),
+            "tiempo_dedicado_min": add_min,
+            "ultima_actividad_at": datetime.utcnow(),
+        },
+        claves=["username", "unidad_id"],
+        actualizar=_actualizar,
+    )
+
 def upsert_progreso_score(db: Session, username: str, unidad_id: int, porcentaje_completado: int | None = None, score: int | None = None):
     row = _ensure_progreso_row(db, username, unidad_id)
     if porcentaje_completado is not None:
@@ -1527,6 +1686,7 @@ def desasignar_estudiante_profesor(db: Session, profesor_username: str, estudian
         )
     )
     db.commit()
+    asignaciones_cache.invalidar(profesor.identificador)
     return True
 
 # ===== Permisos de Quiz por Estudiante =====
@@ -1582,6 +1742,23 @@ def obtener_permisos_quiz_estudiante(db: Session, estudiante_username: str):
     ).all()
     return permisos
 
+def select_quizzes_disponibles(estudiante_id: int, now: datetime):
+    """Select de quizzes con asignación vigente en unidades habilitadas del estudiante
+    (Quiz -> QuizAsignacion -> estudiante_unidad). Se usa desde el endpoint asíncrono
+    y desde las pruebas de planes de ejecución.
+    """
+    return (
+        select(models.Quiz)
+        .join(models.QuizAsignacion, models.Quiz.id == models.QuizAsignacion.quiz_id)
+        .join(models.estudiante_unidad, models.estudiante_unidad.c.unidad_id == models.QuizAsignacion.unidad_id)
+        .where(
+            models.estudiante_unidad.c.estudiante_id == estudiante_id,
+            (models.QuizAsignacion.start_at.is_(None) | (models.QuizAsignacion.start_at <= now)),
+            (models.QuizAsignacion.end_at.is_(None) | (models.QuizAsignacion.end_at >= now)),
+        )
+        .order_by(models.Quiz.created_at.desc())
+    )
+
 def verificar_permiso_quiz_estudiante(db: Session, estudiante_username: str, quiz_id: int) -> bool:
     """Verifica si un estudiante tiene permiso para acceder a un quiz.
     Retorna True si está habilitado (o no existe registro = habilitado por defecto)
@@ -12,10 +12,12 @@ from typing import List, Optional
 from pydantic import BaseModel, Field
 from datetime import datetime
 
-from Clever_MySQL_conn import get_db
+from Clever_MySQL_conn import get_db, get_read_db
 from grading_service import GradingService
-from auth_routes import require_roles, get_current_user_from_token
+from auth_routes import require_roles, require_usuario_roles
 import models
+from pagination import iterar_por_bloques
+from settings import settings
 
 # Router para calificaciones
 grading_router = APIRouter(prefix="/api/v2/grades", tags=["Calificaciones V2"])
@@ -44,6 +46,7 @@ class ManualOverrideRequest(BaseModel):
 @grading_router.get("/estudiantes/{username}/resumen")
 def get_student_grades_summary(
     username: str,
+    incluir_archivo: bool = False,
     db: Session = Depends(get_db),
     current_user = Depends(require_roles(["profesor", "empresa", "admin"]))
 ):
@@ -51,10 +54,11 @@ def get_student_grades_summary(
     Obtiene resumen completo de calificaciones de un estudiante
     
     - **username**: Username del estudiante
+    - **incluir_archivo**: Incluir calificaciones archivadas (estudiantes con matrícula desactivada)
     - **Returns**: Resumen completo con todas las unidades y calificaciones
     """
     try:
-        grading_service = GradingService(db)
+        grading_service = GradingService(db, incluir_archivo=incluir_archivo)
         result = grading_service.get_student_grades_summary(username)
         
         if not result.get("success", True):
@@ -71,6 +75,7 @@ def get_student_grades_summary(
 def get_unit_grade_detail(
     username: str,
     unidad_id: int,
+    incluir_archivo: bool = False,
     db: Session = Depends(get_db),
     current_user = Depends(require_roles(["profesor", "empresa", "admin"]))
 ):
@@ -79,10 +84,11 @@ def get_unit_grade_detail(
     
     - **username**: Username del estudiante
     - **unidad_id**: ID de la unidad
+    - **incluir_archivo**: Incluir calificaciones archivadas (estudiantes con matrícula desactivada)
     - **Returns**: Calificación detallada con todos los componentes
     """
     try:
-        grading_service = GradingService(db)
+        grading_service = GradingService(db, incluir_archivo=incluir_archivo)
         result = grading_service.calculate_unit_grade(username, unidad_id)
         
         if result.get("error"):
@@ -99,7 +105,7 @@ def get_unit_grade_detail(
 def update_task_grade(
     request: TaskGradeRequest,
     db: Session = Depends(get_db),
-    current_user = Depends(require_roles(["profesor", "empresa", "admin"]))
+    current_user: models.Registro = Depends(require_usuario_roles(["profesor", "empresa", "admin"]))
 ):
     """
     Actualiza calificación de una tarea
@@ -127,7 +133,7 @@ def update_task_grade(
                 request.unidad_id, 
                 "tarea", 
                 request.score,
-                current_user.get("username")
+                current_user
             )
         except Exception as e:
             print(f"[WARN] Error creando notificación: {e}")
@@ -143,7 +149,7 @@ def update_task_grade(
 def update_quiz_grade(
     request: QuizGradeRequest,
     db: Session = Depends(get_db),
-    current_user = Depends(require_roles(["profesor", "empresa", "admin"]))
+    current_user: models.Registro = Depends(require_usuario_roles(["profesor", "empresa", "admin"]))
 ):
     """
     Actualiza calificación de un quiz
@@ -171,7 +177,7 @@ def update_quiz_grade(
                 request.unidad_id, 
                 "quiz", 
                 request.score,
-                current_user.get("username")
+                current_user
             )
         except Exception as e:
             print(f"[WARN] Error creando notificación: {e}")
@@ -187,7 +193,7 @@ def update_quiz_grade(
 def set_manual_override(
     request: ManualOverrideRequest,
     db: Session = Depends(get_db),
-    current_user = Depends(require_roles(["profesor", "empresa", "admin"]))
+    current_user: models.Registro = Depends(require_usuario_roles(["profesor", "empresa", "admin"]))
 ):
     """
     Establece override manual de calificación final
@@ -215,7 +221,7 @@ def set_manual_override(
                 request.unidad_id, 
                 "override", 
                 request.score or 0,
-                current_user.get("username")
+                current_user
             )
         except Exception as e:
             print(f"[WARN] Error creando notificación: {e}")
@@ -330,7 +336,7 @@ def get_grading_history(
 
 @grading_router.get("/estadisticas/general")
 def get_general_statistics(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user = Depends(require_roles(["empresa", "admin"]))
 ):
     """
@@ -412,12 +418,11 @@ def get_general_statistics(
 
 # Funciones auxiliares
 
-def _create_grade_notification(db: Session, username: str, unidad_id: int, tipo: str, score: int, remitente_username: str):
-    """Crea notificación de calificación para el estudiante"""
+def _create_grade_notification(db: Session, username: str, unidad_id: int, tipo: str, score: int, remitente: Optional[models.Registro]):
+    """Crea notificación de calificación para el estudiante (remitente: usuario autenticado ya cargado)"""
     try:
-        # Obtener estudiante y remitente
+        # Obtener estudiante
         estudiante = db.query(models.Registro).filter(models.Registro.username == username).first()
-        remitente = db.query(models.Registro).filter(models.Registro.username == remitente_username).first()
         
         if not estudiante:
             return
@@ -463,13 +468,14 @@ def sync_all_grades(
     try:
         grading_service = GradingService(db)
         
-        # Obtener todos los estudiantes
-        estudiantes = db.query(models.Registro).filter(
+        # Estudiantes en bloques de BULK_CHUNK_SIZE (keyset): solo se carga un bloque a la vez
+        estudiantes = db.query(models.Registro.username, models.Registro.identificador).filter(
             models.Registro.tipo_usuario == "estudiante"
-        ).all()
+        )
+        orden = [(models.Registro.username, False), (models.Registro.identificador, False)]
         
-        # Obtener todas las unidades
-        unidades = db.query(models.Unidad).all()
+        # Obtener los ids de todas las unidades (una sola vez)
+        unidad_ids = [uid for (uid,) in db.query(models.Unidad.id).order_by(models.Unidad.id).all()]
         
         sync_results = {
             "estudiantes_procesados": 0,
@@ -477,19 +483,25 @@ def sync_all_grades(
             "errores": []
         }
         
-        for estudiante in estudiantes:
-            try:
-                for unidad in unidades:
-                    # Sincronizar progreso de cada unidad
-                    grading_service._sync_unit_progress(estudiante.username, unidad.id)
-                    sync_results["unidades_sincronizadas"] += 1
-                
-                sync_results["estudiantes_procesados"] += 1
-                
-            except Exception as e:
-                error_msg = f"Error sincronizando {estudiante.username}: {e}"
-                sync_results["errores"].append(error_msg)
-                print(f"[ERROR] {error_msg}")
+        for bloque in iterar_por_bloques(estudiantes, orden, max(1, settings.BULK_CHUNK_SIZE)):
+            for estudiante in bloque:
+                try:
+                    # Savepoint por estudiante: un error no descarta el resto del bloque
+                    with db.begin_nested():
+                        for unidad_id in unidad_ids:
+                            # Sincronizar progreso de cada unidad
+                            grading_service._sync_unit_progress(estudiante.username, unidad_id, commit=False)
+                    sync_results["unidades_sincronizadas"] += len(unidad_ids)
+                    sync_results["estudiantes_procesados"] += 1
+                    
+                except Exception as e:
+                    error_msg = f"Error sincronizando {estudiante.username}: {e}"
+                    sync_results["errores"].append(error_msg)
+                    print(f"[ERROR] {error_msg}")
+            
+            # Un commit por bloque y liberar el identity map antes del siguiente
+            db.commit()
+            db.expunge_all()
         
         return {
             "success": True,
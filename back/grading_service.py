@@ -19,15 +19,19 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func
 import models
 import settings
+from upserts import upsert
+import archivo
 from pathlib import Path
 import json
 
 class GradingService:
     """Servicio centralizado para manejo de calificaciones"""
     
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, incluir_archivo: bool = False):
         self.db = db
         self.settings = settings.settings
+        # True: las tareas también se leen de tarea_calificacion_archive (estudiantes inactivos)
+        self.incluir_archivo = incluir_archivo
         
     def calculate_unit_grade(self, username: str, unidad_id: int) -> Dict:
         """
@@ -40,64 +44,87 @@ class GradingService:
         Returns:
             Dict con todos los componentes de la calificación
         """
-        try:
-            # 1. Obtener promedios de tareas
-            tareas_avg = self._get_tasks_average(username, unidad_id)
-            tareas_count = self._get_tasks_count(username, unidad_id)
-            
-            # 2. Obtener promedios de quizzes
-            quiz_avg = self._get_quiz_average(username, unidad_id)
-            quiz_count = self._get_quiz_count(username, unidad_id)
-            
-            # 3. Obtener score de tiempo dedicado
-            tiempo_data = self._get_time_score(username, unidad_id)
-            
-            # 4. Verificar override manual
-            override = self._get_manual_override(username, unidad_id)
-            
-            # 5. Calcular nota final
-            final_grade = self._calculate_final_grade(
-                tareas_avg, quiz_avg, tiempo_data['score']
-            )
-            
-            # 6. Determinar estado de aprobación
-            aprobado = self._is_approved(final_grade, override)
+        return self.calculate_units_grades(username, [unidad_id])[unidad_id]
+    
+    def calculate_units_grades(self, username: str, unidad_ids: List[int]) -> Dict[int, Dict]:
+        """
+        Calcula la nota de varias unidades del estudiante en lote: carga los
+        agregados de tareas, quizzes, progreso y overrides con una consulta por
+        tabla (GROUP BY unidad_id) y compone cada unidad en memoria.
+        
+        Args:
+            username: Username del estudiante
+            unidad_ids: IDs de las unidades
             
-            result = {
-                "username": username,
-                "unidad_id": unidad_id,
-                "componentes": {
-                    "tareas": {
-                        "promedio": tareas_avg,
-                        "count": tareas_count,
-                        "peso": self.settings.GRADES_WT_TAREAS
-                    },
-                    "quizzes": {
-                        "promedio": quiz_avg,
-                        "count": quiz_count,
-                        "peso": self.settings.GRADES_WT_QUIZ
-                    },
-                    "tiempo": {
-                        "minutos": tiempo_data['minutos'],
-                        "score": tiempo_data['score'],
-                        "objetivo": tiempo_data['objetivo'],
-                        "peso": self.settings.GRADES_WT_TIEMPO
-                    }
+        Returns:
+            Dict unidad_id -> mismo resultado que calculate_unit_grade
+        """
+        try:
+            agregados = self._get_unit_aggregates(username, unidad_ids)
+        except Exception as e:
+            print(f"[ERROR] Error calculando calificaciones de unidades {unidad_ids} para {username}: {e}")
+            return {uid: self._get_empty_grade_result(username, uid) for uid in unidad_ids}
+        
+        resultados = {}
+        for unidad_id in unidad_ids:
+            try:
+                resultados[unidad_id] = self._build_unit_grade(username, unidad_id, agregados)
+            except Exception as e:
+                print(f"[ERROR] Error calculando calificación unidad {unidad_id} para {username}: {e}")
+                resultados[unidad_id] = self._get_empty_grade_result(username, unidad_id)
+        return resultados
+    
+    def _build_unit_grade(self, username: str, unidad_id: int, agregados: Dict) -> Dict:
+        """Compone el resultado de una unidad a partir de los agregados ya cargados"""
+        # 1. Promedios de tareas
+        tareas_avg, tareas_count = agregados["tareas"].get(unidad_id, (None, 0))
+        
+        # 2. Promedios de quizzes
+        quiz_avg, quiz_count = agregados["quizzes"].get(unidad_id, (None, 0))
+        
+        # 3. Score de tiempo dedicado
+        tiempo_data = self._get_time_score(agregados["tiempo"].get(unidad_id, 0))
+        
+        # 4. Override manual
+        override = agregados["overrides"].get(unidad_id)
+        
+        # 5. Calcular nota final
+        final_grade = self._calculate_final_grade(
+            tareas_avg, quiz_avg, tiempo_data['score']
+        )
+        
+        # 6. Determinar estado de aprobación
+        aprobado = self._is_approved(final_grade, override)
+        
+        return {
+            "username": username,
+            "unidad_id": unidad_id,
+            "componentes": {
+                "tareas": {
+                    "promedio": tareas_avg,
+                    "count": tareas_count,
+                    "peso": self.settings.GRADES_WT_TAREAS
                 },
-                "calificacion_final": {
-                    "nota": final_grade,
-                    "aprobado": aprobado,
-                    "umbral_aprobacion": self.settings.GRADES_UMBRAL_APROBACION,
-                    "override_manual": override is not None
+                "quizzes": {
+                    "promedio": quiz_avg,
+                    "count": quiz_count,
+                    "peso": self.settings.GRADES_WT_QUIZ
                 },
-                "calculado_at": datetime.utcnow().isoformat()
-            }
-            
-            return result
-            
-        except Exception as e:
-            print(f"[ERROR] Error calculando calificación unidad {unidad_id} para {username}: {e}")
-            return self._get_empty_grade_result(username, unidad_id)
+                "tiempo": {
+                    "minutos": tiempo_data['minutos'],
+                    "score": tiempo_data['score'],
+                    "objetivo": tiempo_data['objetivo'],
+                    "peso": self.settings.GRADES_WT_TIEMPO
+                }
+            },
+            "calificacion_final": {
+                "nota": final_grade,
+                "aprobado": aprobado,
+                "umbral_aprobacion": self.settings.GRADES_UMBRAL_APROBACION,
+                "override_manual": override is not None
+            },
+            "calculado_at": datetime.utcnow().isoformat()
+        }
     
     def update_task_grade(self, username: str, unidad_id: int, filename: str, score: int) -> Dict:
         """
@@ -299,9 +326,11 @@ class GradingService:
             unidades_grades = []
             total_score = 0
             aprobadas = 0
+            # Todas las unidades en lote (una consulta por tabla, no seis por unidad)
+            grades = self.calculate_units_grades(username, [u.id for u in unidades])
             
             for unidad in unidades:
-                grade_data = self.calculate_unit_grade(username, unidad.id)
+                grade_data = grades[unidad.id]
                 
                 unidad_info = {
                     "unidad_id": unidad.id,
@@ -344,44 +373,60 @@ class GradingService:
     
     # Métodos privados de apoyo
     
-    def _get_tasks_average(self, username: str, unidad_id: int) -> Optional[float]:
-        """Obtiene promedio de calificaciones de tareas"""
-        avg = self.db.query(func.avg(models.TareaCalificacion.score)).filter(
-            models.TareaCalificacion.estudiante_username == username,
-            models.TareaCalificacion.unidad_id == unidad_id
-        ).scalar()
-        return float(avg) if avg is not None else None
-    
-    def _get_tasks_count(self, username: str, unidad_id: int) -> int:
-        """Obtiene cantidad de tareas calificadas"""
-        return self.db.query(models.TareaCalificacion).filter(
-            models.TareaCalificacion.estudiante_username == username,
-            models.TareaCalificacion.unidad_id == unidad_id
-        ).count()
-    
-    def _get_quiz_average(self, username: str, unidad_id: int) -> Optional[float]:
-        """Obtiene promedio de calificaciones de quizzes"""
-        avg = self.db.query(func.avg(models.EstudianteQuizCalificacion.score)).filter(
-            models.EstudianteQuizCalificacion.estudiante_username == username,
-            models.EstudianteQuizCalificacion.unidad_id == unidad_id
-        ).scalar()
-        return float(avg) if avg is not None else None
+    def _get_unit_aggregates(self, username: str, unidad_ids: List[int]) -> Dict:
+        """
+        Agregados por unidad del estudiante (una consulta por tabla):
+        tareas/quizzes -> (promedio, cantidad), tiempo -> minutos, overrides -> fila
+        """
+        if not unidad_ids:
+            return {"tareas": {}, "quizzes": {}, "tiempo": {}, "overrides": {}}
+        
+        if self.incluir_archivo:
+            tareas = self._tareas_con_archivo(username)
+            q_tareas = self.db.query(tareas.c.unidad_id, func.avg(tareas.c.score), func.count()).filter(
+                tareas.c.unidad_id.in_(unidad_ids)
+            ).group_by(tareas.c.unidad_id)
+        else:
+            tc = models.TareaCalificacion
+            q_tareas = self.db.query(tc.unidad_id, func.avg(tc.score), func.count()).filter(
+                tc.estudiante_username == username,
+                tc.unidad_id.in_(unidad_ids)
+            ).group_by(tc.unidad_id)
+        
+        eqc = models.EstudianteQuizCalificacion
+        q_quizzes = self.db.query(eqc.unidad_id, func.avg(eqc.score), func.count()).filter(
+            eqc.estudiante_username == username,
+            eqc.unidad_id.in_(unidad_ids)
+        ).group_by(eqc.unidad_id)
+        
+        prog = models.EstudianteProgresoUnidad
+        q_tiempo = self.db.query(prog.unidad_id, prog.tiempo_dedicado_min).filter(
+            prog.username == username,
+            prog.unidad_id.in_(unidad_ids)
+        )
+        
+        ucf = models.UnidadCalificacionFinal
+        overrides = self.db.query(ucf).filter(
+            ucf.estudiante_username == username,
+            ucf.unidad_id.in_(unidad_ids)
+        ).all()
+        
+        def _promedios(query):
+            return {uid: (float(avg) if avg is not None else None, count or 0) for uid, avg, count in query}
+        
+        return {
+            "tareas": _promedios(q_tareas),
+            "quizzes": _promedios(q_quizzes),
+            "tiempo": {uid: minutos for uid, minutos in q_tiempo},
+            "overrides": {o.unidad_id: o for o in overrides},
+        }
     
-    def _get_quiz_count(self, username: str, unidad_id: int) -> int:
-        """Obtiene cantidad de quizzes calificados"""
-        return self.db.query(models.EstudianteQuizCalificacion).filter(
-            models.EstudianteQuizCalificacion.estudiante_username == username,
-            models.EstudianteQuizCalificacion.unidad_id == unidad_id
-        ).count()
+    def _tareas_con_archivo(self, username: str):
+        return archivo.select_tareas_calificacion(username, incluir_archivo=True).subquery()
     
-    def _get_time_score(self, username: str, unidad_id: int) -> Dict:
+    def _get_time_score(self, tiempo_dedicado_min: Optional[int]) -> Dict:
         """Obtiene score basado en tiempo dedicado"""
-        prog = self.db.query(models.EstudianteProgresoUnidad).filter(
-            models.EstudianteProgresoUnidad.username == username,
-            models.EstudianteProgresoUnidad.unidad_id == unidad_id
-        ).first()
-        
-        tiempo_min = int(getattr(prog, 'tiempo_dedicado_min', 0) or 0)
+        tiempo_min = int(tiempo_dedicado_min or 0)
         objetivo = max(1, int(self.settings.GRADES_OBJETIVO_MIN))
         tiempo_score = min(100, int((tiempo_min * 100) / objetivo))
         
@@ -391,13 +436,6 @@ class GradingService:
             "objetivo": objetivo
         }
     
-    def _get_manual_override(self, username: str, unidad_id: int) -> Optional[models.UnidadCalificacionFinal]:
-        """Obtiene override manual si existe"""
-        return self.db.query(models.UnidadCalificacionFinal).filter(
-            models.UnidadCalificacionFinal.estudiante_username == username,
-            models.UnidadCalificacionFinal.unidad_id == unidad_id
-        ).first()
-    
     def _calculate_final_grade(self, tareas_avg: Optional[float], quiz_avg: Optional[float], tiempo_score: int) -> int:
         """Calcula nota final usando pesos configurados"""
         # Normalizar pesos
@@ -426,63 +464,52 @@ class GradingService:
         return final_grade >= int(self.settings.GRADES_UMBRAL_APROBACION)
     
     def _upsert_task_grade(self, username: str, unidad_id: int, filename: str, score: int) -> models.TareaCalificacion:
-        """Upsert de calificación de tarea"""
-        tarea_cal = self.db.query(models.TareaCalificacion).filter(
-            models.TareaCalificacion.estudiante_username == username,
-            models.TareaCalificacion.unidad_id == unidad_id,
-            models.TareaCalificacion.filename == filename
-        ).first()
-        
+        """Upsert de calificación de tarea (una sola sentencia)"""
         now = datetime.utcnow()
-        
-        if tarea_cal:
-            tarea_cal.score = score
-            tarea_cal.updated_at = now
-        else:
-            tarea_cal = models.TareaCalificacion(
-                estudiante_username=username,
-                unidad_id=unidad_id,
-                filename=filename,
-                score=score,
-                created_at=now,
-                updated_at=now
-            )
-            self.db.add(tarea_cal)
-        
+        row_id = upsert(
+            self.db,
+            models.TareaCalificacion,
+            {
+                "estudiante_username": username,
+                "unidad_id": unidad_id,
+                "filename": filename,
+                "score": score,
+                "created_at": now,
+                "updated_at": now,
+            },
+            claves=["estudiante_username", "unidad_id", "filename"],
+            actualizar=lambda c, nuevos: [("score", nuevos.score), ("updated_at", nuevos.updated_at)],
+        )
         self.db.commit()
-        self.db.refresh(tarea_cal)
-        return tarea_cal
+        return self.db.get(models.TareaCalificacion, row_id, populate_existing=True)
     
     def _upsert_quiz_grade(self, username: str, unidad_id: int, quiz_id: int, score: int) -> models.EstudianteQuizCalificacion:
-        """Upsert de calificación de quiz"""
-        quiz_cal = self.db.query(models.EstudianteQuizCalificacion).filter(
-            models.EstudianteQuizCalificacion.estudiante_username == username,
-            models.EstudianteQuizCalificacion.unidad_id == unidad_id,
-            models.EstudianteQuizCalificacion.quiz_id == quiz_id
-        ).first()
-        
+        """Upsert de calificación de quiz (una sola sentencia)"""
         now = datetime.utcnow()
-        
-        if quiz_cal:
-            quiz_cal.score = score
-            quiz_cal.updated_at = now
-        else:
-            quiz_cal = models.EstudianteQuizCalificacion(
-                estudiante_username=username,
-                unidad_id=unidad_id,
-                quiz_id=quiz_id,
-                score=score,
-                created_at=now,
-                updated_at=now
-            )
-            self.db.add(quiz_cal)
-        
+        row_id = upsert(
+            self.db,
+            models.EstudianteQuizCalificacion,
+            {
+                "estudiante_username": username,
+                "unidad_id": unidad_id,
+                "quiz_id": quiz_id,
+                "score": score,
+                "created_at": now,
+                "updated_at": now,
+            },
+            claves=["estudiante_username", "unidad_id", "quiz_id"],
+            actualizar=lambda c, nuevos: [("score", nuevos.score), ("updated_at", nuevos.updated_at)],
+        )
         self.db.commit()
-        self.db.refresh(quiz_cal)
-        return quiz_cal
+        return self.db.get(models.EstudianteQuizCalificacion, row_id, populate_existing=True)
     
-    def _sync_unit_progress(self, username: str, unidad_id: int):
-        """Sincroniza progreso de unidad basado en calificaciones"""
+    def _sync_unit_progress(self, username: str, unidad_id: int, commit: bool = True):
+        """
+        Sincroniza progreso de unidad basado en calificaciones
+
+        Con commit=False solo hace flush y propaga los errores, para que un proceso
+        masivo controle la transacción (savepoint por estudiante, commit por bloque)
+        """
         try:
             # Obtener o crear registro de progreso
             prog = self.db.query(models.EstudianteProgresoUnidad).filter(
@@ -509,10 +536,15 @@ class GradingService:
             prog.score = new_score
             prog.ultima_actividad_at = datetime.utcnow()
             
-            self.db.commit()
+            if commit:
+                self.db.commit()
+            else:
+                self.db.flush()
             
         except Exception as e:
             print(f"[ERROR] Error sincronizando progreso de unidad: {e}")
+            if not commit:
+                raise
             self.db.rollback()
     
     def _get_empty_grade_result(self, username: str, unidad_id: int) -> Dict:
@@ -0,0 +1,84 @@
+"""
+Caché de claims JWT verificados
+===============================
+
+Las dependencias de autenticación decodifican el mismo bearer token en cada
+request (a veces dos veces en el mismo request). Este módulo guarda los claims
+ya verificados en un LRU acotado por worker, indexado por el SHA-256 del token
+y válido hasta su `exp`: la firma se verifica una sola vez por token y worker.
+
+Los tokens sin `exp` no se cachean (se verifican siempre).
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from jose import jwt
+from jose.exceptions import ExpiredSignatureError
+
+
+class CacheClaims:
+    """LRU de token -> claims verificados, con expiración en el `exp` del token"""
+
+    def __init__(self, max_items: int):
+        self.max_items = max_items
+        self._items: "OrderedDict[str, Tuple[Dict, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _clave(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def obtener(self, token: str) -> Optional[Dict]:
+        """Claims del token si están en caché; lanza ExpiredSignatureError si ya venció"""
+        clave = self._clave(token)
+        with self._lock:
+            item = self._items.get(clave)
+            if item is None:
+                self.misses += 1
+                return None
+            claims, exp = item
+            if time.time() >= exp:
+                del self._items[clave]
+                raise ExpiredSignatureError("Signature has expired.")
+            self._items.move_to_end(clave)
+            self.hits += 1
+            return dict(claims)
+
+    def guardar(self, token: str, claims: Dict) -> None:
+        exp = claims.get("exp")
+        if self.max_items <= 0 or not isinstance(exp, (int, float)):
+            return
+        clave = self._clave(token)
+        with self._lock:
+            self._items[clave] = (dict(claims), float(exp))
+            self._items.move_to_end(clave)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self.hits = self.misses = 0
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {"items": len(self._items), "max_items": self.max_items, "hits": self.hits, "misses": self.misses}
+
+
+def decodificar(cache: CacheClaims, token: str, secret: str, algorithms: List[str]) -> Dict:
+    """
+    Equivalente a jwt.decode(token, secret, algorithms=algorithms) con caché:
+    lanza las mismas excepciones de python-jose (JWTError, ExpiredSignatureError)
+    """
+    claims = cache.obtener(token)
+    if claims is not None:
+        return claims
+    claims = jwt.decode(token, secret, algorithms=algorithms)
+    cache.guardar(token, claims)
+    return claims
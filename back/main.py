@@ -1,10 +1,13 @@
 from typing import Union
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from auth_routes import authRouter
 from grading_routes import grading_router
 from config import conf
 from settings import settings
+import query_stats
+import revocaciones
+from rate_limit import RateLimitMiddleware
 #from fastapi_mail import FastMail
 
 
@@ -27,6 +30,10 @@ AcademyEnApp.include_router(grading_router, tags=["Calificaciones V2"])
 
 origins = settings.ALLOWED_ORIGINS
 
+# Límite de peticiones en login, recuperación de contraseña y heartbeat (429 antes de tocar la BD).
+# Se registra antes que CORS para que las respuestas 429 también lleven sus cabeceras
+AcademyEnApp.add_middleware(RateLimitMiddleware)
+
 # Configuración del middleware CORS para permitir peticiones desde frontend
 AcademyEnApp.add_middleware(
     CORSMiddleware,
@@ -34,8 +41,28 @@ AcademyEnApp.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-DB-Queries", "X-DB-Time-ms", "X-Next-Cursor", "Retry-After"],
 )
 
+# Conteo de consultas SQL por request (cabeceras + aviso de posibles N+1)
+@AcademyEnApp.middleware("http")
+async def db_query_stats_middleware(request: Request, call_next):
+    stats, token = query_stats.start_request()
+    try:
+        response = await call_next(request)
+    finally:
+        query_stats.end_request(token)
+    response.headers.update(query_stats.headers_for(stats))
+    for stmt, veces in stats.n_plus_one_suspects(settings.DB_N1_THRESHOLD):
+        resumen = " ".join(stmt.split())[:160]
+        print(f"[WARN] Posible N+1 en {request.method} {request.url.path}: {veces}x {resumen}")
+    return response
+
+# Lista de matrículas inactivas cargada al arrancar (no en el primer request)
+@AcademyEnApp.on_event("startup")
+def cargar_revocaciones():
+    revocaciones.recargar()
+
 # Ruta raíz para probar que el backend funciona
 @AcademyEnApp.get("/")
 async def read_root():
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Runner de migraciones versionadas
+=================================
+
+Aplica en orden los módulos de migrations/ que aún no figuran en la tabla
+schema_migrations. Reemplaza a los create_all sueltos: además de crear las
+tablas faltantes, agrega índices y claves únicas en bases ya existentes.
+
+Uso:
+    python migrate.py            # aplica las pendientes
+    python migrate.py --status   # lista aplicadas y pendientes
+"""
+
+import argparse
+import importlib
+import pkgutil
+import sys
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, select
+
+import migrations
+from Clever_MySQL_conn import engine
+
+# Tabla de control fuera de Base.metadata: no la crea create_all ni la ve el ORM
+_meta = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _meta,
+    Column("version", String(20), primary_key=True),
+    Column("descripcion", String(255)),
+    Column("aplicada_at", DateTime, nullable=False),
+)
+
+
+def cargar_migraciones() -> List:
+    """Módulos mNNNN_* del paquete migrations, ordenados por VERSION"""
+    modulos = [
+        importlib.import_module(f"migrations.{info.name}")
+        for info in pkgutil.iter_modules(migrations.__path__)
+        if info.name.startswith("m")
+    ]
+    return sorted(modulos, key=lambda m: m.VERSION)
+
+
+def versiones_aplicadas(bind=None) -> set:
+    bind = bind or engine
+    _meta.create_all(bind=bind, checkfirst=True)
+    with bind.connect() as conn:
+        return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def aplicar_migraciones(bind=None) -> List[str]:
+    """
+    Aplica las migraciones pendientes, cada una en su propia transacción
+
+    Returns:
+        Versiones aplicadas en esta ejecución
+    """
+    bind = bind or engine
+    aplicadas = versiones_aplicadas(bind)
+    nuevas = []
+    for mod in cargar_migraciones():
+        if mod.VERSION in aplicadas:
+            continue
+        print(f"🔄 Migración {mod.VERSION}: {mod.DESCRIPCION}")
+        with bind.begin() as conn:
+            mod.upgrade(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=mod.VERSION, descripcion=mod.DESCRIPCION, aplicada_at=datetime.utcnow()
+            ))
+        nuevas.append(mod.VERSION)
+    return nuevas
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Migraciones versionadas del esquema")
+    parser.add_argument("--status", action="store_true", help="Solo mostrar el estado")
+    args = parser.parse_args()
+
+    if args.status:
+        aplicadas = versiones_aplicadas()
+        for mod in cargar_migraciones():
+            marca = "✅" if mod.VERSION in aplicadas else "⏳"
+            print(f"{marca} {mod.VERSION} {mod.DESCRIPCION}")
+        return 0
+
+    try:
+        nuevas = aplicar_migraciones()
+    except Exception as e:
+        print(f"❌ Error en la migración: {e}")
+        return 1
+    print(f"✅ Migraciones aplicadas: {', '.join(nuevas)}" if nuevas else "✅ Esquema al día")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Migraciones versionadas del esquema
+===================================
+
+Cada módulo `mNNNN_descripcion.py` de este paquete define:
+
+- VERSION: identificador ordenable ("0001", "0002", ...)
+- DESCRIPCION: texto corto que queda registrado en schema_migrations
+- upgrade(conn): aplica el cambio usando la conexión recibida
+
+Las migraciones deben ser idempotentes (revisar antes de crear), porque las
+bases existentes se crearon con create_all y scripts SQL sueltos. El runner
+está en migrate.py.
+"""
+
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import inspect, text
+
+
+def tiene_tabla(conn, tabla: str) -> bool:
+    return inspect(conn).has_table(tabla)
+
+
+def tiene_columna(conn, tabla: str, columna: str) -> bool:
+    return any(c["name"] == columna for c in inspect(conn).get_columns(tabla))
+
+
+def tiene_indice(conn, tabla: str, nombre: str) -> bool:
+    insp = inspect(conn)
+    nombres = {i["name"] for i in insp.get_indexes(tabla)}
+    nombres |= {u["name"] for u in insp.get_unique_constraints(tabla)}
+    return nombre in nombres
+
+
+def crear_indice(conn, nombre: str, tabla: str, columnas: Iterable[str], unique: bool = False) -> bool:
+    """Crea el índice si no existe; devuelve True si lo creó"""
+    if tiene_indice(conn, tabla, nombre):
+        return False
+    cols = ", ".join(columnas)
+    conn.execute(text(f"CREATE {'UNIQUE ' if unique else ''}INDEX {nombre} ON {tabla} ({cols})"))
+    return True
+
+
+def eliminar_duplicados(
+    conn, tabla: str, columnas: Iterable[str], preferir: Iterable[str] = (),
+    fusionar: Optional[Dict[str, str]] = None,
+) -> int:
+    """
+    Deja una sola fila por combinación de columnas antes de crear un índice único.
+    Se conserva la primera según `preferir` (columnas en orden descendente, p. ej.
+    origen_manual y updated_at) y, a igualdad, la más reciente (mayor id).
+    Las columnas de `preferir` que no existan en la tabla se ignoran.
+
+    `fusionar` ({columna: "sum" | "max"}) acumula esas columnas de todo el grupo
+    en la fila conservada antes de borrar el resto, para no perder datos (p. ej.
+    el tiempo dedicado repartido entre filas de progreso duplicadas). Los NULL se
+    ignoran; si todo el grupo es NULL la columna queda en NULL.
+
+    Returns:
+        Cantidad de filas eliminadas
+    """
+    columnas = list(columnas)
+    orden = [c for c in preferir if tiene_columna(conn, tabla, c)] + ["id"]
+    fusion = [(c, f) for c, f in (fusionar or {}).items() if tiene_columna(conn, tabla, c)]
+    cols = ", ".join(columnas)
+    extra = "".join(f", t.{c}" for c, _ in fusion)
+    # Solo se leen los grupos repetidos (el resto de la tabla no se toca)
+    filas = conn.execute(text(
+        f"SELECT t.id, {', '.join(f't.{c}' for c in columnas)}{extra} FROM {tabla} t "
+        f"JOIN (SELECT {cols} FROM {tabla} GROUP BY {cols} HAVING COUNT(*) > 1) d "
+        f"ON {' AND '.join(f't.{c} = d.{c}' for c in columnas)} "
+        f"ORDER BY {', '.join(f't.{c} DESC' for c in orden)}"
+    )).all()
+    n = len(columnas)
+    grupos: Dict[tuple, list] = {}
+    for fila in filas:
+        grupos.setdefault(tuple(fila[1:n + 1]), []).append(fila)
+    sobrantes = []
+    for grupo in grupos.values():
+        conservada = grupo[0]
+        sobrantes.extend(f[0] for f in grupo[1:])
+        if not fusion:
+            continue
+        valores = {}
+        for k, (col, funcion) in enumerate(fusion):
+            datos = [f[n + 1 + k] for f in grupo if f[n + 1 + k] is not None]
+            if datos:
+                valores[col] = sum(datos) if funcion == "sum" else max(datos)
+        if valores:
+            conn.execute(
+                text(f"UPDATE {tabla} SET {', '.join(f'{c} = :{c}' for c in valores)} WHERE id = :id"),
+                {**valores, "id": conservada[0]},
+            )
+    for i in range(0, len(sobrantes), 500):
+        bloque = sobrantes[i:i + 500]
+        conn.execute(
+            text(f"DELETE FROM {tabla} WHERE id IN ({', '.join(f':id{j}' for j in range(len(bloque)))})"),
+            {f"id{j}": id_ for j, id_ in enumerate(bloque)},
+        )
+    return len(sobrantes)
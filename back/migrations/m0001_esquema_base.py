@@ -0,0 +1,12 @@
+"""Esquema base: crea las tablas de models.py que aún no existan"""
+
+VERSION = "0001"
+DESCRIPCION = "Esquema base desde models.py (tablas faltantes)"
+
+
+def upgrade(conn):
+    from Clever_MySQL_conn import Base
+    import models  # noqa: F401  (registra las tablas)
+
+    # checkfirst: en bases existentes solo crea lo que falte (equivale al antiguo create_all)
+    Base.metadata.create_all(bind=conn, checkfirst=True)
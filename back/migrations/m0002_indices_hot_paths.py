@@ -0,0 +1,46 @@
+"""Índices compuestos y claves únicas para las consultas más frecuentes"""
+
+from migrations import crear_indice, eliminar_duplicados
+
+VERSION = "0002"
+DESCRIPCION = "Índices compuestos y claves únicas en tablas de calificaciones, progreso y actividad"
+
+# (nombre, tabla, columnas, preferir) — los nombres coinciden con los declarados en models.py.
+# `preferir`: entre duplicados gana la fila manual y luego la más reciente
+# Columnas que se acumulan en la fila conservada al eliminar duplicados
+FUSIONAR = {
+    "estudiante_progreso_unidad": {
+        "tiempo_dedicado_min": "sum",
+        "porcentaje_completado": "max",
+        "score": "max",
+        "ultima_actividad_at": "max",
+    },
+}
+
+UNICOS = [
+    ("uq_progreso_username_unidad", "estudiante_progreso_unidad", ["username", "unidad_id"], ["ultima_actividad_at"]),
+    ("uq_tarea_cal_est_unidad_archivo", "tarea_calificacion", ["estudiante_username", "unidad_id", "filename"], ["updated_at"]),
+    ("uq_unidad_final_est_unidad", "unidad_calificacion_final", ["estudiante_username", "unidad_id"], ["updated_at"]),
+    ("uq_quiz_cal_est_unidad_quiz", "estudiante_quiz_calificacion", ["estudiante_username", "unidad_id", "quiz_id"], ["origen_manual", "updated_at"]),
+    ("uq_quiz_permiso_est_quiz", "estudiante_quiz_permiso", ["estudiante_username", "quiz_id"], ["updated_at"]),
+]
+
+INDICES = [
+    ("ix_actividad_username_creado", "actividad_estudiante", ["username", "creado_at"]),
+    ("ix_quiz_intento_est_quiz", "estudiante_quiz_intento", ["estudiante_username", "quiz_id"]),
+    ("ix_quiz_respuesta_est_quiz", "estudiante_quiz_respuesta", ["estudiante_username", "quiz_id"]),
+    ("ix_notif_usuario_leida_fecha", "notificaciones", ["usuario_id", "leida", "fecha_creacion"]),
+    ("ix_quiz_asig_unidad_quiz", "quiz_asignacion", ["unidad_id", "quiz_id"]),
+]
+
+
+def upgrade(conn):
+    for nombre, tabla, columnas, preferir in UNICOS:
+        # Las carreras SELECT→INSERT pudieron dejar duplicados; sin limpiarlos el índice único falla.
+        # En progreso cada fila duplicada acumuló su propio tiempo: se fusiona antes de borrar.
+        borradas = eliminar_duplicados(conn, tabla, columnas, preferir, FUSIONAR.get(tabla))
+        if borradas:
+            print(f"[MIGRACION] {tabla}: {borradas} filas duplicadas eliminadas")
+        crear_indice(conn, nombre, tabla, columnas, unique=True)
+    for nombre, tabla, columnas in INDICES:
+        crear_indice(conn, nombre, tabla, columnas)
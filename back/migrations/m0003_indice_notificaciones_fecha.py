@@ -0,0 +1,16 @@
+"""Índice para listar las notificaciones de un usuario por fecha sin ordenar en tabla temporal"""
+
+from migrations import crear_indice
+
+VERSION = "0003"
+DESCRIPCION = "Índice (usuario_id, fecha_creacion, id) en notificaciones"
+
+# (nombre, tabla, columnas) — el nombre coincide con el declarado en models.py
+INDICES = [
+    ("ix_notif_usuario_fecha", "notificaciones", ["usuario_id", "fecha_creacion", "id"]),
+]
+
+
+def upgrade(conn):
+    for nombre, tabla, columnas in INDICES:
+        crear_indice(conn, nombre, tabla, columnas)
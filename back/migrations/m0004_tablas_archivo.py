@@ -0,0 +1,16 @@
+"""Tablas *_archive para el historial de estudiantes con la matrícula desactivada"""
+
+VERSION = "0004"
+DESCRIPCION = "Tablas de archivo: actividad, respuestas de quiz, calificaciones de tareas y notificaciones"
+
+
+def upgrade(conn):
+    import models
+
+    for tabla in (
+        models.actividad_estudiante_archive,
+        models.estudiante_quiz_respuesta_archive,
+        models.tarea_calificacion_archive,
+        models.notificaciones_archive,
+    ):
+        tabla.create(bind=conn, checkfirst=True)
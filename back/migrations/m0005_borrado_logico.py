@@ -0,0 +1,21 @@
+"""Columna deleted_at (borrado lógico) en unidad y quiz"""
+
+from sqlalchemy import text
+
+from migrations import crear_indice, tiene_columna
+
+VERSION = "0005"
+DESCRIPCION = "Borrado lógico: deleted_at en unidad y quiz"
+
+# (tabla, índice) — los nombres coinciden con los que genera models.py (index=True)
+TABLAS = [
+    ("unidad", "ix_unidad_deleted_at"),
+    ("quiz", "ix_quiz_deleted_at"),
+]
+
+
+def upgrade(conn):
+    for tabla, indice in TABLAS:
+        if not tiene_columna(conn, tabla, "deleted_at"):
+            conn.execute(text(f"ALTER TABLE {tabla} ADD COLUMN deleted_at DATETIME NULL"))
+        crear_indice(conn, indice, tabla, ["deleted_at"])
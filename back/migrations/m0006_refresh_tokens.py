@@ -0,0 +1,10 @@
+"""Almacén de refresh tokens (hash, usuario, vencimiento y revocación)"""
+
+VERSION = "0006"
+DESCRIPCION = "Tabla refresh_token"
+
+
+def upgrade(conn):
+    import models
+
+    models.RefreshToken.__table__.create(bind=conn, checkfirst=True)
@@ -0,0 +1,54 @@
+"""Tabla token_email: tokens de verificación y reset fuera de estudiante"""
+
+import hashlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+VERSION = "0007"
+DESCRIPCION = "Tabla token_email (tokens de verificación y reset por clave primaria)"
+
+# Vigencias con que se emitían: verificación 24 h, reset de contraseña 2 h
+VIGENCIA_RESET = timedelta(hours=2)
+
+
+def _proposito(verificado, expira, ahora: datetime) -> str:
+    """Un usuario verificado solo podía tener un token de reset. Para uno sin verificar
+    (forgot-password también les emitía reset) decide la vigencia restante: más de 2 h
+    solo es posible en un token de verificación."""
+    if verificado:
+        return "reset"
+    if expira is not None and expira - ahora > VIGENCIA_RESET:
+        return "verificacion"
+    return "reset"
+
+
+def upgrade(conn):
+    import models
+
+    tabla = models.TokenEmail.__table__
+    tabla.create(bind=conn, checkfirst=True)
+
+    # Tokens pendientes en estudiante.verification_token (la columna servía para ambos propósitos)
+    filas = conn.execute(text(
+        "SELECT username, verification_token, token_expires_at, email_verified "
+        "FROM estudiante WHERE verification_token IS NOT NULL"
+    )).all()
+    ahora = datetime.utcnow()
+    for username, token, expira, verificado in filas:
+        if isinstance(expira, str):  # SQLite sin tipos declarados por el ORM
+            expira = datetime.fromisoformat(expira)
+        token_hash = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        if conn.execute(tabla.select().where(tabla.c.token_hash == token_hash)).first():
+            continue
+        conn.execute(tabla.insert().values(
+            token_hash=token_hash,
+            proposito=_proposito(verificado, expira, ahora),
+            username=username,
+            created_at=ahora,
+            expires_at=expira or ahora,
+        ))
+    conn.execute(text(
+        "UPDATE estudiante SET verification_token = NULL, token_expires_at = NULL "
+        "WHERE verification_token IS NOT NULL"
+    ))
@@ -0,0 +1,15 @@
+"""Marca de historial pendiente de archivar/restaurar en estudiante"""
+
+from sqlalchemy import text
+
+from migrations import crear_indice, tiene_columna
+
+VERSION = "0008"
+DESCRIPCION = "Columna historial_pendiente en estudiante (movimiento al archivo reanudable)"
+
+
+def upgrade(conn):
+    if not tiene_columna(conn, "estudiante", "historial_pendiente"):
+        conn.execute(text("ALTER TABLE estudiante ADD COLUMN historial_pendiente BOOLEAN NULL DEFAULT 0"))
+    # Mismo nombre que genera models.py (index=True)
+    crear_indice(conn, "ix_estudiante_historial_pendiente", "estudiante", ["historial_pendiente"])
@@ -2,11 +2,12 @@
 
 
 # Imports
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean, JSON
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean, JSON, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from Clever_MySQL_conn import Base
 from datetime import datetime, datetime as dt, timedelta
 from sqlalchemy import Table
+import borrado_logico
 
 class Registro(Base):
     __tablename__ = "estudiante"  # Nombre de la tabla en la base de datos
@@ -27,10 +28,11 @@ class Registro(Base):
     profile_image_url = Column(String(255), nullable=True)
 
     email_verified = Column(Boolean, default=False)
-    verification_token = Column(String(255), nullable=True)
+    verification_token = Column(String(255), nullable=True)  # En desuso: los tokens van en token_email
     tipo_usuario = Column(String(20), nullable=False)  # estudiante, profesor, empresa
     token_expires_at = Column(DateTime, nullable=True)
     matricula_activa = Column(Boolean, default=True)  # Para estudiantes: si pueden acceder a la plataforma
+    historial_pendiente = Column(Boolean, default=False, index=True)  # Falta mover su historial al/desde el archivo (ver archivo.py)
 
 
 
@@ -68,6 +70,7 @@ class Unidad(Base):
     nombre = Column(String(100), nullable=False)
     descripcion = Column(String(255), nullable=True)
     orden = Column(Integer, default=0)
+    deleted_at = Column(DateTime, nullable=True, index=True)  # Borrado lógico (ver borrado_logico.py)
 
 # Tabla de subcarpetas por unidad
 class Subcarpeta(Base):
@@ -98,6 +101,9 @@ profesor_estudiante = Table(
 # Tabla de eventos de actividad del estudiante
 class ActividadEstudiante(Base):
     __tablename__ = "actividad_estudiante"
+    __table_args__ = (
+        Index("ix_actividad_username_creado", "username", "creado_at"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String(50), ForeignKey('estudiante.username'), nullable=False)
     unidad_id = Column(Integer, ForeignKey('unidad.id'), nullable=False)
@@ -109,6 +115,9 @@ class ActividadEstudiante(Base):
 # Tabla agregada de progreso por unidad
 class EstudianteProgresoUnidad(Base):
     __tablename__ = "estudiante_progreso_unidad"
+    __table_args__ = (
+        UniqueConstraint("username", "unidad_id", name="uq_progreso_username_unidad"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String(50), ForeignKey('estudiante.username'), nullable=False)
     unidad_id = Column(Integer, ForeignKey('unidad.id'), nullable=False)
@@ -120,6 +129,9 @@ class EstudianteProgresoUnidad(Base):
 # Nueva tabla: calificaciones de tareas por archivo (por unidad y estudiante)
 class TareaCalificacion(Base):
     __tablename__ = "tarea_calificacion"
+    __table_args__ = (
+        UniqueConstraint("estudiante_username", "unidad_id", "filename", name="uq_tarea_cal_est_unidad_archivo"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     estudiante_username = Column(String(50), ForeignKey('estudiante.username'), nullable=False)
     unidad_id = Column(Integer, ForeignKey('unidad.id'), nullable=False)
@@ -131,6 +143,9 @@ class TareaCalificacion(Base):
 # Asignaciones de Quiz a Unidades (ventanas de disponibilidad)
 class QuizAsignacion(Base):
     __tablename__ = "quiz_asignacion"
+    __table_args__ = (
+        Index("ix_quiz_asig_unidad_quiz", "unidad_id", "quiz_id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     quiz_id = Column(Integer, ForeignKey('quiz.id'), nullable=False)
     unidad_id = Column(Integer, ForeignKey('unidad.id'), nullable=False)
@@ -143,6 +158,9 @@ class QuizAsignacion(Base):
 # Calificación global/override de unidad
 class UnidadCalificacionFinal(Base):
     __tablename__ = "unidad_calificacion_final"
+    __table_args__ = (
+        UniqueConstraint("estudiante_username", "unidad_id", name="uq_unidad_final_est_unidad"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     estudiante_username = Column(String(50), ForeignKey('estudiante.username'), nullable=False)
     unidad_id = Column(Integer, ForeignKey('unidad.id'), nullable=False)
@@ -159,10 +177,14 @@ class Quiz(Base):
     descripcion = Column(String(500), nullable=True)
     preguntas = Column(JSON, nullable=True)  # estructura libre para prototipo
     created_at = Column(DateTime, default=datetime.utcnow)
+    deleted_at = Column(DateTime, nullable=True, index=True)  # Borrado lógico (ver borrado_logico.py)
 
 # Calificación de quizzes por estudiante
 class EstudianteQuizCalificacion(Base):
     __tablename__ = "estudiante_quiz_calificacion"
+    __table_args__ = (
+        UniqueConstraint("estudiante_username", "unidad_id", "quiz_id", name="uq_quiz_cal_est_unidad_quiz"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     estudiante_username = Column(String(50), ForeignKey('estudiante.username'), nullable=False)
     unidad_id = Column(Integer, ForeignKey('unidad.id'), nullable=False)
@@ -179,6 +201,9 @@ class EstudianteQuizCalificacion(Base):
 # Permisos individuales de quiz por estudiante
 class EstudianteQuizPermiso(Base):
     __tablename__ = "estudiante_quiz_permiso"
+    __table_args__ = (
+        UniqueConstraint("estudiante_username", "quiz_id", name="uq_quiz_permiso_est_quiz"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     estudiante_username = Column(String(50), ForeignKey('estudiante.username'), nullable=False)
     quiz_id = Column(Integer, ForeignKey('quiz.id'), nullable=False)
@@ -189,6 +214,9 @@ class EstudianteQuizPermiso(Base):
 # Respuestas de quizzes por estudiante
 class EstudianteQuizRespuesta(Base):
     __tablename__ = "estudiante_quiz_respuesta"
+    __table_args__ = (
+        Index("ix_quiz_respuesta_est_quiz", "estudiante_username", "quiz_id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     estudiante_username = Column(String(50), ForeignKey('estudiante.username'), nullable=False)
     quiz_id = Column(Integer, ForeignKey('quiz.id'), nullable=False)
@@ -200,6 +228,9 @@ class EstudianteQuizRespuesta(Base):
 
 class EstudianteQuizIntento(Base):
     __tablename__ = "estudiante_quiz_intento"
+    __table_args__ = (
+        Index("ix_quiz_intento_est_quiz", "estudiante_username", "quiz_id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     estudiante_username = Column(String(50), ForeignKey('estudiante.username'), nullable=False)
     quiz_id = Column(Integer, ForeignKey('quiz.id'), nullable=False)
@@ -211,6 +242,11 @@ class EstudianteQuizIntento(Base):
 # ===== Notificaciones =====
 class Notificacion(Base):
     __tablename__ = "notificaciones"
+    __table_args__ = (
+        Index("ix_notif_usuario_leida_fecha", "usuario_id", "leida", "fecha_creacion"),
+        # Listado paginado por (fecha_creacion, id) desc sin filtrar por leida
+        Index("ix_notif_usuario_fecha", "usuario_id", "fecha_creacion", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     usuario_id = Column(Integer, ForeignKey('estudiante.identificador'), nullable=False)  # destinatario (empresa/profesor/estudiante)
     tipo = Column(String(50), nullable=False)
@@ -218,4 +254,56 @@ class Notificacion(Base):
     leida = Column(Boolean, default=False)
     fecha_creacion = Column(DateTime, default=datetime.utcnow)
     usuario_remitente_id = Column(Integer, ForeignKey('estudiante.identificador'), nullable=True)  # opcional
-    unidad_id = Column(Integer, ForeignKey('unidad.id'), nullable=True)
\ No newline at end of file
+    unidad_id = Column(Integer, ForeignKey('unidad.id'), nullable=True)
+
+# ===== Refresh tokens =====
+# Solo se guarda el SHA-256 del token. Cada uso lo revoca y emite uno nuevo (rotación);
+# presentar uno ya revocado revoca todos los del usuario (posible robo).
+class RefreshToken(Base):
+    __tablename__ = "refresh_token"
+    __table_args__ = (
+        Index("ix_refresh_token_username", "username"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    token_hash = Column(String(64), unique=True, nullable=False)
+    username = Column(String(50), ForeignKey('estudiante.username'), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime, nullable=True)
+
+
+class TokenEmail(Base):
+    """Tokens de un solo uso enviados por correo (verificación de email y reset de contraseña).
+    Se buscan por clave primaria (SHA-256 del token) y los vencidos se purgan por bloques."""
+    __tablename__ = "token_email"
+    __table_args__ = (
+        Index("ix_token_email_username_proposito", "username", "proposito"),
+    )
+    token_hash = Column(String(64), primary_key=True)
+    proposito = Column(String(20), nullable=False)  # verificacion, reset
+    username = Column(String(50), ForeignKey('estudiante.username'), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+# ===== Archivo de estudiantes inactivos =====
+# Copias "frías" de las tablas de historial: el historial de un estudiante con la
+# matrícula desactivada se mueve aquí (archivo.py) para no engordar los índices de
+# las tablas calientes. Sin FKs ni claves únicas; `id` conserva el id original.
+def _tabla_archivo(tabla: Table, clave: str) -> Table:
+    return Table(
+        f"{tabla.name}_archive", Base.metadata,
+        Column("archive_id", Integer, primary_key=True, autoincrement=True),
+        *[Column(c.name, c.type, nullable=True) for c in tabla.columns],
+        Column("archivado_at", DateTime, nullable=False, default=datetime.utcnow),
+        Index(f"ix_{tabla.name}_archive_{clave}", clave),
+    )
+
+actividad_estudiante_archive = _tabla_archivo(ActividadEstudiante.__table__, "username")
+estudiante_quiz_respuesta_archive = _tabla_archivo(EstudianteQuizRespuesta.__table__, "estudiante_username")
+tarea_calificacion_archive = _tabla_archivo(TareaCalificacion.__table__, "estudiante_username")
+notificaciones_archive = _tabla_archivo(Notificacion.__table__, "usuario_id")
+
+
+# Unidades y quizzes con deleted_at quedan ocultos en todas las consultas ORM
+borrado_logico.registrar(Unidad, Quiz)
@@ -0,0 +1,167 @@
+"""
+Paginación por cursor (keyset)
+==============================
+
+En lugar de OFFSET, cada página continúa "después" de la última fila de la
+anterior según la tupla de orden (clave de orden, id). El costo de una página
+no crece con el tamaño de la tabla y las inserciones concurrentes no desplazan
+resultados.
+
+Uso en un endpoint:
+
+    @authRouter.get("/matriculas/")
+    def obtener_matriculas(response: Response, pagina: Pagina = Depends(pagina_params), ...):
+        filas = crud.obtener_estudiantes(db, pagina)
+        aplicar_cabeceras(response, pagina)
+        return filas
+
+El cliente pide `?limit=50` y, mientras la respuesta traiga la cabecera
+X-Next-Cursor, vuelve a pedir con `?limit=50&cursor=<valor>`. Sin `limit` se
+usa PAGINATION_DEFAULT_LIMIT (0 = sin límite, compatible con el frontend actual).
+"""
+
+import base64
+import json
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Query, Response
+from sqlalchemy import and_, false, or_
+
+from settings import settings
+
+# (columna o expresión, descendente)
+Orden = Sequence[Tuple[object, bool]]
+
+
+@dataclass
+class Pagina:
+    """Parámetros de una página; next_cursor se completa al paginar"""
+    limit: Optional[int] = None
+    cursor: Optional[str] = None
+    next_cursor: Optional[str] = None
+
+
+def pagina_params(
+    limit: Optional[int] = Query(None, ge=1, description="Cantidad máxima de elementos"),
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
+) -> Pagina:
+    """Dependencia de FastAPI con los parámetros ?limit=&cursor="""
+    limite = limit or settings.PAGINATION_DEFAULT_LIMIT or None
+    if cursor and not limite:
+        limite = settings.PAGINATION_MAX_LIMIT
+    if limite:
+        limite = min(limite, settings.PAGINATION_MAX_LIMIT)
+    return Pagina(limit=limite, cursor=cursor)
+
+
+def _serializar(valor):
+    if isinstance(valor, datetime):
+        return {"dt": valor.isoformat()}
+    if isinstance(valor, date):
+        return {"d": valor.isoformat()}
+    return valor
+
+
+def _deserializar(valor):
+    if isinstance(valor, dict):
+        if "dt" in valor:
+            return datetime.fromisoformat(valor["dt"])
+        if "d" in valor:
+            return date.fromisoformat(valor["d"])
+    return valor
+
+
+def encode_cursor(valores: Sequence) -> str:
+    """Cursor opaco (base64 url-safe de JSON) con los valores de la última fila"""
+    crudo = json.dumps([_serializar(v) for v in valores], separators=(",", ":"))
+    return base64.urlsafe_b64encode(crudo.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str, n_claves: int) -> List:
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    if not isinstance(valores, list) or len(valores) != n_claves:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return [_deserializar(v) for v in valores]
+
+
+def _anulable(col) -> bool:
+    expresion = getattr(col, "expression", col)
+    return getattr(expresion, "nullable", True)
+
+
+def _igual(col, valor):
+    return col.is_(None) if valor is None else col == valor
+
+
+def _sigue(col, desc: bool, valor):
+    """Valores de `col` que van después de `valor`. MySQL y SQLite ordenan NULL como
+    el menor valor: primero en ASC y al final en DESC."""
+    if valor is None:
+        return col.isnot(None) if not desc else false()
+    if desc:
+        return or_(col < valor, col.is_(None)) if _anulable(col) else col < valor
+    return col > valor
+
+
+def _despues_de(orden: Orden, valores: Sequence):
+    """(k1, k2, ...) estrictamente posterior a `valores` respetando la dirección de cada clave"""
+    condiciones = []
+    for i, (col, desc) in enumerate(orden):
+        iguales = [_igual(orden[j][0], valores[j]) for j in range(i)]
+        condiciones.append(and_(*iguales, _sigue(col, desc, valores[i])))
+    return or_(*condiciones)
+
+
+def paginar(query, orden: Orden, pagina: Optional[Pagina]) -> list:
+    """
+    Ordena la query por `orden` y devuelve solo la página pedida
+
+    Args:
+        query: Query ORM sobre un modelo (las filas deben tener los atributos de `orden`)
+        orden: Claves de orden; la última debe ser única (normalmente el id)
+        pagina: Parámetros de la página, o None para devolver todo
+
+    Returns:
+        Lista de filas; si quedan más, pagina.next_cursor queda con el cursor siguiente
+    """
+    query = query.order_by(None).order_by(*[col.desc() if desc else col.asc() for col, desc in orden])
+    if pagina is None or not pagina.limit:
+        return query.all()
+    if pagina.cursor:
+        query = query.filter(_despues_de(orden, decode_cursor(pagina.cursor, len(orden))))
+    filas = query.limit(pagina.limit + 1).all()
+    if len(filas) > pagina.limit:
+        filas = filas[:pagina.limit]
+        pagina.next_cursor = encode_cursor([getattr(filas[-1], col.key) for col, _ in orden])
+    return filas
+
+
+def aplicar_cabeceras(response: Response, pagina: Optional[Pagina]) -> None:
+    """Expone el cursor de la página siguiente en X-Next-Cursor (si la hay)"""
+    if pagina is not None and pagina.next_cursor:
+        response.headers["X-Next-Cursor"] = pagina.next_cursor
+
+
+def iterar_por_bloques(query, orden: Orden, tamano: int):
+    """
+    Recorre una query completa en bloques de `tamano` filas (keyset), para procesos
+    masivos que escriben y hacen commit entre bloques: cada bloque es una consulta
+    nueva, así que no queda ningún cursor abierto mientras se escribe.
+
+    Yields:
+        Listas de filas de hasta `tamano` elementos
+    """
+    pagina = Pagina(limit=tamano)
+    while True:
+        filas = paginar(query, orden, pagina)
+        if not filas:
+            return
+        yield filas
+        if not pagina.next_cursor:
+            return
+        pagina = Pagina(limit=tamano, cursor=pagina.next_cursor)
@@ -0,0 +1,96 @@
+"""
+Hash y verificación de contraseñas fuera del event loop
+=======================================================
+
+bcrypt es deliberadamente caro (~250 ms con costo 12). Las funciones de este
+módulo lo ejecutan en un pool de procesos configurable (PASSWORD_HASH_WORKERS;
+0 = en el hilo que llama) y exponen variantes async que no bloquean el loop.
+
+El costo es ajustable con BCRYPT_ROUNDS. Cuando cambia, los hashes existentes
+se regeneran de forma transparente en el siguiente login (necesita_rehash).
+"""
+
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from passlib.context import CryptContext
+
+from settings import settings
+
+bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__default_rounds=settings.BCRYPT_ROUNDS)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+# Funciones que corren en los procesos del pool (nivel de módulo para poder serializarlas)
+def _hash(password: str, rounds: int) -> str:
+    return bcrypt_context.handler("bcrypt").using(rounds=rounds).hash(password)
+
+
+def _verify(password: str, hashed: str) -> bool:
+    try:
+        return bcrypt_context.verify(password, hashed)
+    except (ValueError, TypeError):
+        return False  # Hash vacío o con formato desconocido: credenciales inválidas
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    if settings.PASSWORD_HASH_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # spawn: los workers no heredan hilos ni conexiones abiertas del proceso web
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.PASSWORD_HASH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def cerrar_pool() -> None:
+    """Detiene los procesos del pool (se vuelve a crear al próximo uso)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
+
+
+def hash_password(password: str) -> str:
+    pool = _get_pool()
+    rounds = settings.BCRYPT_ROUNDS
+    return pool.submit(_hash, password, rounds).result() if pool else _hash(password, rounds)
+
+
+def verify_password(password: str, hashed: str) -> bool:
+    pool = _get_pool()
+    return pool.submit(_verify, password, hashed).result() if pool else _verify(password, hashed)
+
+
+async def hash_password_async(password: str) -> str:
+    pool = _get_pool()
+    if pool is None:
+        return await asyncio.to_thread(_hash, password, settings.BCRYPT_ROUNDS)
+    return await asyncio.get_running_loop().run_in_executor(pool, _hash, password, settings.BCRYPT_ROUNDS)
+
+
+async def verify_password_async(password: str, hashed: str) -> bool:
+    pool = _get_pool()
+    if pool is None:
+        return await asyncio.to_thread(_verify, password, hashed)
+    return await asyncio.get_running_loop().run_in_executor(pool, _verify, password, hashed)
+
+
+def necesita_rehash(hashed: str) -> bool:
+    """True si el hash usa otro costo que BCRYPT_ROUNDS (o un esquema obsoleto)"""
+    try:
+        # Formato bcrypt: $2b$<costo>$<salt+hash>
+        costo = int(hashed.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return True
+    return costo != settings.BCRYPT_ROUNDS or bcrypt_context.needs_update(hashed)
@@ -0,0 +1,117 @@
+"""
+Estadísticas del pool de conexiones
+===================================
+
+Recolecta métricas del pool de SQLAlchemy mediante eventos (checkout, checkin,
+connect, invalidate) y mide la espera real de cada checkout, incluyendo los
+timeouts. Sirve para dimensionar DB_POOL_SIZE / DB_MAX_OVERFLOW con datos.
+"""
+
+import threading
+import time
+from typing import Dict
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+
+class PoolStats:
+    """Contadores acumulados de un pool (seguros entre hilos)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_total_s = 0.0
+        self.wait_max_s = 0.0
+
+    def record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.wait_total_s += seconds
+            if seconds > self.wait_max_s:
+                self.wait_max_s = seconds
+
+    def incr(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self, pool) -> Dict:
+        """
+        Combina los contadores acumulados con el estado actual del pool
+
+        Args:
+            pool: Pool del engine (engine.pool)
+
+        Returns:
+            Dict serializable con el estado del pool
+        """
+        with self._lock:
+            waits = self.checkouts + self.timeouts
+            data = {
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "avg_checkout_wait_ms": round((self.wait_total_s / waits) * 1000, 3) if waits else 0.0,
+                "max_checkout_wait_ms": round(self.wait_max_s * 1000, 3),
+            }
+        # Estado en vivo (solo disponible en pools con cola)
+        for attr in ("size", "checkedin", "checkedout", "overflow"):
+            fn = getattr(pool, attr, None)
+            if callable(fn):
+                data[attr] = fn()
+        data["timeout_s"] = getattr(pool, "_timeout", None)
+        return data
+
+
+def timed_pool_class(base, stats: PoolStats):
+    """
+    Crea una subclase del pool que mide cuánto espera cada checkout.
+
+    Se usa una subclase (y no una instancia) para que `pool.recreate()`
+    (p.ej. tras engine.dispose()) conserve las mismas estadísticas.
+    """
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            return base._do_get(self)
+        except exc.TimeoutError:
+            stats.incr("timeouts")
+            raise
+        finally:
+            stats.record_wait(time.perf_counter() - t0)
+
+    return type(f"Timed{base.__name__}", (base,), {"_do_get": _do_get})
+
+
+def register_pool_events(engine, stats: PoolStats) -> None:
+    """Registra los listeners de pool sobre un engine síncrono"""
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, conn_record):
+        stats.incr("connects")
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_conn, conn_record, conn_proxy):
+        stats.incr("checkouts")
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_conn, conn_record):
+        stats.incr("checkins")
+
+    @event.listens_for(engine, "invalidate")
+    def _on_invalidate(dbapi_conn, conn_record, exception):
+        stats.incr("invalidations")
+
+
+# Estadísticas globales por engine (leídas por /admin/pool-stats)
+sync_pool_stats = PoolStats()
+async_pool_stats = PoolStats()
+
+SyncTimedPool = timed_pool_class(QueuePool, sync_pool_stats)
+AsyncTimedPool = timed_pool_class(AsyncAdaptedQueuePool, async_pool_stats)
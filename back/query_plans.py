@@ -0,0 +1,136 @@
+"""
+Planes de ejecución de consultas críticas
+=========================================
+
+Captura las sentencias SELECT que emite un bloque de código y las pasa por
+EXPLAIN (EXPLAIN QUERY PLAN en SQLite) para detectar recorridos completos de
+tabla y ordenamientos en tabla temporal (filesort) sobre tablas grandes.
+Lo usan las pruebas de regresión de índices (test_query_plans.py).
+"""
+
+import re
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, text
+
+
+@dataclass
+class ProblemaPlan:
+    """Un paso del plan que recorre o reordena una tabla por encima del umbral"""
+    tipo: str          # "scan" | "filesort"
+    tabla: str
+    filas: int
+    detalle: str
+    sentencia: str
+
+    def __str__(self) -> str:
+        return f"{self.tipo} en {self.tabla} ({self.filas} filas): {self.detalle}\n  {self.sentencia}"
+
+
+@contextmanager
+def capturar_selects(engine):
+    """
+    Registra las sentencias SELECT (con sus parámetros) ejecutadas en el engine
+
+    Yields:
+        Lista que se va llenando con tuplas (sentencia, parámetros)
+    """
+    capturadas: List[Tuple[str, object]] = []
+
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and not executemany:
+            capturadas.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", _before)
+    try:
+        yield capturadas
+    finally:
+        event.remove(engine, "before_cursor_execute", _before)
+
+
+def _filas_por_tabla(conn, cache: Dict[str, int], tabla: str) -> int:
+    if tabla not in cache:
+        cache[tabla] = conn.execute(text(f"SELECT COUNT(*) FROM {tabla}")).scalar() or 0
+    return cache[tabla]
+
+
+def _problemas_sqlite(conn, sentencia: str, parametros, umbral: int, cache: Dict[str, int]) -> List[ProblemaPlan]:
+    plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sentencia}", parametros).fetchall()
+    problemas, tablas = [], []
+    for fila in plan:
+        detalle = fila[-1]
+        # "SCAN tabla", "SCAN tabla AS alias", "SEARCH tabla USING INDEX ..."
+        m = re.match(r"(SCAN|SEARCH) (\w+)", detalle)
+        if m:
+            tablas.append(m.group(2))
+            # Un SCAN con índice de cobertura sigue leyendo toda la tabla, pero por el índice
+            if m.group(1) == "SCAN" and "COVERING INDEX" not in detalle:
+                filas = _filas_por_tabla(conn, cache, m.group(2))
+                if filas > umbral:
+                    problemas.append(ProblemaPlan("scan", m.group(2), filas, detalle, sentencia))
+        elif "USE TEMP B-TREE FOR" in detalle and tablas:
+            # SQLite no dice qué tabla se ordena: se atribuye a la mayor del plan
+            filas, tabla = max((_filas_por_tabla(conn, cache, t), t) for t in tablas)
+            if filas > umbral:
+                problemas.append(ProblemaPlan("filesort", tabla, filas, detalle, sentencia))
+    return problemas
+
+
+def _problemas_mysql(conn, sentencia: str, parametros, umbral: int, cache: Dict[str, int]) -> List[ProblemaPlan]:
+    resultado = conn.exec_driver_sql(f"EXPLAIN {sentencia}", parametros)
+    columnas = list(resultado.keys())
+    problemas = []
+    for fila in resultado.fetchall():
+        paso = dict(zip(columnas, fila))
+        tabla = paso.get("table") or ""
+        if not tabla or tabla.startswith("<"):
+            continue
+        filas = _filas_por_tabla(conn, cache, tabla)
+        if filas <= umbral:
+            continue
+        extra = paso.get("Extra") or ""
+        if paso.get("type") == "ALL":
+            problemas.append(ProblemaPlan("scan", tabla, filas, f"type=ALL {extra}".strip(), sentencia))
+        if "Using filesort" in extra:
+            problemas.append(ProblemaPlan("filesort", tabla, filas, extra, sentencia))
+    return problemas
+
+
+def problemas_de_plan(conn, sentencia: str, parametros=None, umbral_filas: int = 100,
+                      cache: Optional[Dict[str, int]] = None) -> List[ProblemaPlan]:
+    """
+    Ejecuta EXPLAIN sobre una sentencia y devuelve los pasos problemáticos
+
+    Args:
+        conn: Conexión SQLAlchemy (SQLite o MySQL)
+        sentencia: SQL tal como lo emitió el driver (con sus marcadores)
+        parametros: Parámetros del driver para la sentencia
+        umbral_filas: Solo se reportan tablas con más filas que esto
+        cache: Conteo de filas por tabla reutilizable entre sentencias
+
+    Returns:
+        Lista de ProblemaPlan (vacía si el plan usa índices)
+    """
+    cache = {} if cache is None else cache
+    parametros = parametros if parametros is not None else ()
+    if conn.dialect.name == "sqlite":
+        return _problemas_sqlite(conn, sentencia, parametros, umbral_filas, cache)
+    if conn.dialect.name == "mysql":
+        return _problemas_mysql(conn, sentencia, parametros, umbral_filas, cache)
+    raise ValueError(f"Dialecto sin soporte de EXPLAIN: {conn.dialect.name}")
+
+
+def problemas_de_capturas(engine, capturadas: List[Tuple[str, object]], umbral_filas: int = 100) -> List[ProblemaPlan]:
+    """Analiza todas las sentencias capturadas con capturar_selects (sin repetir formas)"""
+    cache: Dict[str, int] = {}
+    vistas = set()
+    problemas = []
+    with engine.connect() as conn:
+        for sentencia, parametros in capturadas:
+            if sentencia in vistas:
+                continue
+            vistas.add(sentencia)
+            problemas += problemas_de_plan(conn, sentencia, parametros, umbral_filas, cache)
+    return problemas
@@ -0,0 +1,85 @@
+"""
+Métricas de consultas SQL por request
+=====================================
+
+Cuenta las sentencias ejecutadas y el tiempo total en base de datos de cada
+request mediante los eventos before/after_cursor_execute de SQLAlchemy.
+El middleware de main.py expone los valores en las cabeceras X-DB-Queries y
+X-DB-Time-ms y registra como sospechosas de N+1 las sentencias con la misma
+forma que se repiten dentro de un mismo request.
+"""
+
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+
+
+class QueryStats:
+    """Acumulador de consultas de un request"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_s = 0.0
+        self.shapes: Counter = Counter()
+
+    @property
+    def total_ms(self) -> float:
+        return round(self.total_s * 1000, 3)
+
+    def n_plus_one_suspects(self, threshold: int) -> List[Tuple[str, int]]:
+        """
+        Sentencias idénticas (misma forma, parámetros aparte) repetidas en el request
+
+        Args:
+            threshold: Repeticiones mínimas para considerarla sospechosa
+
+        Returns:
+            Lista de (sentencia, repeticiones) ordenada de mayor a menor
+        """
+        return [(stmt, n) for stmt, n in self.shapes.most_common() if n >= threshold]
+
+
+# Stats del request en curso (None fuera de un request: scripts, tareas, etc.)
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def start_request() -> Tuple[QueryStats, object]:
+    """Inicia el conteo para el request actual; devuelve (stats, token para reset)"""
+    stats = QueryStats()
+    return stats, _current_stats.set(stats)
+
+
+def end_request(token) -> None:
+    _current_stats.reset(token)
+
+
+def current_stats() -> Optional[QueryStats]:
+    return _current_stats.get()
+
+
+def register_query_events(engine) -> None:
+    """Registra los listeners de cursor sobre un engine síncrono"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_stats_t0", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        t0_stack = conn.info.get("query_stats_t0")
+        if not t0_stack:
+            return
+        elapsed = time.perf_counter() - t0_stack.pop()
+        stats = _current_stats.get()
+        if stats is None:
+            return
+        stats.count += 1
+        stats.total_s += elapsed
+        stats.shapes[statement] += 1
+
+
+def headers_for(stats: QueryStats) -> Dict[str, str]:
+    return {"X-DB-Queries": str(stats.count), "X-DB-Time-ms": f"{stats.total_ms:.3f}"}
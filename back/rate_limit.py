@@ -0,0 +1,293 @@
+"""
+Límite de peticiones (token bucket) para rutas sensibles
+========================================================
+
+Login, recuperación de contraseña, reenvío de verificación y el heartbeat de
+tracking son públicos o muy frecuentes: un cliente con bucles de reintento
+puede ocupar todo el pool de la BD. RateLimitMiddleware aplica, antes de
+entrar a la ruta (sin tocar la BD), dos cubetas por petición:
+
+- por IP del cliente (RATE_LIMIT_IP, por ruta)
+- por identidad: username/email del cuerpo o el token del heartbeat
+
+Si alguna está vacía responde 429 con Retry-After. Cada límite es
+"capacidad/segundos": la cubeta admite ráfagas de `capacidad` y se rellena a
+capacidad/segundos fichas por segundo.
+
+El estado vive en memoria del proceso (uno por worker) o en Redis si
+REDIS_URL está configurado. Si Redis falla se usa la memoria local.
+
+En memoria solo se descartan cubetas ya rellenas (descartarlas no cambia
+nada): con muchas identidades activas a la vez el diccionario puede pasar de
+_MAX_CUBETAS_MEMORIA. Solo al llegar a _MAX_CUBETAS_MEMORIA_DURO se descartan
+también cubetas vacías, y la cubeta de esa identidad se reinicia. Con Redis
+las cubetas vencen solas.
+
+La IP es la del socket (scope["client"]): detrás de un proxy, arrancar
+uvicorn con --proxy-headers para que sea la del cliente real.
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs
+
+from starlette.responses import JSONResponse
+
+import redis_conn
+from settings import settings
+
+_PREFIJO_REDIS = "bls:ratelimit:"
+_MAX_CUBETAS_MEMORIA = 100_000
+_MAX_CUBETAS_MEMORIA_DURO = 10 * _MAX_CUBETAS_MEMORIA
+
+
+@dataclass(frozen=True)
+class Limite:
+    capacidad: int
+    periodo_s: float
+
+    @property
+    def tasa(self) -> float:
+        """Fichas que se recuperan por segundo"""
+        return self.capacidad / self.periodo_s
+
+    @classmethod
+    def desde_texto(cls, texto: str) -> "Limite":
+        """'10/60' -> 10 peticiones cada 60 s"""
+        capacidad, periodo = texto.split("/", 1)
+        return cls(max(1, int(capacidad)), max(1.0, float(periodo)))
+
+
+def _cubeta(fichas: float, ts: float, limite: Limite, ahora: float) -> Tuple[float, float]:
+    """Rellena la cubeta hasta `ahora` e intenta tomar una ficha.
+    Devuelve (fichas restantes, segundos de espera; 0 = permitido)"""
+    fichas = min(float(limite.capacidad), fichas + (ahora - ts) * limite.tasa)
+    if fichas >= 1:
+        return fichas - 1, 0.0
+    return fichas, (1 - fichas) / limite.tasa
+
+
+class _Memoria:
+    def __init__(self):
+        # clave -> (fichas, ts, límite), de la menos a la más recientemente usada
+        self._cubetas: "OrderedDict[str, Tuple[float, float, Limite]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consumir(self, clave: str, limite: Limite) -> float:
+        ahora = time.monotonic()
+        with self._lock:
+            fichas, ts, _ = self._cubetas.get(clave, (float(limite.capacidad), ahora, limite))
+            fichas, espera = _cubeta(fichas, ts, limite, ahora)
+            self._cubetas[clave] = (fichas, ahora, limite)
+            self._cubetas.move_to_end(clave)
+            self._descartar(ahora)
+        return espera
+
+    def _descartar(self, ahora: float) -> None:
+        """Descarta las cubetas más antiguas que ya se rellenaron (equivalen a una nueva).
+        Si la más antigua aún no se rellenó, las demás (usadas después) tampoco."""
+        while len(self._cubetas) > _MAX_CUBETAS_MEMORIA:
+            fichas, ts, limite = next(iter(self._cubetas.values()))
+            llena = fichas + (ahora - ts) * limite.tasa >= limite.capacidad
+            if not llena and len(self._cubetas) <= _MAX_CUBETAS_MEMORIA_DURO:
+                return
+            self._cubetas.popitem(last=False)
+
+    def reiniciar(self) -> None:
+        with self._lock:
+            self._cubetas.clear()
+
+
+class _Redis:
+    """Cubeta en un hash de Redis, actualizada con WATCH/MULTI (sin scripts Lua)"""
+
+    def __init__(self, cliente):
+        self.cliente = cliente
+
+    def consumir(self, clave: str, limite: Limite) -> float:
+        k = f"{_PREFIJO_REDIS}{clave}"
+
+        def _tx(pipe):
+            fichas, ts = pipe.hmget(k, "fichas", "ts")
+            ahora = time.time()
+            previas = float(fichas) if fichas is not None else float(limite.capacidad)
+            fichas, espera = _cubeta(previas, float(ts) if ts is not None else ahora, limite, ahora)
+            pipe.multi()
+            pipe.hset(k, mapping={"fichas": fichas, "ts": ahora})
+            pipe.expire(k, math.ceil(limite.periodo_s) + 1)
+            return espera
+
+        return self.cliente.transaction(_tx, k, value_from_callable=True)
+
+    def reiniciar(self) -> None:
+        claves = list(self.cliente.scan_iter(f"{_PREFIJO_REDIS}*"))
+        if claves:
+            self.cliente.delete(*claves)
+
+
+_memoria = _Memoria()
+
+
+def _backend():
+    cliente = redis_conn.get_redis()
+    return _Redis(cliente) if cliente is not None else _memoria
+
+
+def consumir(clave: str, limite: Limite) -> float:
+    """Toma una ficha de la cubeta `clave`; devuelve los segundos a esperar (0 = permitido)"""
+    backend = _backend()
+    if backend is _memoria:
+        return _memoria.consumir(clave, limite)
+    try:
+        return backend.consumir(clave, limite)
+    except Exception as e:
+        print(f"[WARN] Rate limit en Redis no disponible, se usa memoria local: {e}")
+        return _memoria.consumir(clave, limite)
+
+
+def reiniciar() -> None:
+    """Vacía todas las cubetas (pruebas y mantenimiento)"""
+    _memoria.reiniciar()
+    cliente = redis_conn.get_redis()
+    if cliente is not None:
+        try:
+            _Redis(cliente).reiniciar()
+        except Exception as e:
+            print(f"[WARN] No se pudieron reiniciar las cubetas en Redis: {e}")
+
+
+# ===== Identidad de cada ruta =====
+def _json(cuerpo: bytes) -> dict:
+    try:
+        datos = json.loads(cuerpo or b"{}")
+    except ValueError:
+        return {}
+    return datos if isinstance(datos, dict) else {}
+
+
+def _texto(valor) -> Optional[str]:
+    if valor is None:
+        return None
+    return str(valor).strip().lower() or None
+
+
+def _id_login(scope: dict, cuerpo: bytes) -> Optional[str]:
+    return _texto(_json(cuerpo).get("username"))
+
+
+def _id_forgot(scope: dict, cuerpo: bytes) -> Optional[str]:
+    datos = _json(cuerpo)
+    return _texto(datos.get("username") or datos.get("email"))
+
+
+def _id_resend(scope: dict, cuerpo: bytes) -> Optional[str]:
+    email = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("email")
+    return _texto(email[0]) if email else None
+
+
+def _id_token(scope: dict, cuerpo: bytes) -> Optional[str]:
+    # El token identifica la sesión sin decodificarlo (hash para no guardarlo en claro)
+    for nombre, valor in scope.get("headers", []):
+        if nombre == b"authorization":
+            return hashlib.sha256(valor).hexdigest()[:32]
+    return None
+
+
+@dataclass(frozen=True)
+class Regla:
+    nombre: str
+    limite: Limite
+    identidad: Callable[[dict, bytes], Optional[str]]
+    lee_cuerpo: bool = False
+
+
+@lru_cache(maxsize=8)
+def _limite(texto: str) -> Limite:
+    return Limite.desde_texto(texto)
+
+
+@lru_cache(maxsize=8)
+def _reglas(login: str, correo: str, heartbeat: str) -> Dict[Tuple[str, str], Regla]:
+    return {
+        ("POST", "/auth/login"): Regla("login", _limite(login), _id_login, True),
+        ("POST", "/auth/forgot-password"): Regla("forgot-password", _limite(correo), _id_forgot, True),
+        ("POST", "/auth/resend-verification-email"): Regla("resend-verification", _limite(correo), _id_resend),
+        ("POST", "/auth/tracking/heartbeat"): Regla("heartbeat", _limite(heartbeat), _id_token),
+    }
+
+
+def reglas() -> Dict[Tuple[str, str], Regla]:
+    """Rutas limitadas (método, path) -> regla; se construyen una vez por combinación de settings"""
+    return _reglas(settings.RATE_LIMIT_LOGIN, settings.RATE_LIMIT_EMAIL, settings.RATE_LIMIT_HEARTBEAT)
+
+
+def comprobar(regla: Regla, ip: Optional[str], identidad: Optional[str]) -> float:
+    """Segundos de espera si la petición excede algún límite (0 = permitida)"""
+    if ip:
+        espera = consumir(f"{regla.nombre}:ip:{ip}", _limite(settings.RATE_LIMIT_IP))
+        if espera:
+            return espera
+    if identidad:
+        return consumir(f"{regla.nombre}:id:{identidad}", regla.limite)
+    return 0.0
+
+
+class RateLimitMiddleware:
+    """Middleware ASGI: responde 429 antes de llegar a la ruta (y a la BD)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.RATE_LIMIT_ENABLED:
+            return await self.app(scope, receive, send)
+        regla = reglas().get((scope["method"], scope["path"]))
+        if regla is None:
+            return await self.app(scope, receive, send)
+
+        cuerpo = b""
+        if regla.lee_cuerpo:
+            # Se lee el cuerpo completo y se vuelve a entregar intacto a la ruta
+            partes = []
+            while True:
+                mensaje = await receive()
+                partes.append(mensaje.get("body", b""))
+                if mensaje["type"] != "http.request" or not mensaje.get("more_body", False):
+                    break
+            cuerpo = b"".join(partes)
+            entregado = False
+            recibir_original = receive
+
+            async def receive():
+                nonlocal entregado
+                if entregado:
+                    return await recibir_original()
+                entregado = True
+                return {"type": "http.request", "body": cuerpo, "more_body": False}
+
+        cliente = scope.get("client")
+        ip = cliente[0] if cliente else None
+        identidad = regla.identidad(scope, cuerpo)
+        if isinstance(_backend(), _Redis):
+            espera = await asyncio.to_thread(comprobar, regla, ip, identidad)
+        else:
+            espera = comprobar(regla, ip, identidad)
+
+        if espera:
+            segundos = max(1, math.ceil(espera))
+            print(f"[WARN] Rate limit {regla.nombre}: ip={ip} reintentar en {segundos}s")
+            respuesta = JSONResponse(
+                {"detail": "Demasiadas solicitudes. Intenta de nuevo más tarde."},
+                status_code=429,
+                headers={"Retry-After": str(segundos)},
+            )
+            return await respuesta(scope, receive, send)
+        return await self.app(scope, receive, send)
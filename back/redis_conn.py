@@ -0,0 +1,34 @@
+"""
+Cliente Redis compartido (opcional)
+===================================
+
+Solo se usa si REDIS_URL está configurado; sin él, las cachés y contadores
+de la app funcionan en memoria del proceso (uno por worker).
+"""
+
+import threading
+from typing import Optional
+
+from settings import settings
+
+_cliente = None
+_lock = threading.Lock()
+
+
+def get_redis():
+    """Cliente Redis (decode_responses=True) o None si REDIS_URL no está configurado"""
+    global _cliente
+    if not settings.REDIS_URL:
+        return None
+    with _lock:
+        if _cliente is None:
+            import redis
+            _cliente = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+        return _cliente
+
+
+def set_redis(cliente: Optional[object]) -> None:
+    """Reemplaza el cliente (p. ej. fakeredis en pruebas); None lo vuelve a crear desde REDIS_URL"""
+    global _cliente
+    with _lock:
+        _cliente = cliente
@@ -0,0 +1,82 @@
+"""
+Revocación inmediata de tokens de estudiantes desactivados
+==========================================================
+
+Un JWT sigue siendo válido hasta su `exp` aunque la matrícula se desactive.
+Este módulo mantiene en memoria el conjunto de usernames de estudiantes con
+matrícula inactiva. La dependencia de autenticación lo consulta en cada
+request con costo O(1) y sin ir a la BD.
+
+- crud.toggle_matricula_estudiante actualiza el conjunto del worker al instante.
+- Los demás workers lo recargan desde la BD cada REVOCACIONES_TTL segundos
+  (una consulta por worker y periodo, hecha por el primer request que lo note).
+"""
+
+import threading
+import time
+from typing import FrozenSet, Optional
+
+from settings import settings
+
+_revocados: FrozenSet[str] = frozenset()
+_vence = 0.0  # time.monotonic() en que hay que recargar (0 = cargar en el próximo uso)
+_lock = threading.Lock()
+
+
+def _cargar() -> FrozenSet[str]:
+    import models
+    from Clever_MySQL_conn import SessionLocal
+
+    with SessionLocal() as db:
+        filas = db.query(models.Registro.username).filter(
+            models.Registro.tipo_usuario == "estudiante",
+            models.Registro.matricula_activa.is_(False),
+        ).all()
+    return frozenset(username for (username,) in filas)
+
+
+def _recargar_con_lock() -> None:
+    global _revocados, _vence
+    try:
+        _revocados = _cargar()
+    except Exception as e:
+        # Se conserva el conjunto anterior y se reintenta en el próximo periodo
+        print(f"[WARN] No se pudo recargar la lista de matrículas inactivas: {e}")
+    _vence = time.monotonic() + settings.REVOCACIONES_TTL
+
+
+def _vigente() -> FrozenSet[str]:
+    if time.monotonic() < _vence:
+        return _revocados
+    with _lock:
+        if time.monotonic() >= _vence:  # Otro hilo pudo recargarlo mientras se esperaba el lock
+            _recargar_con_lock()
+        return _revocados
+
+
+def revocado(username: Optional[str]) -> bool:
+    """True si los tokens del usuario están revocados (estudiante con matrícula inactiva)"""
+    return bool(username) and username in _vigente()
+
+
+def actualizar(username: str, matricula_activa: bool) -> None:
+    """Refleja en este worker un cambio de matrícula recién guardado en la BD"""
+    global _revocados
+    with _lock:
+        if matricula_activa:
+            _revocados = _revocados - {username}
+        else:
+            _revocados = _revocados | {username}
+
+
+def recargar() -> None:
+    """Carga ahora el conjunto desde la BD (p. ej. al arrancar, fuera de un request)"""
+    with _lock:
+        _recargar_con_lock()
+
+
+def invalidar() -> None:
+    """Fuerza la recarga desde la BD en el próximo uso"""
+    global _vence
+    with _lock:
+        _vence = 0.0
@@ -1,11 +1,10 @@
 #!/usr/bin/env python3
 """
 Script para ejecutar la migración de estudiante_quiz_permiso
-Crea la tabla automáticamente usando SQLAlchemy
+Delegado al runner versionado (migrate.py), que crea tablas e índices faltantes
 """
 
-from Clever_MySQL_conn import Base, engine
-import models
+from migrate import aplicar_migraciones
 
 def run_migration():
     """Crea todas las tablas definidas en models.py si no existen"""
@@ -13,8 +12,8 @@ def run_migration():
     print("📋 Creando tabla estudiante_quiz_permiso...")
     
     try:
-        # Esto creará todas las tablas que no existan, incluyendo estudiante_quiz_permiso
-        Base.metadata.create_all(bind=engine)
+        # Aplica las migraciones pendientes (la 0001 crea las tablas que no existan)
+        aplicar_migraciones()
         print("✅ Migración completada exitosamente")
         print("✅ Tabla estudiante_quiz_permiso creada")
     except Exception as e:
@@ -0,0 +1,260 @@
+"""
+Datos de ejemplo para desarrollo local y tests
+==============================================
+
+Crea usuarios (admin, empresa, profesor y N estudiantes), unidades, quizzes
+con su asignación vigente, actividad, progreso, calificaciones, clases y
+notificaciones. Pensado para el modo SQLite (DATABASE_URL=sqlite://...), pero
+funciona contra cualquier base vacía.
+
+Uso directo:
+    DATABASE_URL=sqlite:///./bls_local.db python seed_data.py
+"""
+
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+import models
+from crud import bcrypt_context
+
+PASSWORD_DEMO = "test123"
+
+
+def sembrar_datos(
+    db: Session,
+    n_estudiantes: int = 3,
+    n_unidades: int = 2,
+    n_quizzes_por_unidad: int = 1,
+    eventos_por_unidad: int = 3,
+    tareas_por_unidad: int = 2,
+    clases_por_unidad: int = 1,
+    password: str = PASSWORD_DEMO,
+) -> Dict:
+    """
+    Inserta un conjunto coherente de datos de ejemplo (inserciones masivas)
+
+    Args:
+        db: Sesión de base de datos (se hace commit al final)
+        n_estudiantes: Cantidad de estudiantes
+        n_unidades: Cantidad de unidades (todas habilitadas para todos)
+        n_quizzes_por_unidad: Quizzes por unidad, con asignación vigente
+        eventos_por_unidad: Eventos de actividad por estudiante y unidad
+        tareas_por_unidad: Tareas calificadas por estudiante y unidad
+        clases_por_unidad: Clases del mes en curso por unidad (todos inscritos)
+        password: Contraseña común de todos los usuarios
+
+    Returns:
+        Dict con usernames e ids creados
+    """
+    now = datetime.utcnow()
+    hashed = bcrypt_context.hash(password)  # Un solo hash para todos: bcrypt es caro
+
+    def _usuario(identificador: int, username: str, tipo: str) -> Dict:
+        return {
+            "identificador": identificador,
+            "username": username,
+            "hashed_password": hashed,
+            "nombres": username.capitalize(),
+            "apellidos": "Demo",
+            "email": f"{username}@bls-demo.com",
+            "email_verified": True,
+            "tipo_usuario": tipo,
+            "matricula_activa": True,
+        }
+
+    usuarios = [
+        _usuario(1, "admin", "admin"),
+        _usuario(2, "empresa", "empresa"),
+        _usuario(3, "profesor", "profesor"),
+    ]
+    estudiantes = [f"estudiante{i}" for i in range(1, n_estudiantes + 1)]
+    estudiante_ids = list(range(100, 100 + n_estudiantes))
+    usuarios += [_usuario(eid, u, "estudiante") for eid, u in zip(estudiante_ids, estudiantes)]
+    db.execute(insert(models.Registro), usuarios)
+
+    unidad_ids = list(range(1, n_unidades + 1))
+    db.execute(insert(models.Unidad), [
+        {"id": uid, "nombre": f"Unidad {uid}", "descripcion": f"Unidad de ejemplo {uid}", "orden": uid}
+        for uid in unidad_ids
+    ])
+
+    quiz_ids = []
+    quizzes = []
+    asignaciones = []
+    for uid in unidad_ids:
+        for k in range(n_quizzes_por_unidad):
+            qid = (uid - 1) * n_quizzes_por_unidad + k + 1
+            quiz_ids.append(qid)
+            quizzes.append({
+                "id": qid,
+                "unidad_id": uid,
+                "titulo": f"Quiz {qid}",
+                "descripcion": "Quiz de ejemplo",
+                "preguntas": {"preguntas": [
+                    {"tipo": "opcion_multiple", "texto": "2 + 2", "opciones": [
+                        {"texto": "3", "correcta": False},
+                        {"texto": "4", "correcta": True},
+                    ]},
+                ]},
+                "created_at": now - timedelta(days=1),
+            })
+            asignaciones.append({
+                "quiz_id": qid,
+                "unidad_id": uid,
+                "start_at": now - timedelta(days=1),
+                "end_at": now + timedelta(days=30),
+                "max_intentos": 0,
+                "created_at": now - timedelta(days=1),
+            })
+    if quizzes:
+        db.execute(insert(models.Quiz), quizzes)
+        db.execute(insert(models.QuizAsignacion), asignaciones)
+
+    db.execute(insert(models.estudiante_unidad), [
+        {"estudiante_id": eid, "unidad_id": uid, "habilitada": True}
+        for eid in estudiante_ids for uid in unidad_ids
+    ])
+    db.execute(insert(models.profesor_estudiante), [
+        {"profesor_id": 3, "estudiante_id": eid, "fecha_asignacion": now} for eid in estudiante_ids
+    ])
+
+    actividad, progreso, tareas, quiz_cal, notificaciones = [], [], [], [], []
+    for i, username in enumerate(estudiantes):
+        for uid in unidad_ids:
+            for e in range(eventos_por_unidad):
+                actividad.append({
+                    "username": username,
+                    "unidad_id": uid,
+                    "tipo_evento": "heartbeat",
+                    "duracion_min": 5,
+                    "metadata_json": {},
+                    "creado_at": now - timedelta(days=i % 10, minutes=e),
+                })
+            progreso.append({
+                "username": username,
+                "unidad_id": uid,
+                "porcentaje_completado": (i * 7 + uid * 13) % 101,
+                "score": (i * 11 + uid * 5) % 101,
+                "tiempo_dedicado_min": 5 * eventos_por_unidad,
+                "ultima_actividad_at": now,
+            })
+            for t in range(tareas_por_unidad):
+                tareas.append({
+                    "estudiante_username": username,
+                    "unidad_id": uid,
+                    "filename": f"tarea_{uid}_{t}.pdf",
+                    "score": (i * 17 + uid * 3 + t * 29) % 101,
+                    "created_at": now,
+                    "updated_at": now,
+                })
+        for qid, q in zip(quiz_ids, quizzes):
+            quiz_cal.append({
+                "estudiante_username": username,
+                "unidad_id": q["unidad_id"],
+                "quiz_id": qid,
+                "score": (i * 23 + qid * 7) % 101,
+                "created_at": now,
+                "updated_at": now,
+                "aprobada": bool(i % 2),
+                "origen_manual": False,
+            })
+        notificaciones.append({
+            "usuario_id": estudiante_ids[i],
+            "tipo": "info",
+            "mensaje": f"Bienvenido {username}",
+            "leida": False,
+            "fecha_creacion": now,
+            "usuario_remitente_id": 3,
+        })
+    for rows, model in (
+        (actividad, models.ActividadEstudiante),
+        (progreso, models.EstudianteProgresoUnidad),
+        (tareas, models.TareaCalificacion),
+        (quiz_cal, models.EstudianteQuizCalificacion),
+        (notificaciones, models.Notificacion),
+    ):
+        if rows:
+            db.execute(insert(model), rows)
+
+    # Clases del mes en curso (hasta hoy), con todos los estudiantes inscritos
+    inicio_mes = now.replace(day=1)
+    clases = []
+    for uid in unidad_ids:
+        for k in range(clases_por_unidad):
+            cid = (uid - 1) * clases_por_unidad + k + 1
+            clases.append({
+                "id": cid,
+                "dia": (inicio_mes + timedelta(days=cid % now.day)).strftime("%Y-%m-%d"),
+                "hora": "10:00",
+                "tema": f"Clase {cid} unidad {uid}",
+                "profesor_username": "profesor",
+                "unidad_id": uid,
+            })
+    clase_ids = [c["id"] for c in clases]
+    if clases:
+        db.execute(insert(models.Clase), clases)
+    if clase_ids and estudiante_ids:
+        db.execute(insert(models.clase_estudiante), [
+            {"clase_id": cid, "estudiante_id": eid} for cid in clase_ids for eid in estudiante_ids
+        ])
+
+    db.commit()
+    return {
+        "password": password,
+        "admin": "admin",
+        "empresa": "empresa",
+        "profesor": "profesor",
+        "profesor_id": 3,
+        "estudiantes": estudiantes,
+        "estudiante_ids": estudiante_ids,
+        "unidad_ids": unidad_ids,
+        "quiz_ids": quiz_ids,
+        "clase_ids": clase_ids,
+    }
+
+
+def sembrar_archivos(info: Dict, files_base_dir: Path, asistencias_dir: Path, tareas_por_unidad: int = 2) -> None:
+    """
+    Crea los archivos que algunos endpoints leen del disco: entregas en
+    SOLO_TAREAS por estudiante/unidad y un JSON de asistencia por clase
+
+    Args:
+        info: Resultado de sembrar_datos
+        files_base_dir: Equivalente a FILES_BASE_DIR
+        asistencias_dir: Equivalente a ASISTENCIAS_DIR
+        tareas_por_unidad: Archivos de tarea por estudiante y unidad
+    """
+    for username in info["estudiantes"]:
+        for uid in info["unidad_ids"]:
+            carpeta = files_base_dir / "estudiantes" / username / f"unidad_{uid}" / "SOLO_TAREAS"
+            carpeta.mkdir(parents=True, exist_ok=True)
+            for t in range(tareas_por_unidad):
+                (carpeta / f"tarea_{uid}_{t}.pdf").write_bytes(b"%PDF-1.4 demo")
+
+    asistencias_dir.mkdir(parents=True, exist_ok=True)
+    presentes = [f"{u}@bls-demo.com" for i, u in enumerate(info["estudiantes"]) if i % 3 != 0]
+    marcas = {p: 1 for p in presentes}
+    for cid in info["clase_ids"]:
+        data = {
+            "claseId": cid,
+            "presentes": presentes,
+            "participacion": marcas,
+            "camara": marcas,
+            "act_fuera_clase": {},
+            "historial": [],
+        }
+        (asistencias_dir / f"clase_{cid}.json").write_text(json.dumps(data), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    from Clever_MySQL_conn import Base, engine, SessionLocal
+
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as session:
+        info = sembrar_datos(session)
+    print(f"Datos de ejemplo creados: {len(info['estudiantes'])} estudiantes, {len(info['unidad_ids'])} unidades")
@@ -16,6 +16,8 @@ class Settings:
     SECRET_KEY: str = field(default_factory=lambda: os.getenv("SECRET_KEY", "supersecretkey"))
     ALGORITHM: str = field(default_factory=lambda: os.getenv("ALGORITHM", "HS256"))
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
+    # Vida del refresh token (rotativo, se guarda hasheado en refresh_token)
+    REFRESH_TOKEN_EXPIRE_DAYS: int = field(default_factory=lambda: int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7")))
 
     # Orígenes permitidos para CORS
     ALLOWED_ORIGINS: List[str] = field(default_factory=list)
@@ -30,6 +32,53 @@ class Settings:
     GRADES_OBJETIVO_MIN: int = field(default_factory=lambda: int(os.getenv("GRADES_OBJETIVO_MIN", "120")))
     GRADES_UMBRAL_APROBACION: int = field(default_factory=lambda: int(os.getenv("GRADES_UMBRAL_APROBACION", "60")))
 
+    # Pool de conexiones a la base de datos (por defecto, los valores históricos
+    # pensados para el límite de conexiones del plan de MySQL en Clever Cloud)
+    DB_POOL_SIZE: int = field(default_factory=lambda: int(os.getenv("DB_POOL_SIZE", "2")))
+    DB_MAX_OVERFLOW: int = field(default_factory=lambda: int(os.getenv("DB_MAX_OVERFLOW", "0")))
+    DB_POOL_TIMEOUT: float = field(default_factory=lambda: float(os.getenv("DB_POOL_TIMEOUT", "30")))
+    DB_POOL_RECYCLE: int = field(default_factory=lambda: int(os.getenv("DB_POOL_RECYCLE", "280")))
+    DB_POOL_PRE_PING: bool = field(default_factory=lambda: os.getenv("DB_POOL_PRE_PING", "true").strip().lower() in ("1", "true", "yes", "on"))
+
+    # Diagnóstico de consultas: echo de SQL (solo desarrollo) y umbral de sospecha N+1
+    DB_ECHO: bool = field(default_factory=lambda: os.getenv("DB_ECHO", "false").strip().lower() in ("1", "true", "yes", "on"))
+    DB_N1_THRESHOLD: int = field(default_factory=lambda: int(os.getenv("DB_N1_THRESHOLD", "5")))
+
+    # Paginación por cursor de los listados (0 = sin límite por defecto, compatible con clientes actuales)
+    PAGINATION_DEFAULT_LIMIT: int = field(default_factory=lambda: int(os.getenv("PAGINATION_DEFAULT_LIMIT", "0")))
+    PAGINATION_MAX_LIMIT: int = field(default_factory=lambda: int(os.getenv("PAGINATION_MAX_LIMIT", "500")))
+
+    # Procesos masivos (sync de calificaciones, limpieza de clases): filas por bloque y commit
+    BULK_CHUNK_SIZE: int = field(default_factory=lambda: int(os.getenv("BULK_CHUNK_SIZE", "500")))
+
+    # Contraseñas: costo de bcrypt (al cambiarlo se rehashea en el siguiente login) y
+    # procesos del pool que ejecutan hash/verificación (0 = en el mismo hilo)
+    BCRYPT_ROUNDS: int = field(default_factory=lambda: int(os.getenv("BCRYPT_ROUNDS", "12")))
+    PASSWORD_HASH_WORKERS: int = field(default_factory=lambda: int(os.getenv("PASSWORD_HASH_WORKERS", "2")))
+
+    # Redis compartido entre workers (opcional; vacío = cachés en memoria por proceso)
+    REDIS_URL: str = field(default_factory=lambda: os.getenv("REDIS_URL", "").strip())
+
+    # Segundos que un worker conserva las asignaciones profesor → estudiantes en memoria
+    ASIGNACIONES_CACHE_TTL: int = field(default_factory=lambda: int(os.getenv("ASIGNACIONES_CACHE_TTL", "300")))
+
+    # Segundos entre recargas de la lista de matrículas inactivas (tokens revocados) en cada worker
+    REVOCACIONES_TTL: int = field(default_factory=lambda: int(os.getenv("REVOCACIONES_TTL", "30")))
+
+    # Caché LRU de claims JWT verificados por worker (0 = desactivada)
+    JWT_CACHE_SIZE: int = field(default_factory=lambda: int(os.getenv("JWT_CACHE_SIZE", "4096")))
+
+    # Límites de peticiones "capacidad/segundos" (rate_limit.py): por identidad en cada ruta
+    # y por IP del cliente en cada ruta limitada
+    RATE_LIMIT_ENABLED: bool = field(default_factory=lambda: os.getenv("RATE_LIMIT_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on"))
+    RATE_LIMIT_LOGIN: str = field(default_factory=lambda: os.getenv("RATE_LIMIT_LOGIN", "10/60"))
+    RATE_LIMIT_EMAIL: str = field(default_factory=lambda: os.getenv("RATE_LIMIT_EMAIL", "3/300"))
+    RATE_LIMIT_HEARTBEAT: str = field(default_factory=lambda: os.getenv("RATE_LIMIT_HEARTBEAT", "6/60"))
+    RATE_LIMIT_IP: str = field(default_factory=lambda: os.getenv("RATE_LIMIT_IP", "300/60"))
+
+    # Archivo de historial al desactivar la matrícula (se restaura al reactivarla)
+    ARCHIVAR_INACTIVOS: bool = field(default_factory=lambda: os.getenv("ARCHIVAR_INACTIVOS", "true").strip().lower() in ("1", "true", "yes", "on"))
+
     def __post_init__(self):
         # Construir ALLOWED_ORIGINS por defecto si no vienen de env
         env_origins = os.getenv("ALLOWED_ORIGINS")
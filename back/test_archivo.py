@@ -0,0 +1,98 @@
+"""
+Pruebas del archivo de historial de estudiantes inactivos
+"""
+
+import models
+
+
+def _conteos(db, username, identificador):
+    return (
+        db.query(models.ActividadEstudiante).filter_by(username=username).count(),
+        db.query(models.TareaCalificacion).filter_by(estudiante_username=username).count(),
+        db.query(models.Notificacion).filter_by(usuario_id=identificador).count(),
+    )
+
+
+def test_toggle_matricula_archiva_y_restaura(client, seed, auth_headers, db, monkeypatch):
+    from settings import settings
+    monkeypatch.setattr(settings, "BULK_CHUNK_SIZE", 2)  # Varios bloques por tabla
+    username, identificador = seed["estudiantes"][0], seed["estudiante_ids"][0]
+    admin = auth_headers("admin")
+    antes = _conteos(db, username, identificador)
+    assert all(antes)
+
+    resp = client.put(f"/auth/matriculas/{username}/toggle", headers=admin)
+    assert resp.json()["matricula_activa"] is False
+    db.expire_all()
+    assert _conteos(db, username, identificador) == (0, 0, 0)
+    # Los demás estudiantes no se tocan
+    assert db.query(models.ActividadEstudiante).filter_by(username=seed["estudiantes"][1]).count() > 0
+
+    # Las calificaciones archivadas solo se leen si se piden
+    url = f"/auth/grades/estudiantes/{username}/tareas"
+    assert client.get(url, headers=admin).json() == []
+    archivadas = client.get(url, params={"incluir_archivo": "true"}, headers=admin).json()
+    assert len(archivadas) == antes[1] and all(t["archivada"] for t in archivadas)
+    detalle = f"/api/v2/grades/estudiantes/{username}/unidades/{seed['unidad_ids'][0]}"
+    assert client.get(detalle, headers=admin).json()["componentes"]["tareas"]["count"] == 0
+    assert client.get(detalle, params={"incluir_archivo": "true"}, headers=admin).json()["componentes"]["tareas"]["count"] > 0
+
+    # Mientras estuvo inactivo se recalificó una tarea: al restaurar gana la fila viva
+    tarea = archivadas[0]
+    db.add(models.TareaCalificacion(estudiante_username=username, unidad_id=tarea["unidad_id"],
+                                    filename=tarea["filename"], score=99))
+    db.commit()
+
+    resp = client.put(f"/auth/matriculas/{username}/toggle", headers=admin)
+    assert resp.json()["matricula_activa"] is True
+    db.expire_all()
+    assert _conteos(db, username, identificador) == antes
+    assert db.query(models.TareaCalificacion).filter_by(
+        estudiante_username=username, filename=tarea["filename"], unidad_id=tarea["unidad_id"]).one().score == 99
+    assert db.query(models.tarea_calificacion_archive).count() == 0
+
+
+def test_restaurar_conserva_ids(client, seed, auth_headers, db):
+    username, identificador = seed["estudiantes"][1], seed["estudiante_ids"][1]
+    admin = auth_headers("admin")
+
+    def _ids():
+        return (
+            sorted(i for (i,) in db.query(models.ActividadEstudiante.id).filter_by(username=username)),
+            sorted(i for (i,) in db.query(models.Notificacion.id).filter_by(usuario_id=identificador)),
+        )
+
+    antes = _ids()
+    client.put(f"/auth/matriculas/{username}/toggle", headers=admin)
+    client.put(f"/auth/matriculas/{username}/toggle", headers=admin)
+    db.expire_all()
+    assert _ids() == antes
+
+
+def test_movimiento_interrumpido_se_retoma(client, seed, auth_headers, db, monkeypatch):
+    import dataclasses
+    import archivo
+
+    username, identificador = seed["estudiantes"][0], seed["estudiante_ids"][0]
+    admin = auth_headers("admin")
+    antes = _conteos(db, username, identificador)
+
+    # Falla al llegar a la tercera tabla: las dos primeras ya quedaron archivadas
+    originales = list(archivo.TABLAS)
+    monkeypatch.setattr(archivo, "TABLAS", originales[:2] + [dataclasses.replace(originales[2], clave="no_existe")])
+    assert client.put(f"/auth/matriculas/{username}/toggle", headers=admin).status_code == 200
+    db.expire_all()
+    assert db.query(models.Registro).filter_by(username=username).one().historial_pendiente is True
+    assert _conteos(db, username, identificador)[0] == 0
+
+    monkeypatch.setattr(archivo, "TABLAS", originales)
+    resp = client.post("/auth/admin/procesar-archivo", headers=admin)
+    assert resp.status_code == 200, resp.text
+    db.expire_all()
+    assert _conteos(db, username, identificador) == (0, 0, 0)
+    assert db.query(models.Registro).filter_by(username=username).one().historial_pendiente is False
+
+    # Reactivar devuelve todo
+    client.put(f"/auth/matriculas/{username}/toggle", headers=admin)
+    db.expire_all()
+    assert _conteos(db, username, identificador) == antes
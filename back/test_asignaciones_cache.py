@@ -0,0 +1,92 @@
+"""
+Pruebas de la caché de asignaciones profesor → estudiantes
+"""
+
+import fakeredis
+import pytest
+
+import asignaciones_cache
+import crud
+import models
+import redis_conn
+from Clever_MySQL_conn import engine
+from query_plans import capturar_selects
+
+
+@pytest.fixture(params=["memoria", "redis"])
+def backend(request, monkeypatch):
+    if request.param == "redis":
+        from settings import settings
+        monkeypatch.setattr(settings, "REDIS_URL", "redis://fake")
+        redis_conn.set_redis(fakeredis.FakeRedis(decode_responses=True))
+        yield request.param
+        redis_conn.set_redis(None)
+    else:
+        yield request.param
+
+
+def test_verificacion_en_memoria_e_invalidacion(backend, db, seed):
+    from auth_routes import _estudiante_asignado_a_profesor
+    profesor = db.query(models.Registro).filter_by(username="profesor").one()
+    estudiante = seed["estudiantes"][0]
+
+    with capturar_selects(engine) as capturadas:
+        for _ in range(5):
+            assert _estudiante_asignado_a_profesor(db, profesor, estudiante)
+        assert not _estudiante_asignado_a_profesor(db, profesor, "admin")
+    assert len(capturadas) == 1  # Una sola carga; el resto son búsquedas en la caché
+
+    assert crud.desasignar_estudiante_profesor(db, "profesor", estudiante)
+    assert not _estudiante_asignado_a_profesor(db, profesor, estudiante)
+    assert [e.username for e in crud.obtener_estudiantes_asignados(db, "profesor")] == seed["estudiantes"][1:]
+
+    assert crud.asignar_estudiante_profesor(db, "profesor", estudiante)
+    assert _estudiante_asignado_a_profesor(db, profesor, estudiante)
+    assert [e.username for e in crud.obtener_estudiantes_asignados(db, "profesor")] == seed["estudiantes"]
+
+
+def test_cambio_de_rol_invalida(client, seed, auth_headers, db):
+    from auth_routes import _estudiante_asignado_a_profesor
+    profesor = db.query(models.Registro).filter_by(username="profesor").one()
+    estudiante = seed["estudiantes"][0]
+    assert _estudiante_asignado_a_profesor(db, profesor, estudiante)
+
+    resp = client.put(f"/auth/admin/usuarios/{estudiante}/rol", json={"tipo_usuario": "empresa"}, headers=auth_headers("admin"))
+    assert resp.status_code == 200
+    assert not _estudiante_asignado_a_profesor(db, profesor, estudiante)
+    assert asignaciones_cache.estudiantes_de(db, profesor.identificador).keys() == set(seed["estudiantes"][1:])
+
+
+class _RedisCaido:
+    def __getattr__(self, nombre):
+        def _falla(*args, **kwargs):
+            raise ConnectionError("Redis no disponible")
+        return _falla
+
+
+def test_redis_caido_usa_memoria(client, seed, auth_headers, db, monkeypatch):
+    from settings import settings
+    monkeypatch.setattr(settings, "REDIS_URL", "redis://caido")
+    redis_conn.set_redis(_RedisCaido())
+    try:
+        profesor = db.query(models.Registro).filter_by(username="profesor").one()
+        assert asignaciones_cache.estudiantes_de(db, profesor.identificador).keys() == set(seed["estudiantes"])
+        # Las vistas de respuestas de quiz del profesor siguen respondiendo
+        resp = client.get(f"/auth/quizzes/{seed['quiz_ids'][0]}/respuestas", headers=auth_headers("profesor"))
+        assert resp.status_code == 200, resp.text
+    finally:
+        redis_conn.set_redis(None)
+
+
+def test_tareas_y_resumen_del_profesor_usan_la_cache(client, seed, auth_headers, db):
+    profesor = db.query(models.Registro).filter_by(username="profesor").one()
+    asignaciones_cache.estudiantes_de(db, profesor.identificador)  # Caché ya cargada
+
+    with capturar_selects(engine) as capturadas:
+        resp = client.get("/auth/profesores/profesor/tareas", headers=auth_headers("profesor"))
+        assert resp.status_code == 200, resp.text
+        assert {t["estudiante_username"] for t in resp.json()} == set(seed["estudiantes"])
+        resp = client.get("/auth/profesores/profesor/resumen-asignaciones", headers=auth_headers("profesor"))
+        assert resp.status_code == 200, resp.text
+        assert resp.json()["estudiantes_asignados"] == len(seed["estudiantes"])
+    assert not [sql for sql, _ in capturadas if "profesor_estudiante" in sql]
@@ -0,0 +1,107 @@
+"""
+Pruebas del borrado lógico de unidades y quizzes con cascada diferida
+"""
+
+from sqlalchemy import select
+
+import borrado_logico
+import models
+
+
+def _contar(db, modelo, **filtros):
+    return db.query(modelo).filter_by(**filtros).execution_options(incluir_eliminados=True).count()
+
+
+def test_eliminar_unidad_oculta_y_purga_en_segundo_plano(client, seed, auth_headers, db, monkeypatch):
+    from settings import settings
+    monkeypatch.setattr(settings, "BULK_CHUNK_SIZE", 2)
+    admin = auth_headers("admin")
+    unidad_id = seed["unidad_ids"][0]
+
+    # Sin el purgado, la unidad queda marcada pero con sus dependientes
+    monkeypatch.setattr(borrado_logico, "purgar_eliminados", lambda *a, **k: {})
+    resp = client.delete(f"/auth/unidades/{unidad_id}", headers=admin)
+    assert resp.status_code == 200
+    monkeypatch.undo()
+    monkeypatch.setattr(settings, "BULK_CHUNK_SIZE", 2)
+
+    db.expire_all()
+    assert unidad_id not in [u["id"] for u in client.get("/auth/unidades/", headers=admin).json()]
+    assert db.get(models.Unidad, unidad_id) is None
+    assert db.query(models.Quiz).filter_by(unidad_id=unidad_id).count() == 0  # Sus quizzes también
+    assert _contar(db, models.Quiz, unidad_id=unidad_id) > 0
+    assert db.query(models.TareaCalificacion).filter_by(unidad_id=unidad_id).count() > 0
+    assert client.delete(f"/auth/unidades/{unidad_id}", headers=admin).status_code == 404
+
+    # Mientras no se purga, la unidad eliminada tampoco es accesible por las tablas pivote
+    pivote = db.query(models.estudiante_unidad).filter(models.estudiante_unidad.c.unidad_id == unidad_id)
+    assert pivote.count() == 3
+    assert borrado_logico.solo_unidades_vivas(pivote, models.estudiante_unidad.c.unidad_id).count() == 0
+
+    historial = {
+        modelo: db.query(modelo).filter_by(unidad_id=unidad_id).count()
+        for modelo in (models.TareaCalificacion, models.ActividadEstudiante, models.EstudianteQuizCalificacion,
+                       models.EstudianteProgresoUnidad)
+    }
+    borradas = client.post("/auth/admin/purgar-eliminados", headers=admin).json()["borradas"]
+    assert borradas["estudiante_unidad"] == 3 and "unidad" not in borradas
+    # El historial calificado se conserva; la unidad y sus quizzes quedan marcados para sostener las FKs
+    for modelo, n in historial.items():
+        assert db.query(modelo).filter_by(unidad_id=unidad_id).count() == n
+    assert _contar(db, models.Unidad, id=unidad_id) == 1
+    assert _contar(db, models.Quiz, unidad_id=unidad_id) > 0
+    assert db.get(models.Unidad, unidad_id) is None
+    # Una segunda corrida no tiene nada nuevo que hacer
+    assert not any(client.post("/auth/admin/purgar-eliminados", headers=admin).json()["borradas"].values())
+    # La otra unidad no se toca
+    assert db.query(models.TareaCalificacion).filter_by(unidad_id=seed["unidad_ids"][1]).count() > 0
+
+
+def test_unidad_sin_historial_se_borra(client, auth_headers, db):
+    admin = auth_headers("admin")
+    unidad = models.Unidad(nombre="Vacía", descripcion="", orden=99)
+    db.add(unidad)
+    db.commit()
+    db.add(models.Notificacion(usuario_id=1, tipo="info", mensaje="aviso", unidad_id=unidad.id))
+    db.commit()
+    unidad_id = unidad.id
+
+    assert client.delete(f"/auth/unidades/{unidad_id}", headers=admin).status_code == 200
+    db.expire_all()
+    assert _contar(db, models.Unidad, id=unidad_id) == 0
+    # Las notificaciones se conservan sin la referencia
+    assert db.query(models.Notificacion).filter_by(mensaje="aviso").one().unidad_id is None
+
+
+def test_eliminar_quiz_y_sincronizar_unidades(client, seed, auth_headers, db):
+    admin = auth_headers("admin")
+    quiz_id = seed["quiz_ids"][0]
+    assert client.delete(f"/auth/quizzes/{quiz_id}", headers=admin).json() == {"eliminado": True, "id": quiz_id}
+    # TestClient ejecuta las BackgroundTasks antes de devolver la respuesta
+    assert _contar(db, models.Quiz, id=quiz_id) == 0
+    assert db.query(models.EstudianteQuizCalificacion).filter_by(quiz_id=quiz_id).count() == 0
+
+    # Sincronizar actualiza en su lugar las unidades que siguen y solo marca la que ya no viene
+    unidades = client.get("/auth/unidades/", headers=admin).json()
+    primera, segunda = unidades[0], unidades[1]
+    tareas = db.query(models.TareaCalificacion).filter_by(unidad_id=primera["id"]).count()
+    pivotes = db.execute(select(models.estudiante_unidad).where(models.estudiante_unidad.c.unidad_id == primera["id"])).all()
+    resp = client.post("/auth/unidades/sync", json=[
+        {"nombre": "Nueva A"},
+        {"id": primera["id"], "nombre": "Renombrada", "descripcion": "otra"},
+    ], headers=admin)
+    assert resp.status_code == 200
+    nuevas = client.get("/auth/unidades/", headers=admin).json()
+    assert [u["nombre"] for u in nuevas] == ["Nueva A", "Renombrada"]
+    assert nuevas[1]["id"] == primera["id"]
+    db.expire_all()
+    assert db.query(models.TareaCalificacion).filter_by(unidad_id=primera["id"]).count() == tareas
+    assert db.execute(select(models.estudiante_unidad).where(models.estudiante_unidad.c.unidad_id == primera["id"])).all() == pivotes
+    # La que no vino queda marcada (conserva su historial) y pierde sus relaciones
+    assert db.get(models.Unidad, segunda["id"]) is None
+    assert db.execute(select(models.estudiante_unidad).where(models.estudiante_unidad.c.unidad_id == segunda["id"])).all() == []
+    assert db.query(models.TareaCalificacion).filter_by(unidad_id=segunda["id"]).count() > 0
+
+    # Enviar la misma lista otra vez no cambia nada (emparejado por nombre sin id)
+    client.post("/auth/unidades/sync", json=[{"nombre": "Nueva A"}, {"nombre": "Renombrada"}], headers=admin)
+    assert [u["id"] for u in client.get("/auth/unidades/", headers=admin).json()] == [u["id"] for u in nuevas]
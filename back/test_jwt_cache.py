@@ -0,0 +1,81 @@
+"""
+Pruebas de la caché de claims JWT
+"""
+
+import time
+
+import pytest
+from jose import jwt
+from jose.exceptions import ExpiredSignatureError, JWTError
+
+import jwt_cache
+from jwt_cache import CacheClaims
+
+
+def test_firma_verificada_una_vez_por_token(client, seed, auth_headers, monkeypatch):
+    import auth_routes
+    auth_routes.jwt_claims_cache.limpiar()
+    llamadas = []
+    original = jwt_cache.jwt.decode
+    monkeypatch.setattr(jwt_cache.jwt, "decode", lambda *a, **k: llamadas.append(1) or original(*a, **k))
+
+    headers = auth_headers("empresa")
+    for _ in range(3):
+        assert client.get(f"/auth/empresa/subcarpetas/{seed['unidad_ids'][0]}/1/files", headers=headers).status_code == 200
+    assert len(llamadas) == 1
+    assert auth_routes.jwt_claims_cache.snapshot()["hits"] >= 2
+
+
+def test_expira_en_exp_y_respeta_el_limite():
+    cache = CacheClaims(max_items=2)
+    tokens = [jwt.encode({"sub": f"u{i}", "exp": int(time.time()) + 60}, "k", algorithm="HS256") for i in range(3)]
+    for t in tokens:
+        assert jwt_cache.decodificar(cache, t, "k", ["HS256"])["sub"]
+    assert cache.snapshot()["items"] == 2
+    assert cache.obtener(tokens[0]) is None  # El menos usado salió primero
+
+    vencido = tokens[2]
+    cache._items[cache._clave(vencido)] = ({"sub": "u2"}, time.time() - 1)
+    with pytest.raises(ExpiredSignatureError):
+        jwt_cache.decodificar(cache, vencido, "k", ["HS256"])
+    # Un token con firma inválida nunca entra en la caché
+    with pytest.raises(JWTError):
+        jwt_cache.decodificar(cache, tokens[1] + "x", "k", ["HS256"])
+
+
+def test_principal_un_decode_y_guardias_compartidas(client, seed, monkeypatch, tmp_path):
+    import auth_routes
+    import crud
+
+    monkeypatch.setattr(auth_routes, "EMPRESA_FILES_DIR", tmp_path)
+    monkeypatch.setattr(crud, "EMPRESA_FILES_BASE_DIR", tmp_path)
+    assert auth_routes.require_roles(["empresa", "profesor"]) is auth_routes.require_roles(["empresa", "profesor"])
+    assert auth_routes.require_usuario_roles(["profesor"]) is auth_routes.require_usuario_roles(["profesor"])
+
+    login = client.post("/auth/login", json={"username": "empresa", "password": seed["password"]})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    auth_routes.jwt_claims_cache.limpiar()
+    llamadas = []
+    original = auth_routes.decodificar_token
+    monkeypatch.setattr(auth_routes, "decodificar_token", lambda t: llamadas.append(1) or original(t))
+
+    url = f"/auth/empresa/subcarpetas/{seed['unidad_ids'][0]}/1"
+    resp = client.post(f"{url}/upload", files={"files": ("guia.pdf", b"%PDF", "application/pdf")}, headers=headers)
+    assert resp.status_code == 200, resp.text
+    assert resp.json()["uploaded_by"] == "empresa"
+    assert len(llamadas) == 1
+
+    login = client.post("/auth/login", json={"username": seed["estudiantes"][0], "password": seed["password"]})
+    resp = client.get(f"{url}/files", headers={"Authorization": f"Bearer {login.json()['access_token']}"})
+    assert resp.status_code == 403
+
+
+def test_endpoints_convertidos_usan_principal(client, seed, auth_headers):
+    profesor, estudiante = auth_headers("profesor"), auth_headers(seed["estudiantes"][0])
+    for url in ("/auth/estudiantes", "/auth/analytics/dashboard/stats", "/auth/analytics/dashboard/unidades",
+                "/auth/analytics/dashboard/activity"):
+        assert client.get(url, headers=profesor).status_code == 200, url
+        assert client.get(url, headers=estudiante).status_code == 403, url
+        assert client.get(url, headers={"Authorization": "Bearer no-es-un-jwt"}).status_code == 401, url
+    assert client.get("/auth/estudiantes/me/unidades-habilitadas", headers=estudiante).status_code == 200
+    assert client.get("/auth/estudiantes/me/unidades-habilitadas", headers=profesor).status_code == 403
@@ -0,0 +1,107 @@
+"""
+Pruebas del runner de migraciones versionadas (SQLite en archivo temporal)
+"""
+
+from sqlalchemy import create_engine, inspect, text
+
+import migrate
+
+
+def _engine(tmp_path):
+    return create_engine(f"sqlite:///{tmp_path / 'migraciones.db'}")
+
+
+def test_base_vacia_queda_con_indices(tmp_path):
+    eng = _engine(tmp_path)
+    versiones = [m.VERSION for m in migrate.cargar_migraciones()]
+    assert versiones[:2] == ["0001", "0002"]
+    assert migrate.aplicar_migraciones(eng) == versiones
+    assert migrate.aplicar_migraciones(eng) == []  # Idempotente
+
+    insp = inspect(eng)
+    indices = {i["name"] for i in insp.get_indexes("actividad_estudiante")}
+    assert "ix_actividad_username_creado" in indices
+    assert migrate.versiones_aplicadas(eng) == set(versiones)
+    eng.dispose()
+
+
+def test_base_existente_elimina_duplicados_antes_del_indice_unico(tmp_path):
+    eng = _engine(tmp_path)
+    # Base "antigua": la tabla existía sin la clave única y con filas repetidas
+    with eng.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE estudiante_progreso_unidad (id INTEGER PRIMARY KEY, username VARCHAR(50) NOT NULL, "
+            "unidad_id INTEGER NOT NULL, porcentaje_completado INTEGER, score INTEGER, "
+            "tiempo_dedicado_min INTEGER, ultima_actividad_at DATETIME)"
+        ))
+        for tiempo, pct, score, ultima in ((10, 80, None, "2024-03-01 10:00:00"), (20, 40, 70, "2024-01-01 10:00:00")):
+            conn.execute(text(
+                "INSERT INTO estudiante_progreso_unidad (username, unidad_id, porcentaje_completado, score, "
+                "tiempo_dedicado_min, ultima_actividad_at) VALUES ('ana', 1, :p, :s, :t, :u)"
+            ), {"t": tiempo, "p": pct, "s": score, "u": ultima})
+
+    migrate.aplicar_migraciones(eng)
+
+    with eng.connect() as conn:
+        filas = conn.execute(text(
+            "SELECT tiempo_dedicado_min, porcentaje_completado, score, ultima_actividad_at FROM estudiante_progreso_unidad"
+        )).all()
+    # Una sola fila con el tiempo sumado, el mayor avance/score y la actividad más reciente
+    assert [tuple(f) for f in filas] == [(30, 80, 70, "2024-03-01 10:00:00")]
+    uniques = {i["name"] for i in inspect(eng).get_indexes("estudiante_progreso_unidad") if i["unique"]}
+    assert "uq_progreso_username_unidad" in uniques
+    eng.dispose()
+
+
+def test_duplicados_de_quiz_conservan_la_nota_manual_o_la_mas_reciente(tmp_path):
+    eng = _engine(tmp_path)
+    with eng.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE estudiante_quiz_calificacion (id INTEGER PRIMARY KEY, estudiante_username VARCHAR(50), "
+            "unidad_id INTEGER, quiz_id INTEGER, score INTEGER, updated_at DATETIME, origen_manual BOOLEAN)"
+        ))
+        filas = [
+            ("ana", 1, 90, "2024-01-01", 1),   # Manual: gana aunque sea más antigua
+            ("ana", 1, 40, "2024-03-01", 0),
+            ("beto", 1, 50, "2024-01-01", 0),
+            ("beto", 1, 70, "2024-02-01", 0),  # La más reciente
+            ("beto", 1, 60, "2023-12-01", 0),
+        ]
+        for username, quiz_id, score, fecha, manual in filas:
+            conn.execute(text(
+                "INSERT INTO estudiante_quiz_calificacion (estudiante_username, unidad_id, quiz_id, score, updated_at, origen_manual) "
+                "VALUES (:u, 1, :q, :s, :f, :m)"
+            ), {"u": username, "q": quiz_id, "s": score, "f": fecha, "m": manual})
+
+    migrate.aplicar_migraciones(eng)
+
+    with eng.connect() as conn:
+        filas = conn.execute(text(
+            "SELECT estudiante_username, score FROM estudiante_quiz_calificacion ORDER BY estudiante_username"
+        )).all()
+    assert filas == [("ana", 90), ("beto", 70)]
+    eng.dispose()
+
+
+def test_tokens_pendientes_se_clasifican_por_vigencia(tmp_path):
+    from datetime import datetime, timedelta
+
+    from migrations import m0007_token_email
+
+    eng = _engine(tmp_path)
+    migrate.aplicar_migraciones(eng)
+    ahora = datetime.utcnow()
+    with eng.begin() as conn:
+        for username, verificado, horas in (("ana", 0, 23), ("beto", 0, 1.5), ("carla", 1, 1.5)):
+            conn.execute(text(
+                "INSERT INTO estudiante (username, hashed_password, nombres, apellidos, tipo_usuario, "
+                "email_verified, verification_token, token_expires_at) "
+                "VALUES (:u, 'x', 'N', 'A', 'estudiante', :v, :t, :e)"
+            ), {"u": username, "v": verificado, "t": f"token-{username}", "e": ahora + timedelta(hours=horas)})
+        m0007_token_email.upgrade(conn)
+
+    with eng.connect() as conn:
+        propositos = dict(conn.execute(text("SELECT username, proposito FROM token_email")).all())
+    # beto no estaba verificado pero su token (2 h) salió de forgot-password
+    assert propositos == {"ana": "verificacion", "beto": "reset", "carla": "reset"}
+    eng.dispose()
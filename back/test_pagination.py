@@ -0,0 +1,118 @@
+"""
+Pruebas de la paginación por cursor
+"""
+
+from datetime import datetime, timedelta
+
+import models
+from pagination import decode_cursor, encode_cursor
+
+
+def _todas_las_paginas(client, url, headers, limit):
+    vistos, cursor = [], None
+    while True:
+        params = {"limit": limit}
+        if cursor:
+            params["cursor"] = cursor
+        resp = client.get(url, params=params, headers=headers)
+        assert resp.status_code == 200, resp.text
+        vistos.append(resp.json())
+        cursor = resp.headers.get("X-Next-Cursor")
+        if not cursor:
+            return vistos
+
+
+def test_cursor_ida_y_vuelta():
+    valores = ["ana", 7, datetime(2024, 5, 1, 10, 30)]
+    assert decode_cursor(encode_cursor(valores), 3) == valores
+
+
+def test_matriculas_por_paginas(client, seed, auth_headers):
+    paginas = _todas_las_paginas(client, "/auth/matriculas/", auth_headers("admin"), limit=2)
+    assert [len(p) for p in paginas] == [2, 1]
+    usernames = [u["username"] for p in paginas for u in p]
+    assert usernames == sorted(seed["estudiantes"])
+
+    # Sin limit se mantiene la respuesta completa (compatibilidad)
+    resp = client.get("/auth/matriculas/", headers=auth_headers("admin"))
+    assert len(resp.json()) == 3 and "X-Next-Cursor" not in resp.headers
+
+
+def test_notificaciones_desc_con_empates(client, seed, auth_headers, db):
+    usuario_id = seed["estudiante_ids"][0]
+    fecha = datetime.utcnow() - timedelta(days=1)
+    for i in range(4):  # Misma fecha: el id desempata
+        db.add(models.Notificacion(usuario_id=usuario_id, tipo="info", mensaje=f"m{i}", fecha_creacion=fecha))
+    db.commit()
+
+    url = f"/auth/notificaciones/usuario/{usuario_id}"
+    headers = auth_headers(seed["estudiantes"][0])
+    paginas = _todas_las_paginas(client, url, headers, limit=2)
+    mensajes = [n["mensaje"] for p in paginas for n in p]
+    assert mensajes == ["Bienvenido estudiante1", "m3", "m2", "m1", "m0"]
+
+
+def test_cursor_invalido(client, seed, auth_headers):
+    resp = client.get("/auth/matriculas/", params={"limit": 2, "cursor": "no-es-un-cursor"}, headers=auth_headers("admin"))
+    assert resp.status_code == 400
+
+
+def test_procesos_masivos_por_bloques(client, seed, auth_headers, db, monkeypatch):
+    from settings import settings
+    import crud
+    monkeypatch.setattr(settings, "BULK_CHUNK_SIZE", 2)
+
+    resp = client.post("/api/v2/grades/admin/sync-all-grades", headers=auth_headers("admin"))
+    resultados = resp.json()["resultados"]
+    assert resultados["estudiantes_procesados"] == 3 and not resultados["errores"]
+    assert resultados["unidades_sincronizadas"] == 3 * len(seed["unidad_ids"])
+
+    limite = datetime.utcnow() - timedelta(days=15)
+    ya_viejas = sum(1 for c in db.query(models.Clase).all() if datetime.strptime(f"{c.dia} {c.hora}", "%Y-%m-%d %H:%M") < limite)
+    viejo = (datetime.utcnow() - timedelta(days=40)).strftime("%Y-%m-%d")
+    for i in range(3):
+        db.add(models.Clase(dia=viejo, hora="08:00", tema=f"vieja{i}", profesor_username="profesor"))
+    db.add(models.Clase(dia="fecha-mala", hora="08:00", tema="sin fecha", profesor_username="profesor"))
+    db.commit()
+    assert crud.eliminar_clases_antiguas(db, dias=15) == 3 + ya_viejas
+    assert db.query(models.Clase).filter(models.Clase.tema == "sin fecha").count() == 1
+
+
+def test_claves_nulas_no_se_pierden_entre_paginas(client, seed, auth_headers, db):
+    usuario_id = seed["estudiante_ids"][0]
+    for i in range(3):
+        db.add(models.Notificacion(usuario_id=usuario_id, tipo="info", mensaje=f"sin fecha {i}"))
+    db.commit()
+    # El default de la columna completa la fecha al insertar; se anula como en filas antiguas
+    db.execute(models.Notificacion.__table__.update().where(
+        models.Notificacion.mensaje.like("sin fecha%")
+    ).values(fecha_creacion=None))
+    db.commit()
+
+    url = f"/auth/notificaciones/usuario/{usuario_id}"
+    paginas = _todas_las_paginas(client, url, auth_headers(seed["estudiantes"][0]), limit=1)
+    mensajes = [n["mensaje"] for p in paginas for n in p]
+    # DESC: las filas con fecha primero y las nulas al final, desempatadas por id
+    assert mensajes == ["Bienvenido estudiante1", "sin fecha 2", "sin fecha 1", "sin fecha 0"]
+
+
+def test_clases_empresa_paginadas_con_totales_del_rango(client, seed, auth_headers, monkeypatch):
+    import auth_routes
+    headers = auth_headers("empresa")
+    completo = client.get("/auth/empresa/clases", params={"incluir_totales": "true"}, headers=headers).json()
+    assert completo["total_clases"] >= 2
+
+    leidas = []
+    original = auth_routes._read_asistencia
+    monkeypatch.setattr(auth_routes, "_read_asistencia", lambda clase_id: leidas.append(clase_id) or original(clase_id))
+    resp = client.get("/auth/empresa/clases", params={"limit": 1}, headers=headers)
+    assert resp.status_code == 200, resp.text
+    assert resp.headers["X-Next-Cursor"] == resp.json()["next_cursor"]
+    assert len(resp.json()["clases"]) == 1
+    # Sin incluir_totales solo se resume la página
+    assert leidas == [resp.json()["clases"][0]["id"]]
+    assert "total_clases" not in resp.json()
+
+    resp = client.get("/auth/empresa/clases", params={"limit": 1, "incluir_totales": "true"}, headers=headers)
+    for clave in ("total_clases", "total_inscritos", "total_presentes", "total_ausentes"):
+        assert resp.json()[clave] == completo[clave]
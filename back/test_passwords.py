@@ -0,0 +1,44 @@
+"""
+Pruebas de hash de contraseñas (pool de procesos y rehash por cambio de costo)
+"""
+
+import asyncio
+
+import models
+import passwords
+from settings import settings
+
+
+def test_login_rehashea_si_cambia_el_costo(client, seed, db, monkeypatch):
+    monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 4)
+    usuario = db.query(models.Registro).filter_by(username="profesor").one()
+    assert passwords.necesita_rehash(usuario.hashed_password)
+
+    resp = client.post("/auth/login", json={"username": "profesor", "password": seed["password"]})
+    assert resp.status_code == 200
+    db.refresh(usuario)
+    assert usuario.hashed_password.startswith("$2b$04$")
+    assert not passwords.necesita_rehash(usuario.hashed_password)
+
+    # La contraseña sigue siendo válida con el hash nuevo; una incorrecta no reescribe nada
+    assert client.post("/auth/login", json={"username": "profesor", "password": seed["password"]}).status_code == 200
+    assert client.post("/auth/login", json={"username": "profesor", "password": "otra"}).status_code == 400
+
+
+def test_pool_de_procesos(monkeypatch):
+    monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 4)
+    monkeypatch.setattr(settings, "PASSWORD_HASH_WORKERS", 1)
+    try:
+        hashed = passwords.hash_password("secreta")
+        assert hashed.startswith("$2b$04$")
+        assert passwords.verify_password("secreta", hashed)
+        assert not passwords.verify_password("otra", hashed)
+
+        async def _async():
+            h = await passwords.hash_password_async("secreta")
+            return await passwords.verify_password_async("secreta", h)
+
+        assert asyncio.run(_async())
+        assert not passwords.verify_password("secreta", "no-es-un-hash")
+    finally:
+        passwords.cerrar_pool()
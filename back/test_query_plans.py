@@ -0,0 +1,94 @@
+"""
+Regresión de planes de ejecución: las consultas críticas no deben volver a
+recorrer tablas completas ni ordenar en tabla temporal sobre tablas grandes
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert
+
+import crud
+import models
+from Clever_MySQL_conn import engine
+from grading_service import GradingService
+from pagination import Pagina
+from query_plans import capturar_selects, problemas_de_capturas, problemas_de_plan
+from seed_data import sembrar_datos
+
+UMBRAL_FILAS = 100
+
+
+@pytest.fixture
+def grande(db):
+    """Datos suficientes para que actividad, progreso y calificaciones superen el umbral"""
+    return sembrar_datos(db, n_estudiantes=40, n_unidades=4, n_quizzes_por_unidad=2, eventos_por_unidad=3)
+
+
+def _sin_problemas(capturadas, permitir=()):
+    assert capturadas, "No se capturó ninguna consulta"
+    problemas = [p for p in problemas_de_capturas(engine, capturadas, UMBRAL_FILAS) if p.tipo not in permitir]
+    assert not problemas, "\n".join(str(p) for p in problemas)
+
+
+def test_detecta_scan_completo(db, grande):
+    with engine.connect() as conn:
+        problemas = problemas_de_plan(conn, "SELECT * FROM actividad_estudiante WHERE duracion_min = ?", (5,), UMBRAL_FILAS)
+    assert [p.tipo for p in problemas] == ["scan"]
+
+
+def test_plan_analytics_resumen(db, grande):
+    with capturar_selects(engine) as capturadas:
+        crud.get_analytics_resumen(db, grande["estudiantes"][0])
+        crud.get_analytics_resumen(db, grande["estudiantes"][0], desde=datetime(2020, 1, 1), hasta=datetime.utcnow())
+    _sin_problemas(capturadas)
+
+
+def test_plan_permiso_quiz(db, grande):
+    with capturar_selects(engine) as capturadas:
+        crud.verificar_permiso_quiz_estudiante(db, grande["estudiantes"][0], grande["quiz_ids"][0])
+    _sin_problemas(capturadas)
+
+
+def test_plan_calculate_unit_grade(db, grande):
+    with capturar_selects(engine) as capturadas:
+        GradingService(db).calculate_unit_grade(grande["estudiantes"][0], grande["unidad_ids"][0])
+    _sin_problemas(capturadas)
+
+
+def test_plan_notificaciones(db, grande):
+    usuario_id = grande["estudiante_ids"][0]
+    db.execute(insert(models.Notificacion), [
+        {"usuario_id": usuario_id, "tipo": "info", "mensaje": f"m{i}", "leida": bool(i % 2),
+         "fecha_creacion": datetime(2024, 1, 1) + timedelta(hours=i)}
+        for i in range(UMBRAL_FILAS * 2)
+    ])
+    db.commit()
+    with capturar_selects(engine) as capturadas:
+        crud.listar_notificaciones_usuario(db, usuario_id)
+        crud.listar_notificaciones_usuario(db, usuario_id, Pagina(limit=20))
+    _sin_problemas(capturadas)
+
+
+def test_plan_quizzes_disponibles(db, grande):
+    with capturar_selects(engine) as capturadas:
+        db.execute(crud.select_quizzes_disponibles(grande["estudiante_ids"][0], datetime.utcnow())).all()
+    # El ORDER BY ordena solo los quizzes del estudiante (acotados por la búsqueda en
+    # estudiante_unidad), no una tabla completa: se admite el ordenamiento temporal
+    _sin_problemas(capturadas, permitir=("filesort",))
+
+
+def test_plan_tokens_email(db, grande):
+    tokens = [crud.crear_token_email(db, username, "verificacion", horas=24) for username in grande["estudiantes"]]
+    tokens += [crud.crear_token_email(db, username, "reset", horas=2) for username in grande["estudiantes"]]
+    # Relleno directo: crear_token_email reemplaza el token anterior del mismo propósito
+    vencido = datetime.utcnow() - timedelta(hours=1)
+    db.execute(insert(models.TokenEmail), [
+        {"token_hash": f"{i:064x}", "proposito": "reset", "username": "admin", "expires_at": vencido}
+        for i in range(UMBRAL_FILAS)
+    ])
+    db.commit()
+    assert db.query(models.TokenEmail).count() > UMBRAL_FILAS
+    with capturar_selects(engine) as capturadas:
+        assert crud.obtener_token_email(db, tokens[0], "verificacion")
+    _sin_problemas(capturadas)
@@ -0,0 +1,81 @@
+"""
+Pruebas del límite de peticiones (token bucket)
+"""
+
+import fakeredis
+import pytest
+
+import rate_limit
+import redis_conn
+from settings import settings
+
+
+@pytest.fixture(params=["memoria", "redis"])
+def backend(request, monkeypatch):
+    if request.param == "redis":
+        monkeypatch.setattr(settings, "REDIS_URL", "redis://fake")
+        redis_conn.set_redis(fakeredis.FakeRedis(decode_responses=True))
+        yield request.param
+        redis_conn.set_redis(None)
+    else:
+        yield request.param
+
+
+def test_login_responde_429_sin_tocar_la_bd(backend, client, seed, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_LOGIN", "3/60")
+    rate_limit.reiniciar()
+    body = {"username": "estudiante1", "password": "incorrecta"}
+    for _ in range(3):
+        assert client.post("/auth/login", json=body).status_code == 400
+
+    resp = client.post("/auth/login", json=body)
+    assert resp.status_code == 429
+    assert 1 <= int(resp.headers["Retry-After"]) <= 20
+    assert resp.headers["X-DB-Queries"] == "0"
+
+    # Otra identidad no comparte la cubeta
+    resp = client.post("/auth/login", json={"username": "profesor", "password": seed["password"]})
+    assert resp.status_code == 200, resp.text
+
+
+def test_limite_por_ip(client, seed, auth_headers, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_IP", "2/60")
+    headers = auth_headers(seed["estudiantes"][0])
+    body = {"unidad_id": seed["unidad_ids"][0], "duracion_min": 1}
+    assert client.post("/auth/tracking/heartbeat", json=body, headers=headers).status_code == 200
+    assert client.post("/auth/tracking/heartbeat", json=body, headers=headers).status_code == 200
+    assert client.post("/auth/tracking/heartbeat", json=body, headers=headers).status_code == 429
+
+
+def test_cubeta_se_rellena_con_el_tiempo():
+    limite = rate_limit.Limite.desde_texto("2/10")
+    fichas, espera = rate_limit._cubeta(0.0, 0.0, limite, 0.0)
+    assert espera == pytest.approx(5.0)
+    fichas, espera = rate_limit._cubeta(0.0, 0.0, limite, 5.0)
+    assert espera == 0 and fichas == pytest.approx(0.0)
+    fichas, _ = rate_limit._cubeta(0.0, 0.0, limite, 100.0)
+    assert fichas == pytest.approx(1.0)  # Nunca supera la capacidad
+
+
+def test_rotar_identidades_no_reinicia_cubetas_vacias(monkeypatch):
+    monkeypatch.setattr(rate_limit, "_MAX_CUBETAS_MEMORIA", 3)
+    monkeypatch.setattr(rate_limit, "_MAX_CUBETAS_MEMORIA_DURO", 50)
+    memoria = rate_limit._Memoria()
+    limite = rate_limit.Limite.desde_texto("2/60")
+    for _ in range(2):
+        assert memoria.consumir("login:id:victima", limite) == 0
+    # Un cliente rota usernames para intentar expulsar la cubeta de la víctima
+    for i in range(20):
+        memoria.consumir(f"login:id:otro{i}", limite)
+    assert memoria.consumir("login:id:victima", limite) > 0
+
+    # Pasado el tope duro sí se descarta (limitación documentada)
+    for i in range(60):
+        memoria.consumir(f"login:id:masivo{i}", limite)
+    assert len(memoria._cubetas) == 50
+
+
+def test_reglas_se_construyen_una_vez(monkeypatch):
+    assert rate_limit.reglas() is rate_limit.reglas()
+    monkeypatch.setattr(settings, "RATE_LIMIT_LOGIN", "1/60")
+    assert rate_limit.reglas()[("POST", "/auth/login")].limite.capacidad == 1
@@ -0,0 +1,92 @@
+"""
+Pruebas de access tokens con claims y refresh tokens rotativos
+"""
+
+from jose import jwt
+
+import models
+from settings import settings
+
+
+def _login(client, seed, username):
+    resp = client.post("/auth/login", json={"username": username, "password": seed["password"]})
+    assert resp.status_code == 200, resp.text
+    return resp.json()
+
+
+def test_access_token_incluye_id_y_matricula(client, seed):
+    datos = _login(client, seed, "estudiante1")
+    claims = jwt.decode(datos["access_token"], settings.SECRET_KEY, algorithms=["HS256"])
+    assert claims["uid"] == 100
+    assert claims["matricula_activa"] is True
+    assert datos["refresh_token"] and datos["expires_in"] == settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+
+    # Las evaluaciones disponibles salen del claim, sin buscar el id en la BD
+    headers = {"Authorization": f"Bearer {datos['access_token']}"}
+    assert client.get("/auth/estudiante/quizzes-disponibles", headers=headers).status_code == 200
+
+
+def test_refresh_rota_y_el_reuso_revoca_todo(client, seed, db):
+    datos = _login(client, seed, "estudiante1")
+    resp = client.post("/auth/refresh", json={"refresh_token": datos["refresh_token"]})
+    assert resp.status_code == 200, resp.text
+    nuevo = resp.json()["refresh_token"]
+    assert nuevo != datos["refresh_token"]
+
+    # Reusar el token ya rotado invalida también el nuevo
+    assert client.post("/auth/refresh", json={"refresh_token": datos["refresh_token"]}).status_code == 401
+    assert client.post("/auth/refresh", json={"refresh_token": nuevo}).status_code == 401
+    vigentes = db.query(models.RefreshToken).filter(
+        models.RefreshToken.username == "estudiante1", models.RefreshToken.revoked_at.is_(None)
+    ).count()
+    assert vigentes == 0
+
+
+def test_estudiante_desactivado_no_renueva(client, seed, auth_headers):
+    datos = _login(client, seed, "estudiante2")
+    resp = client.put("/auth/matriculas/estudiante2/toggle", headers=auth_headers("admin"))
+    assert resp.status_code == 200, resp.text
+    assert client.post("/auth/refresh", json={"refresh_token": datos["refresh_token"]}).status_code == 401
+
+
+def test_logout_revoca_el_refresh_token(client, seed):
+    datos = _login(client, seed, "profesor")
+    assert client.post("/auth/logout", json={"refresh_token": datos["refresh_token"]}).status_code == 200
+    assert client.post("/auth/refresh", json={"refresh_token": datos["refresh_token"]}).status_code == 401
+
+
+def test_refresh_concurrente_solo_uno_gana(tmp_path):
+    import threading
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    import crud
+
+    # Archivo SQLite propio: cada hilo usa su conexión, como workers distintos
+    eng = create_engine(f"sqlite:///{tmp_path / 'refresh.db'}", connect_args={"timeout": 30})
+    models.Base.metadata.create_all(eng, tables=[models.Registro.__table__, models.RefreshToken.__table__])
+    Sesion = sessionmaker(bind=eng)
+    with Sesion() as db:
+        db.add(models.Registro(username="ana", hashed_password="x", nombres="Ana", apellidos="P", tipo_usuario="estudiante"))
+        token = crud.crear_refresh_token(db, "ana")
+        db.commit()
+
+    n = 8
+    barrera = threading.Barrier(n)
+    ganadores = []
+
+    def _usar():
+        with Sesion() as db:
+            barrera.wait()
+            if crud.usar_refresh_token(db, token) is not None:
+                ganadores.append(1)
+            db.commit()
+
+    hilos = [threading.Thread(target=_usar) for _ in range(n)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    assert len(ganadores) == 1
+    eng.dispose()
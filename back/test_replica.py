@@ -0,0 +1,55 @@
+"""
+Pruebas del ruteo de lecturas a la réplica (primario y réplica en dos archivos SQLite)
+"""
+
+import pytest
+from sqlalchemy import create_engine, event
+
+import Clever_MySQL_conn as conn
+import models
+from Clever_MySQL_conn import Base
+
+
+@pytest.fixture
+def motores(tmp_path, monkeypatch):
+    primario = create_engine(f"sqlite:///{tmp_path / 'primario.db'}")
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    for motor, nombre in ((primario, "en_primario"), (replica, "en_replica")):
+        Base.metadata.create_all(bind=motor)
+        with motor.begin() as c:
+            c.execute(models.Unidad.__table__.insert().values(nombre=nombre, descripcion="", orden=1))
+    monkeypatch.setattr(conn, "engine", primario)
+    monkeypatch.setattr(conn, "replica_engine", replica)
+    monkeypatch.setattr(conn, "_replica_caida_hasta", 0.0)
+    monkeypatch.setattr(conn, "_replica_sana_hasta", 0.0)
+    yield primario, replica
+    primario.dispose()
+    replica.dispose()
+
+
+def _leer(use_replica: bool):
+    db = conn.ReadSessionLocal(use_replica=use_replica)
+    try:
+        return [u.nombre for u in db.query(models.Unidad).all()]
+    finally:
+        db.close()
+
+
+def test_lecturas_van_a_la_replica_y_el_chequeo_se_cachea(motores):
+    _, replica = motores
+    chequeos = []
+    event.listen(replica, "engine_connect", lambda *a: chequeos.append(1))
+
+    assert all(conn.replica_disponible() for _ in range(5))
+    assert len(chequeos) == 1  # Réplica sana: un solo chequeo en la ventana DB_REPLICA_HEALTH_SECONDS
+
+    assert _leer(use_replica=True) == ["en_replica"]
+    assert _leer(use_replica=False) == ["en_primario"]
+
+
+def test_replica_caida_usa_el_primario(motores, monkeypatch):
+    monkeypatch.setattr(conn, "replica_engine", create_engine("sqlite:////ruta/inexistente/replica.db"))
+    assert conn.replica_disponible() is False
+    db = next(conn.get_read_db())
+    assert [u.nombre for u in db.query(models.Unidad).all()] == ["en_primario"]
+    db.close()
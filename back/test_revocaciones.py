@@ -0,0 +1,48 @@
+"""
+Pruebas de la revocación de tokens de estudiantes desactivados
+"""
+
+import revocaciones
+from Clever_MySQL_conn import engine
+from query_plans import capturar_selects
+
+
+def test_desactivar_revoca_el_token_al_instante(client, seed, auth_headers):
+    estudiante = seed["estudiantes"][0]
+    headers = auth_headers(estudiante)
+    url = "/auth/estudiante/quizzes-disponibles"
+    assert client.get(url, headers=headers).status_code == 200
+
+    assert client.put(f"/auth/matriculas/{estudiante}/toggle", headers=auth_headers("admin")).status_code == 200
+    resp = client.get(url, headers=headers)
+    assert resp.status_code == 403
+    assert resp.headers["X-DB-Queries"] == "0"  # Se rechaza sin consultar la BD
+
+    assert client.put(f"/auth/matriculas/{estudiante}/toggle", headers=auth_headers("admin")).status_code == 200
+    assert client.get(url, headers=headers).status_code == 200
+
+
+def test_revocacion_en_endpoints_sin_guardia_de_roles(client, seed, auth_headers):
+    estudiante, unidad_id = seed["estudiantes"][1], seed["unidad_ids"][0]
+    headers = auth_headers(estudiante)
+    latido = {"unidad_id": unidad_id, "duracion_min": 1}
+    # Solo get_principal (tracking) y la vista de unidades del estudiante
+    assert client.post("/auth/tracking/heartbeat", json=latido, headers=headers).status_code == 200
+    assert client.get("/auth/estudiantes/me/unidades-habilitadas", headers=headers).status_code == 200
+
+    assert client.put(f"/auth/matriculas/{estudiante}/toggle", headers=auth_headers("admin")).status_code == 200
+    assert client.post("/auth/tracking/heartbeat", json=latido, headers=headers).status_code == 403
+    assert client.get("/auth/estudiantes/me/unidades-habilitadas", headers=headers).status_code == 403
+
+
+def test_recarga_desde_bd_una_vez_por_periodo(db, seed):
+    from models import Registro
+    db.query(Registro).filter_by(username=seed["estudiantes"][1]).update({"matricula_activa": False})
+    db.commit()
+
+    revocaciones.invalidar()
+    with capturar_selects(engine) as capturadas:
+        for _ in range(20):
+            assert revocaciones.revocado(seed["estudiantes"][1])
+            assert not revocaciones.revocado(seed["estudiantes"][0])
+    assert len(capturadas) == 1
@@ -0,0 +1,161 @@
+"""
+Pruebas del modo local SQLite (sin MySQL)
+"""
+
+import re
+
+import crud
+from Clever_MySQL_conn import engine
+from grading_service import GradingService
+from query_plans import capturar_selects
+
+
+def _cargas_de_usuario(capturadas):
+    """SELECT del Registro del usuario autenticado (filtrado por username)"""
+    return sum(1 for sentencia, _ in capturadas if "FROM estudiante" in sentencia and "WHERE estudiante.username =" in sentencia)
+
+
+def test_seed_crea_datos(db, seed):
+    assert len(crud.listar_notificaciones_usuario(db, seed["estudiante_ids"][0])) == 1
+    resumen = GradingService(db).get_student_grades_summary(seed["estudiantes"][0])
+    assert resumen
+
+
+def test_tracking_async_acumula_tiempo(client, seed, auth_headers, db):
+    headers = auth_headers(seed["estudiantes"][0])
+    unidad_id = seed["unidad_ids"][0]
+
+    resp = client.post("/auth/tracking/heartbeat", json={"unidad_id": unidad_id, "duracion_min": 4}, headers=headers)
+    assert resp.status_code == 200, resp.text
+    assert int(resp.headers["X-DB-Queries"]) > 0
+
+    row = db.query(crud.models.EstudianteProgresoUnidad).filter_by(
+        username=seed["estudiantes"][0], unidad_id=unidad_id
+    ).one()
+    assert row.tiempo_dedicado_min == 15 + 4
+
+
+def test_quiz_disponible_y_responder(client, seed, auth_headers):
+    headers = auth_headers(seed["estudiantes"][0])
+
+    resp = client.get("/auth/estudiante/quizzes-disponibles", headers=headers)
+    assert resp.status_code == 200, resp.text
+    assert {q["id"] for q in resp.json()} == set(seed["quiz_ids"])
+
+    quiz_id = seed["quiz_ids"][0]
+    resp = client.post(
+        f"/auth/estudiante/quizzes/{quiz_id}/responder",
+        json={"quiz_id": quiz_id, "respuestas": {"pregunta_0": 1}},
+        headers=headers,
+    )
+    assert resp.status_code == 200, resp.text
+    assert resp.json()["score"] == 100
+
+
+def test_notificaciones_usuario(client, seed, auth_headers):
+    headers = auth_headers(seed["estudiantes"][0])
+    resp = client.get(f"/auth/notificaciones/usuario/{seed['estudiante_ids'][0]}", headers=headers)
+    assert resp.status_code == 200, resp.text
+    assert [n["mensaje"] for n in resp.json()] == ["Bienvenido estudiante1"]
+
+
+def test_profesor_carga_usuario_una_vez(client, seed, auth_headers):
+    headers = auth_headers("profesor")
+    estudiante, unidad_id = seed["estudiantes"][0], seed["unidad_ids"][0]
+    url = f"/auth/profesores/profesor/estudiantes/{estudiante}/unidades/{unidad_id}/grade"
+
+    with capturar_selects(engine) as capturadas:
+        resp = client.get(url, params={"filename": "tarea_1_0.pdf"}, headers=headers)
+    assert resp.status_code == 200, resp.text
+    assert _cargas_de_usuario(capturadas) == 1
+
+    resp = client.get(url.replace("profesores/profesor", "profesores/otro"), params={"filename": "x"}, headers=headers)
+    assert resp.status_code == 403
+    resp = client.get(url.replace(estudiante, "admin"), params={"filename": "x"}, headers=headers)
+    assert resp.status_code == 403
+
+
+def test_endpoints_de_quiz_cargan_usuario_una_vez(client, seed, auth_headers):
+    headers = auth_headers("profesor")
+    estudiante, quiz_id = seed["estudiantes"][0], seed["quiz_ids"][0]
+
+    for url in (f"/auth/quizzes/{quiz_id}/respuestas", f"/auth/quizzes/{quiz_id}/respuestas/{estudiante}"):
+        with capturar_selects(engine) as capturadas:
+            resp = client.get(url, headers=headers)
+        assert resp.status_code in (200, 404), resp.text
+        assert _cargas_de_usuario(capturadas) == 1
+
+
+TABLAS_DE_NOTAS = ("tarea_calificacion", "estudiante_quiz_calificacion", "estudiante_progreso_unidad", "unidad_calificacion_final")
+
+
+def _nota_por_unidad(db, username, unidad_id):
+    """Cálculo previo al lote: consultas por unidad, como hacía calculate_unit_grade"""
+    from sqlalchemy import func
+    from settings import settings
+    m = crud.models
+    tareas_avg, tareas_count = db.query(func.avg(m.TareaCalificacion.score), func.count(m.TareaCalificacion.id)).filter(
+        m.TareaCalificacion.estudiante_username == username, m.TareaCalificacion.unidad_id == unidad_id
+    ).one()
+    quiz_avg, quiz_count = db.query(func.avg(m.EstudianteQuizCalificacion.score), func.count(m.EstudianteQuizCalificacion.id)).filter(
+        m.EstudianteQuizCalificacion.estudiante_username == username, m.EstudianteQuizCalificacion.unidad_id == unidad_id
+    ).one()
+    progreso = db.query(m.EstudianteProgresoUnidad).filter_by(username=username, unidad_id=unidad_id).first()
+    override = db.query(m.UnidadCalificacionFinal).filter_by(estudiante_username=username, unidad_id=unidad_id).first()
+
+    minutos = int(progreso.tiempo_dedicado_min or 0) if progreso else 0
+    objetivo = max(1, int(settings.GRADES_OBJETIVO_MIN))
+    tiempo_score = min(100, int(minutos * 100 / objetivo))
+    pesos = (float(settings.GRADES_WT_TAREAS), float(settings.GRADES_WT_QUIZ), float(settings.GRADES_WT_TIEMPO))
+    total = max(0.0001, sum(pesos))
+    nota = int(round(
+        (float(tareas_avg or 0) * pesos[0] + float(quiz_avg or 0) * pesos[1] + tiempo_score * pesos[2]) / total
+    ))
+    nota = max(0, min(100, nota))
+    if override and override.aprobado is not None:
+        aprobado = override.aprobado
+    else:
+        aprobado = nota >= int(settings.GRADES_UMBRAL_APROBACION)
+    return {
+        "tareas": (float(tareas_avg) if tareas_avg is not None else None, tareas_count),
+        "quizzes": (float(quiz_avg) if quiz_avg is not None else None, quiz_count),
+        "minutos": minutos,
+        "nota": nota,
+        "aprobado": aprobado,
+        "override_manual": override is not None,
+    }
+
+
+def test_resumen_en_lote_igual_por_unidad(db):
+    from seed_data import sembrar_datos
+
+    info = sembrar_datos(db, n_estudiantes=2, n_unidades=6, n_quizzes_por_unidad=2, eventos_por_unidad=2)
+    estudiante = info["estudiantes"][0]
+    db.add(crud.models.UnidadCalificacionFinal(estudiante_username=estudiante, unidad_id=info["unidad_ids"][1], score=90, aprobado=False))
+    db.commit()
+
+    service = GradingService(db)
+    for unidades in (info["unidad_ids"][:2], info["unidad_ids"]):
+        with capturar_selects(engine) as capturadas:
+            service.calculate_units_grades(estudiante, unidades)
+        # Cada tabla de notas se consulta a lo sumo una vez, sin importar cuántas unidades haya
+        for tabla in TABLAS_DE_NOTAS:
+            assert sum(1 for sql, _ in capturadas if re.search(rf"\b{tabla}\b", sql)) <= 1, tabla
+
+    resumen = service.get_student_grades_summary(estudiante)
+    assert len(resumen["unidades"]) == len(info["unidad_ids"])
+    # La semilla deja tareas, quizzes y tiempo en cada unidad: la comparación no es entre vacíos
+    assert all(u["grade_data"]["componentes"]["tareas"]["count"] and u["grade_data"]["componentes"]["quizzes"]["count"]
+               and u["grade_data"]["componentes"]["tiempo"]["minutos"] for u in resumen["unidades"])
+    for unidad in resumen["unidades"]:
+        datos = unidad["grade_data"]
+        obtenido = {
+            "tareas": (datos["componentes"]["tareas"]["promedio"], datos["componentes"]["tareas"]["count"]),
+            "quizzes": (datos["componentes"]["quizzes"]["promedio"], datos["componentes"]["quizzes"]["count"]),
+            "minutos": datos["componentes"]["tiempo"]["minutos"],
+            "nota": datos["calificacion_final"]["nota"],
+            "aprobado": datos["calificacion_final"]["aprobado"],
+            "override_manual": datos["calificacion_final"]["override_manual"],
+        }
+        assert obtenido == _nota_por_unidad(db, estudiante, unidad["unidad_id"])
+    assert resumen["unidades"][1]["grade_data"]["calificacion_final"]["aprobado"] is False
@@ -0,0 +1,79 @@
+"""
+Pruebas de la tabla token_email (verificación de correo y reset de contraseña)
+"""
+
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs, urlparse
+
+import crud
+import models
+
+
+def test_reset_de_contrasena_un_solo_uso(client, seed, db, monkeypatch):
+    enviados = []
+
+    async def _capturar(**kwargs):
+        enviados.append(kwargs["reset_url"])
+
+    monkeypatch.setattr(crud, "send_reset_password_email", _capturar)
+    resp = client.post("/auth/forgot-password", json={"username": "profesor"})
+    assert resp.status_code == 200, resp.text
+    token = parse_qs(urlparse(enviados[0]).query)["token"][0]
+    assert db.query(models.Registro).filter_by(username="profesor").one().verification_token is None
+
+    body = {"token": token, "new_password": "nueva-clave"}
+    assert client.post("/auth/reset-password", json=body).status_code == 200
+    assert client.post("/auth/reset-password", json=body).status_code == 404
+    resp = client.post("/auth/login", json={"username": "profesor", "password": "nueva-clave"})
+    assert resp.status_code == 200, resp.text
+
+
+def test_verificacion_de_correo(client, seed, db):
+    usuario = db.query(models.Registro).filter_by(username="profesor").one()
+    usuario.email_verified = False
+    vencido = crud.crear_token_email(db, "profesor", "verificacion", horas=-1)
+    db.commit()
+    assert client.get("/auth/verify-email", params={"token": vencido}, follow_redirects=False).status_code == 400
+    # El reset no sirve como token de verificación
+    reset = crud.crear_token_email(db, "profesor", "reset", horas=2)
+    token = crud.crear_token_email(db, "profesor", "verificacion", horas=24)
+    db.commit()
+    assert client.get("/auth/verify-email", params={"token": reset}, follow_redirects=False).status_code == 404
+
+    assert client.get("/auth/verify-email", params={"token": token}, follow_redirects=False).status_code == 302
+    db.expire_all()
+    assert db.query(models.Registro).filter_by(username="profesor").one().email_verified
+    assert crud.obtener_token_email(db, token, "verificacion") is None
+
+
+def test_purgar_tokens_vencidos_por_bloques(db, seed):
+    for username in seed["estudiantes"]:
+        crud.crear_token_email(db, username, "reset", horas=-1)
+    vigente = crud.crear_token_email(db, "profesor", "verificacion", horas=24)
+    crud.crear_refresh_token(db, "profesor")
+    db.add(models.RefreshToken(token_hash="x" * 64, username="admin", expires_at=datetime.utcnow() - timedelta(days=1)))
+    db.commit()
+
+    borradas = crud.purgar_tokens_vencidos(db, lote=1)
+    assert borradas == {"token_email": len(seed["estudiantes"]), "refresh_token": 1}
+    assert crud.obtener_token_email(db, vigente, "verificacion")
+    assert db.query(models.RefreshToken).count() == 1
+
+
+def test_registro_con_sesion_async_crea_token_de_verificacion(client, seed, db, monkeypatch):
+    enviados = []
+
+    async def _capturar(**kwargs):
+        enviados.append(kwargs["verification_url"])
+
+    monkeypatch.setattr(crud, "send_verification_email", _capturar)
+    datos = {"username": "nuevo", "password": "Clave-123", "nombres": "N", "apellidos": "A",
+             "email": "nuevo@example.com", "tipo_usuario": "estudiante"}
+    resp = client.post("/auth/register", json=datos)
+    assert resp.status_code == 200, resp.text
+    assert resp.json()["username"] == "nuevo"
+    token = parse_qs(urlparse(enviados[0]).query)["token"][0]
+    assert client.get("/auth/verify-email", params={"token": token}, follow_redirects=False).status_code == 302
+
+    # Email repetido: la validación corre dentro de la sesión async
+    assert client.post("/auth/register", json={**datos, "username": "otro"}).status_code == 400
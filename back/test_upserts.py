@@ -0,0 +1,74 @@
+"""
+Pruebas de los upserts de calificaciones y progreso
+"""
+
+from sqlalchemy.dialects import mysql
+
+import crud
+import models
+from grading_service import GradingService
+from upserts import construir_upsert
+
+
+def _quiz_cal(db, username, unidad_id, quiz_id):
+    return db.query(models.EstudianteQuizCalificacion).filter_by(
+        estudiante_username=username, unidad_id=unidad_id, quiz_id=quiz_id
+    ).all()
+
+
+def test_upsert_quiz_respeta_nota_manual_y_reinicia_aprobacion(db, seed):
+    username, unidad_id, quiz_id = seed["estudiantes"][1], seed["unidad_ids"][0], seed["quiz_ids"][0]
+    fila = _quiz_cal(db, username, unidad_id, quiz_id)[0]
+    assert fila.aprobada  # El seed aprueba a los estudiantes impares
+
+    row = crud.upsert_quiz_calificacion(db, estudiante_username=username, unidad_id=unidad_id, quiz_id=quiz_id, score=fila.score)
+    assert row.aprobada  # Misma nota: no se toca
+
+    row = crud.upsert_quiz_calificacion(db, estudiante_username=username, unidad_id=unidad_id, quiz_id=quiz_id, score=99)
+    assert (row.score, row.aprobada) == (99, False)
+
+    row.origen_manual = True
+    db.commit()
+    row = crud.upsert_quiz_calificacion(db, estudiante_username=username, unidad_id=unidad_id, quiz_id=quiz_id, score=10)
+    assert row.score == 99
+    assert len(_quiz_cal(db, username, unidad_id, quiz_id)) == 1
+
+
+def test_upsert_tarea_y_progreso_sin_duplicados(db, seed):
+    username, unidad_id = seed["estudiantes"][0], seed["unidad_ids"][0]
+    servicio = GradingService(db)
+    primera = servicio._upsert_task_grade(username, unidad_id, "nueva.pdf", 40)
+    segunda = crud.upsert_tarea_calificacion(db, estudiante_username=username, unidad_id=unidad_id, filename="nueva.pdf", score=75)
+    assert primera.id == segunda.id and segunda.score == 75
+
+    progreso = crud._ensure_progreso_row(db, username, unidad_id)
+    assert progreso.tiempo_dedicado_min == 15  # La fila existente no se modifica
+
+
+def test_upsert_quiz_mysql_asigna_score_al_final():
+    stmt = construir_upsert(
+        "mysql",
+        models.EstudianteQuizCalificacion,
+        {"estudiante_username": "a", "unidad_id": 1, "quiz_id": 1, "score": 50},
+        claves=["estudiante_username", "unidad_id", "quiz_id"],
+        actualizar=crud._actualizar_quiz_calificacion,
+    )
+    sql = str(stmt.compile(dialect=mysql.dialect()))
+    assert "ON DUPLICATE KEY UPDATE id = last_insert_id(" in sql
+    # MySQL evalúa las asignaciones en orden: score debe cambiar después de las que lo comparan
+    assert sql.rindex("score = CASE") > sql.index("aprobada = CASE")
+
+
+def test_bonus_asistencia_incrementa_en_la_base(client, seed, auth_headers, db):
+    username, unidad_id = seed["estudiantes"][0], seed["unidad_ids"][0]
+    url = f"/auth/profesores/profesor/estudiantes/{username}/unidades/{unidad_id}/attendance-bonus"
+    headers = auth_headers("profesor")
+
+    resp = client.post(url, json={"add_min": 5, "add_score": 150}, headers=headers)
+    assert resp.status_code == 200, resp.text
+    assert resp.json()["tiempo_dedicado_min"] == 15 + 5
+    assert resp.json()["score"] == 100  # LEAST(100, score + n)
+
+    crud.track_activity(db, username, unidad_id, "heartbeat", duracion_min=3)
+    row = db.query(models.EstudianteProgresoUnidad).filter_by(username=username, unidad_id=unidad_id).one()
+    assert (row.tiempo_dedicado_min, row.score) == (23, 100)
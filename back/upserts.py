@@ -0,0 +1,84 @@
+"""
+Upserts nativos por dialecto
+============================
+
+Inserta o actualiza una fila en una sola sentencia, apoyándose en las claves
+únicas declaradas en models.py (ver migrations/m0002_indices_hot_paths.py):
+
+- MySQL: INSERT ... ON DUPLICATE KEY UPDATE
+- SQLite: INSERT ... ON CONFLICT (...) DO UPDATE ... RETURNING id
+
+Evita el patrón SELECT → INSERT/UPDATE, que cuesta varias idas a la base y
+puede duplicar filas cuando dos requests llegan a la vez.
+"""
+
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.orm import Session
+
+# (tabla.c, valores propuestos) -> [(columna, expresión), ...]
+Asignaciones = Callable[[object, object], Iterable[Tuple[str, object]]]
+
+
+def construir_upsert(
+    dialecto: str,
+    model,
+    valores: Dict,
+    claves: Sequence[str],
+    actualizar: Optional[Asignaciones] = None,
+):
+    """Arma la sentencia de upsert para el dialecto dado (ver `upsert`)"""
+    table = model.__table__
+    asignaciones: List[Tuple[str, object]] = []
+
+    if dialecto in ("mysql", "mariadb"):
+        stmt = mysql.insert(table).values(**valores)
+        # LAST_INSERT_ID(id) hace que lastrowid devuelva también el id de la fila existente
+        asignaciones.append(("id", func.last_insert_id(table.c.id)))
+        if actualizar:
+            asignaciones.extend(actualizar(table.c, stmt.inserted))
+        return stmt.on_duplicate_key_update(asignaciones)
+
+    if dialecto == "sqlite":
+        stmt = sqlite.insert(table).values(**valores)
+        if actualizar:
+            asignaciones.extend(actualizar(table.c, stmt.excluded))
+        else:
+            asignaciones.append(("id", table.c.id))  # No-op: DO NOTHING no devolvería la fila en RETURNING
+        stmt = stmt.on_conflict_do_update(index_elements=list(claves), set_=dict(asignaciones))
+        return stmt.returning(table.c.id)
+
+    raise ValueError(f"Upsert no soportado para el dialecto {dialecto}")
+
+
+def upsert(
+    db: Session,
+    model,
+    valores: Dict,
+    claves: Sequence[str],
+    actualizar: Optional[Asignaciones] = None,
+) -> int:
+    """
+    Ejecuta el upsert sin hacer commit (lo decide el llamador)
+
+    Args:
+        db: Sesión de base de datos
+        model: Modelo ORM destino
+        valores: Columnas de la fila a insertar
+        claves: Columnas de la clave única que detecta el conflicto
+        actualizar: Función que recibe (columnas actuales, valores propuestos) y
+            devuelve las asignaciones a aplicar si la fila ya existe. Se aplican en
+            orden (MySQL evalúa cada asignación con las anteriores ya hechas), así
+            que las columnas usadas en condiciones deben ir al final.
+            None = dejar la fila existente como está.
+
+    Returns:
+        id de la fila insertada o de la existente
+    """
+    dialecto = db.get_bind().dialect.name
+    result = db.execute(construir_upsert(dialecto, model, valores, claves, actualizar))
+    if dialecto == "sqlite":
+        return result.scalar_one()
+    return result.lastrowid